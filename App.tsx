@@ -6,12 +6,15 @@ import { BiopacChart } from './components/BiopacChart';
 import { RightDataPanel } from './components/RightDataPanel';
 import { 
   CameraMode, Keypoint, GazeData, PostureStatus, 
-  BiopacDataPoint, AppMode, Session, RecordedFrameData, ModelData 
+  BiopacDataPoint, AppMode, Session, RecordedFrameData, ModelData, OverlayFrame
 } from './types';
 import { Settings, Link } from 'lucide-react';
 
 // Constants
 const MAX_DATA_POINTS = 100;
+// Server stream frame gốc (?overlay=0), trình duyệt tự vẽ keypoint/bbox/mắt từ telemetry cùng seq
+const CLIENT_OVERLAY = true;
+const OVERLAY_HISTORY = 90;
 // Khôi phục tên Label chuẩn
 const KEYPOINT_LABELS = ['Nose', 'L.Eye', 'R.Eye', 'L.Ear', 'R.Ear', 'L.Sho', 'R.Sho'];
 
@@ -44,6 +47,9 @@ const App: React.FC = () => {
 
   // --- STATE FOR DATA ---
   const [biopacData, setBiopacData] = useState<BiopacDataPoint[]>([]);
+  const [biopacInfo, setBiopacInfo] = useState<string | undefined>(undefined);
+  const biopacWindowRef = useRef(false);
+  const overlayHistoryRef = useRef<OverlayFrame[]>([]);
 
   const [tiltData, setTiltData] = useState<ModelData & { keypoints: Keypoint[] }>({
     label: '',
@@ -113,13 +119,35 @@ const App: React.FC = () => {
         // Handle Realtime Data
         const now = Date.now();
 
-        // 1. Biopac (Simulate if missing, or use data.biopac)
-        const bpVal = (typeof data.biopac === 'number') ? data.biopac : 0;
-
-        setBiopacData(prev => {
-            const newData = [...prev, { timestamp: now, value: bpVal }];
-            return newData.length > MAX_DATA_POINTS ? newData.slice(newData.length - MAX_DATA_POINTS) : newData;
+        // 0. Lịch sử kết quả cho overlay phía client (telemetry chỉ gửi phần thay đổi -> gộp với bản trước)
+        const hist = overlayHistoryRef.current;
+        const prev = hist[hist.length - 1] || { seq: {} };
+        hist.push({
+            seq: { ...prev.seq, ...(data.seq || {}) },
+            tilt: data.tilt ?? prev.tilt,
+            gaze: data.gaze ?? prev.gaze,
+            posture: data.posture ?? prev.posture,
         });
+        if (hist.length > OVERLAY_HISTORY) hist.splice(0, hist.length - OVERLAY_HISTORY);
+
+        // 1. Biopac: server gửi cửa sổ đã rút gọn {t0, rate, channels: {name: {t, v}}} -> thay cả chuỗi;
+        //    số đơn lẻ (không có nguồn BIOPAC) -> nối thêm như cũ
+        const bp = data.biopac;
+        if (bp && bp.channels) {
+            const names = Object.keys(bp.channels);
+            const ch = bp.channels[names[0]];
+            if (ch) {
+                biopacWindowRef.current = true;
+                setBiopacInfo(`${names[0]} · ${bp.rate}Hz`);
+                setBiopacData(ch.t.map((t: number, i: number) => ({ timestamp: bp.t0 + t, value: ch.v[i] })));
+            }
+        } else if (!biopacWindowRef.current) {
+            const bpVal = (typeof bp === 'number') ? bp : 0;
+            setBiopacData(prev => {
+                const newData = [...prev, { timestamp: now, value: bpVal }];
+                return newData.length > MAX_DATA_POINTS ? newData.slice(newData.length - MAX_DATA_POINTS) : newData;
+            });
+        }
 
         // 2. Tilt & Keypoints
         if (data.tilt) {
@@ -340,11 +368,13 @@ const App: React.FC = () => {
                 playbackTime={playbackTime}
                 isPlaying={isPlayingPlayback}
                 onTimeUpdate={handlePlaybackTimeUpdate}
+                clientOverlay={CLIENT_OVERLAY}
+                overlayHistory={overlayHistoryRef}
            />
         </div>
 
         <div className="flex-[2] px-4 pb-4 min-h-0">
-            <BiopacChart data={biopacData} mode={mode} />
+            <BiopacChart data={biopacData} mode={mode} info={biopacInfo} />
         </div>
       </div>
 
@@ -0,0 +1,231 @@
+"""Xử lý offline video đã ghi bằng cùng pipeline tilt/gaze/posture của phiên live.
+
+Mỗi video được chia thành các đoạn (chunk) và phân phối cho một process pool,
+không giới hạn tốc độ theo thời gian thực. Mỗi chunk ghi log đúng schema của
+SessionLogger vào thư mục riêng và đánh dấu DONE khi xong; chạy lại cùng lệnh
+sẽ bỏ qua các chunk đã xong (resume) rồi ghép thành log_pro.* của từng video.
+
+    python batch_process.py study/*.mp4 --out exports/batch --tilt-model best_tilt.pt \\
+        --posture-model best_posture.pt --workers 8 --chunk-seconds 300
+"""
+import argparse
+import concurrent.futures as cf
+import glob
+import json
+import multiprocessing as mp
+import os
+import shutil
+import time
+
+import cv2
+
+from session_logger import SessionLogger, pq
+from frame_cache import PreparedFrame
+from config import GAZE_DEVICE, LOG_FORMATS, DETECTOR_BACKEND
+
+DONE_MARK = "DONE"
+
+# Detector của từng worker process, load một lần trong initializer
+_detectors = {}
+
+
+def _init_worker(options):
+    if options.get('backend') == "onnx":
+        from onnx_backend import OnnxTiltDetector as TiltDetector, OnnxPostureDetector as PostureDetector
+    else:
+        from detectors import TiltDetector, PostureDetector
+    if options.get('tilt_model'):
+        _detectors['tilt'] = TiltDetector(options['tilt_model'])
+    if options.get('posture_model'):
+        _detectors['posture'] = PostureDetector(options['posture_model'])
+    if options.get('use_gaze', True):
+        from gaze_wrapper import GazeEstimator
+        _detectors['gaze'] = GazeEstimator(GAZE_DEVICE)
+
+
+def _infer_many(name, preps):
+    """Đầu vào đã tiền xử lý theo PREPROCESS của detector (chung giữa các detector của cùng frame)"""
+    det = _detectors[name]
+    spec = getattr(det, 'PREPROCESS', None)
+    frames = [p.model_input(spec) for p in preps] if spec else [p.frame for p in preps]
+    if hasattr(det, 'infer_batch'): return det.infer_batch(frames)
+    return [det.infer(f) for f in frames]
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return fps, count
+
+
+def plan_chunks(path, out_dir, chunk_seconds):
+    """Danh sách chunk (video, frame bắt đầu, frame kết thúc, thư mục chunk)"""
+    fps, count = video_info(path)
+    base = _video_dir(path, out_dir)
+    if count <= 0 or chunk_seconds <= 0:
+        # Không biết số frame (hoặc không chia): cả file là một chunk, đọc tới hết
+        return [{"video": path, "start": 0, "end": 2 ** 62, "fps": fps,
+                 "dir": os.path.join(base, "chunks", "chunk_00000")}]
+    step = max(1, int(chunk_seconds * fps))
+    return [{"video": path, "start": s, "end": min(s + step, count), "fps": fps,
+             "dir": os.path.join(base, "chunks", f"chunk_{i:05d}")}
+            for i, s in enumerate(range(0, count, step))]
+
+
+def _video_dir(path, out_dir):
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0])
+
+
+def process_chunk(chunk, options):
+    """Chạy trong worker process: đọc đoạn video, infer theo batch, ghi log của chunk"""
+    if os.path.exists(os.path.join(chunk["dir"], DONE_MARK)): return chunk["dir"]
+    shutil.rmtree(chunk["dir"], ignore_errors=True)
+    logger = SessionLogger(chunk["dir"], formats=options['formats'], dedup=options['dedup'],
+                           queue_size=0)
+    cap = cv2.VideoCapture(chunk["video"])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, chunk["start"])
+    t0, fps, stride, batch_size = chunk["start_time"], chunk["fps"], options['stride'], options['batch']
+
+    # Giữ kết quả cuối như engine live (State Persistence)
+    last = {"tilt": {}, "gaze": {}, "posture": {}}
+    idx = chunk["start"]
+    ended = False
+    try:
+        while idx < chunk["end"] and not ended:
+            preps, indices = [], []
+            while len(preps) < batch_size and idx < chunk["end"]:
+                ret, frame = cap.read()
+                if not ret:
+                    ended = True
+                    break
+                if (idx - chunk["start"]) % stride == 0:
+                    preps.append(PreparedFrame(frame, idx))
+                    indices.append(idx)
+                idx += 1
+            if not preps: break
+
+            results = {name: _infer_many(name, preps) for name in _detectors}
+            for i, frame_idx in enumerate(indices):
+                for name, res_list in results.items():
+                    res = res_list[i] or {}
+                    if name == 'gaze':
+                        last['gaze'] = {"label": res.get('label'), "eyes": res.get('eyes_data', [])}
+                    elif res.get('label'):
+                        last[name] = res
+                logger.log(frame_idx, last['tilt'], last['gaze'], last['posture'], ts=t0 + frame_idx / fps)
+    finally:
+        cap.release()
+        logger.close()
+    open(os.path.join(chunk["dir"], DONE_MARK), "w").close()
+    return chunk["dir"]
+
+
+def merge_chunks(video_dir, chunk_dirs, formats):
+    """Ghép log các chunk (theo thứ tự) thành log_pro.* của video"""
+    if "csv" in formats:
+        with open(os.path.join(video_dir, "log_pro.csv"), "w", encoding="utf-8", newline="") as out:
+            for i, d in enumerate(chunk_dirs):
+                with open(os.path.join(d, "log_pro.csv"), encoding="utf-8") as f:
+                    header = f.readline()
+                    if i == 0: out.write(header)
+                    shutil.copyfileobj(f, out)
+    if "rec" in formats:
+        shutil.copy(os.path.join(chunk_dirs[0], "log_pro.rec.json"), os.path.join(video_dir, "log_pro.rec.json"))
+        with open(os.path.join(video_dir, "log_pro.rec"), "wb") as out:
+            for d in chunk_dirs:
+                with open(os.path.join(d, "log_pro.rec"), "rb") as f: shutil.copyfileobj(f, out)
+    if "parquet" in formats and pq is not None:
+        import pyarrow as pa
+        parts = [os.path.join(d, "log_pro.parquet") for d in chunk_dirs]
+        tables = [pq.read_table(p) for p in parts if os.path.exists(p)]
+        if tables: pq.write_table(pa.concat_tables(tables), os.path.join(video_dir, "log_pro.parquet"))
+
+
+def process_videos(paths, out_dir, tilt_model=None, posture_model=None, use_gaze=True, workers=None,
+                   chunk_seconds=300.0, batch=8, stride=1, formats=LOG_FORMATS, dedup=False,
+                   start_time=None, backend="torch", quantize=False):
+    """API chính: trả về {video: thư mục kết quả}"""
+    options = {
+        "tilt_model": os.path.abspath(tilt_model) if tilt_model else None,
+        "posture_model": os.path.abspath(posture_model) if posture_model else None,
+        "use_gaze": use_gaze, "batch": max(1, batch), "stride": max(1, stride),
+        "formats": tuple(formats), "dedup": dedup, "backend": backend,
+    }
+    if backend == "onnx":
+        # Export/quantize một lần ở process chính, worker chỉ nạp file .onnx đã cache
+        from onnx_backend import prepare
+        for key, kind in (("tilt_model", "tilt"), ("posture_model", "posture")):
+            if options[key]: options[key] = prepare(options[key], kind, quantize)
+    plans = {}
+    for path in paths:
+        # Mặc định mốc thời gian = thời điểm bắt đầu ghi (mtime - độ dài video)
+        fps, count = video_info(path)
+        t0 = start_time if start_time is not None else os.path.getmtime(path) - count / fps
+        plans[path] = [dict(c, start_time=t0) for c in plan_chunks(path, out_dir, chunk_seconds)]
+
+    pending = [c for chunks in plans.values() for c in chunks
+               if not os.path.exists(os.path.join(c["dir"], DONE_MARK))]
+    total = sum(len(c) for c in plans.values())
+    print(f"{len(paths)} video(s), {total} chunk(s), {total - len(pending)} already done")
+
+    started = time.time()
+    if pending:
+        ctx = mp.get_context("spawn")
+        with cf.ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                    initargs=(options,)) as pool:
+            futures = {pool.submit(process_chunk, c, options): c for c in pending}
+            for n, fut in enumerate(cf.as_completed(futures), 1):
+                c = futures[fut]
+                try:
+                    fut.result()
+                    print(f"[{n}/{len(pending)}] {os.path.basename(c['video'])} "
+                          f"frames {c['start']}-{c['end']} done")
+                except Exception as e:
+                    print(f"[{n}/{len(pending)}] {c['video']} chunk {c['start']} failed: {e}")
+
+    outputs = {}
+    for path, chunks in plans.items():
+        dirs = [c["dir"] for c in chunks]
+        if not all(os.path.exists(os.path.join(d, DONE_MARK)) for d in dirs):
+            print(f"Incomplete: {path} (run again to resume)")
+            continue
+        video_dir = _video_dir(path, out_dir)
+        merge_chunks(video_dir, dirs, options["formats"])
+        with open(os.path.join(video_dir, "batch_info.json"), "w", encoding="utf-8") as f:
+            json.dump({"video": os.path.abspath(path), "chunks": len(dirs),
+                       **{k: v for k, v in options.items() if k != "formats"}}, f, indent=2)
+        outputs[path] = video_dir
+    print(f"Finished in {time.time() - started:.1f}s")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batch processing for recorded videos")
+    parser.add_argument("videos", nargs="+", help="Video files or glob patterns")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "exports", "batch"))
+    parser.add_argument("--tilt-model")
+    parser.add_argument("--posture-model")
+    parser.add_argument("--no-gaze", action="store_true")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--chunk-seconds", type=float, default=300.0, help="0 = one chunk per file")
+    parser.add_argument("--batch", type=int, default=8, help="Frames per predict call")
+    parser.add_argument("--stride", type=int, default=1, help="Process every N-th frame")
+    parser.add_argument("--formats", default=",".join(LOG_FORMATS), help="csv,rec,parquet")
+    parser.add_argument("--dedup", action="store_true", help="Skip unchanged samples like live sessions")
+    parser.add_argument("--start-time", type=float, default=None, help="Epoch seconds of frame 0")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=DETECTOR_BACKEND)
+    parser.add_argument("--quantize", action="store_true", help="ONNX backend: dynamic int8 quantization")
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.videos for p in (glob.glob(pattern) or [pattern])})
+    process_videos(paths, args.out, args.tilt_model, args.posture_model, not args.no_gaze, args.workers,
+                   args.chunk_seconds, args.batch, args.stride, args.formats.split(","), args.dedup,
+                   args.start_time, args.backend, args.quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""Benchmark pipeline: nguồn video tái lập được, detector giả/thật, N viewer MJPEG
+và N client Socket.IO mô phỏng. Kết quả (FPS, phân vị độ trễ từng stage, CPU,
+RSS) in ra dạng JSON để so sánh giữa các lần chạy và bắt regression.
+
+    python benchmark.py --duration 30 --viewers 4 --clients 8 --out bench_new.json
+    python benchmark.py --source video --video study.mp4 --detectors real \\
+        --tilt-model best_tilt.pt --posture-model best_posture.pt --compare bench_base.json
+
+Stage đo được (ms): capture_age (frame chờ trong slot camera), infer.<model>
+(thời gian chạy của worker), result.<model> (từ lúc chụp tới lúc engine nhận
+kết quả), loop (chu kỳ vòng lặp engine), encode (submit -> publish JPEG),
+viewer (publish -> viewer nhận), telemetry (engine publish -> emit).
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import INFERENCE_MODE, STREAM_WIDTH, STREAM_JPEG_QUALITY, TELEMETRY_RATE_HZ
+from processing_engine import ProcessingEngine
+from frame_broadcaster import FrameBroadcaster
+from stream_encoder import StreamEncoder, stream_key
+from telemetry import TelemetryPublisher
+from stub_detectors import StubDetector
+import server
+
+DEFAULT_COSTS = {"tilt": 25.0, "gaze": 10.0, "posture": 35.0}
+# Các chỉ số dùng khi so sánh: (đường dẫn trong JSON, True nếu lớn hơn là tốt hơn)
+COMPARE_KEYS = [
+    ("fps.cam1", True), ("fps.cam2", True), ("fps.tilt", True), ("fps.gaze", True), ("fps.posture", True),
+    ("latency_ms.result.tilt.p95", False), ("latency_ms.result.gaze.p95", False),
+    ("latency_ms.result.posture.p95", False), ("latency_ms.loop.p95", False),
+    ("latency_ms.encode.p95", False), ("latency_ms.viewer.p95", False),
+    ("viewers.fps_per_viewer", True), ("cpu.percent", False), ("rss_mb.peak", False),
+]
+
+
+class Recorder:
+    """Gom mẫu thời gian (giây) theo stage; chỉ ghi sau khi hết warmup"""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.counts = collections.Counter()
+        self.active = False
+
+    def add(self, stage, seconds):
+        if self.active: self.samples[stage].append(seconds)
+
+    def count(self, name, n=1):
+        if self.active: self.counts[name] += n
+
+    def summary(self):
+        out = {}
+        for stage, vals in sorted(self.samples.items()):
+            ms = np.asarray(vals) * 1000.0
+            p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+            out[stage] = {"count": len(ms), "mean": round(float(ms.mean()), 2), "p50": round(float(p50), 2),
+                          "p90": round(float(p90), 2), "p95": round(float(p95), 2),
+                          "p99": round(float(p99), 2), "max": round(float(ms.max()), 2)}
+        return out
+
+
+class BenchBroadcaster(FrameBroadcaster):
+    """Ghi lại thời điểm submit (engine) và publish (encoder) để đo encode/viewer"""
+
+    def __init__(self, rec):
+        super().__init__()
+        self.rec = rec
+        self.submitted_at = {}
+        self.published_at = {}
+
+    def publish(self, stream, jpeg, *args):
+        seq = super().publish(stream, jpeg, *args)
+        now = time.time()
+        t0 = self.submitted_at.pop(stream[0], None)
+        if t0 is not None: self.rec.add("encode", now - t0)
+        self.published_at[(stream, seq)] = now
+        self.published_at.pop((stream, seq - 64), None)
+        return seq
+
+
+class BenchEncoder(StreamEncoder):
+    def submit(self, cam_id, frame, *args, **kwargs):
+        # Frame bị thay trước khi encode thì giữ mốc của frame đầu tiên chưa encode
+        self.broadcaster.submitted_at.setdefault(cam_id, time.time())
+        super().submit(cam_id, frame, *args, **kwargs)
+
+
+class BenchEngine(ProcessingEngine):
+    """ProcessingEngine đo thời gian từng stage; detector giả khi `stub_costs` khác None"""
+
+    def __init__(self, config, result_callback, broadcaster, rec, stub_costs=None, spin=False):
+        super().__init__(config, result_callback, broadcaster)
+        self.rec = rec
+        self.stub_costs = stub_costs
+        self.spin = spin
+        self.encoder = BenchEncoder(self.broadcaster)
+        self.capture_ts = {"cam1": {}, "cam2": {}}
+        self.sources = {"tilt": "cam1", "gaze": "cam1", "posture": "cam2"}
+
+    def _detector_specs(self):
+        if self.stub_costs is None: return super()._detector_specs()
+        names = ['tilt', 'posture'] + (['gaze'] if self.config.get('use_gaze', True) else [])
+        return [(name, StubDetector, (name, self.stub_costs[name], self.spin)) for name in names]
+
+    def _create_scheduler(self):
+        sched = super()._create_scheduler()
+        record = sched.record
+
+        def timed_record(name, seconds):
+            self.rec.add(f"infer.{name}", seconds)
+            record(name, seconds)
+        sched.record = timed_record
+        return sched
+
+    def _grab(self, src, cam_key):
+        frame = super()._grab(src, cam_key)
+        if frame is not None:
+            now = time.time()
+            seq = self.last_seq[cam_key]
+            self.capture_ts[cam_key][seq] = now - self.frame_age[cam_key]
+            self.capture_ts[cam_key].pop(seq - 256, None)
+            self.rec.add("capture_age", self.frame_age[cam_key])
+            self.rec.count(f"frames.{cam_key}")
+        return frame
+
+    def _collect_results(self):
+        before = dict(self.result_seq)
+        super()._collect_results()
+        now = time.time()
+        for name, seq in self.result_seq.items():
+            if seq == before[name]: continue
+            ts = self.capture_ts[self.sources[name]].get(seq)
+            if ts is not None: self.rec.add(f"result.{name}", now - ts)
+            self.rec.count(f"results.{name}")
+
+
+class StubSocketIO:
+    """Thay cho flask_socketio.SocketIO: đếm message/bytes gửi tới từng room"""
+
+    def __init__(self, rec, members):
+        self.rec = rec
+        self.members = members  # room -> số client
+        self.published_at = None
+
+    def start_background_task(self, fn, *args):
+        return eventlet.spawn(fn, *args)
+
+    def sleep(self, seconds):
+        eventlet.sleep(seconds)
+
+    def emit(self, event, data, to=None):
+        n = self.members.get(to, 0)
+        size = len(data) if isinstance(data, bytes) else len(json.dumps(data, default=str))
+        self.rec.count("telemetry.emits")
+        self.rec.count("telemetry.messages", n)
+        self.rec.count("telemetry.bytes", n * size)
+        if self.published_at: self.rec.add("telemetry", time.time() - self.published_at)
+
+
+def _viewer(key, fps, rec, broadcaster, stop):
+    """Một client MJPEG: tiêu thụ đúng generator mà route /video_feed dùng"""
+    gen = server.gen_frames(key, fps)
+    try:
+        for chunk in gen:
+            seq = broadcaster.frames[key][0]
+            ts = broadcaster.published_at.get((key, seq))
+            if ts is not None: rec.add("viewer", time.time() - ts)
+            rec.count("viewer.frames")
+            rec.count("viewer.bytes", len(chunk))
+            if stop.is_set(): break
+    finally:
+        gen.close()
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if resource is None: return 0.0
+    # macOS: chỉ có peak (ru_maxrss tính theo KB trên Linux, bytes trên macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def _cpu_seconds():
+    if resource is None: return time.process_time(), 0.0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + kids.ru_utime, own.ru_stime + kids.ru_stime
+
+
+def run_benchmark(engine_config, duration=20.0, warmup=3.0, stub_costs=None, spin=False, viewers=0,
+                  viewer_width=STREAM_WIDTH, viewer_quality=STREAM_JPEG_QUALITY, viewer_fps=30.0,
+                  viewer_overlay=True, clients=0, binary=False, channels=None, telemetry_hz=TELEMETRY_RATE_HZ):
+    """Chạy engine `duration` giây (sau warmup) và trả về dict kết quả"""
+    rec = Recorder()
+    broadcaster = BenchBroadcaster(rec)
+    server.broadcaster = broadcaster  # gen_frames đọc broadcaster của module server
+
+    members = {}
+    sio = StubSocketIO(rec, members)
+    telemetry = TelemetryPublisher(sio, telemetry_hz)
+    for _ in range(clients):
+        room = telemetry.subscribe(channels, binary)
+        members[room] = members.get(room, 0) + 1
+
+    last_loop = [None]
+
+    def on_result(payload):
+        now = time.time()
+        if last_loop[0] is not None: rec.add("loop", now - last_loop[0])
+        last_loop[0] = now
+        rec.count("loops")
+        sio.published_at = now
+        telemetry.publish(payload)
+
+    engine = BenchEngine(engine_config, on_result, broadcaster, rec, stub_costs, spin)
+    stop = threading.Event()
+    engine.start()
+    if clients: telemetry.start()
+    key = stream_key(1, viewer_width, viewer_quality, viewer_overlay)
+    key2 = stream_key(2, viewer_width, viewer_quality, viewer_overlay)
+    threads = [eventlet.spawn(_viewer, key if i % 2 == 0 else key2, viewer_fps, rec, broadcaster, stop)
+               for i in range(viewers)]
+
+    eventlet.sleep(warmup)
+    rec.active = True
+    rss_start, rss_peak = _rss_mb(), _rss_mb()
+    cpu0, wall0 = _cpu_seconds(), time.time()
+    while time.time() - wall0 < duration:
+        eventlet.sleep(0.5)
+        rss_peak = max(rss_peak, _rss_mb())
+    wall = time.time() - wall0
+    cpu1 = _cpu_seconds()
+    rec.active = False
+    snapshot = {"sched": engine.scheduler.report(),
+                "dropped": {name: getattr(src, "dropped", 0) for name, src in engine.srcs.items()}}
+
+    stop.set()
+    engine.stop()
+    engine.join(timeout=10.0)
+    telemetry.stop()
+    for t in threads: t.kill()
+
+    counts = rec.counts
+    user, system = cpu1[0] - cpu0[0], cpu1[1] - cpu0[1]
+    return {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "duration_s": round(wall, 2),
+                 "warmup_s": warmup, "config": engine_config, "stub_costs_ms": stub_costs, "spin": spin},
+        "fps": {
+            "loop": round(counts["loops"] / wall, 2),
+            "cam1": round(counts["frames.cam1"] / wall, 2),
+            "cam2": round(counts["frames.cam2"] / wall, 2),
+            **{name: round(counts[f"results.{name}"] / wall, 2) for name in ("tilt", "gaze", "posture")},
+        },
+        "latency_ms": rec.summary(),
+        "viewers": {"count": viewers, "width": viewer_width, "quality": viewer_quality, "overlay": viewer_overlay,
+                    "frames": counts["viewer.frames"], "bytes": counts["viewer.bytes"],
+                    "fps_per_viewer": round(counts["viewer.frames"] / wall / viewers, 2) if viewers else 0.0},
+        "telemetry": {"clients": clients, "binary": binary, "rate_hz": telemetry_hz,
+                      "emits": counts["telemetry.emits"], "messages": counts["telemetry.messages"],
+                      "bytes": counts["telemetry.bytes"],
+                      "bytes_per_client_s": round(counts["telemetry.bytes"] / wall / clients, 1) if clients else 0.0},
+        "cpu": {"user_s": round(user, 3), "system_s": round(system, 3),
+                "percent": round(100.0 * (user + system) / wall, 1)},
+        "rss_mb": {"start": round(rss_start, 1), "peak": round(rss_peak, 1), "end": round(_rss_mb(), 1)},
+        "scheduler": snapshot["sched"],
+        "dropped_frames": snapshot["dropped"],
+    }
+
+
+def _lookup(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data: return None
+        data = data[part]
+    return data
+
+
+def compare(result, baseline, tolerance=0.10):
+    """Danh sách chỉ số xấu đi quá `tolerance` (tỉ lệ) so với baseline"""
+    regressions = []
+    for path, higher_is_better in COMPARE_KEYS:
+        new, old = _lookup(result, path), _lookup(baseline, path)
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old == 0: continue
+        change = (new - old) / abs(old)
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append({"metric": path, "baseline": old, "current": new,
+                                "change_pct": round(change * 100.0, 1)})
+    return regressions
+
+
+def _parse_costs(text):
+    costs = dict(DEFAULT_COSTS)
+    for part in filter(None, (text or "").split(",")):
+        name, _, ms = part.partition("=")
+        costs[name.strip()] = float(ms)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline throughput/latency benchmark")
+    parser.add_argument("--source", choices=["synthetic", "video"], default="synthetic")
+    parser.add_argument("--video", help="Video file replayed on both cameras (--source video)")
+    parser.add_argument("--video2", help="Separate video for camera 2 (default: --video)")
+    parser.add_argument("--size", default="1280x720", help="Synthetic frame size WxH")
+    parser.add_argument("--detectors", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stub-cost", default="", help="Per-model cost in ms, e.g. tilt=25,gaze=10,posture=35")
+    parser.add_argument("--spin", action="store_true", help="Stub detectors burn CPU instead of sleeping")
+    parser.add_argument("--tilt-model", default="best_tilt.pt")
+    parser.add_argument("--posture-model", default="best_posture.pt")
+    parser.add_argument("--no-gaze", action="store_true")
+    parser.add_argument("--mode", choices=["thread", "process"], default=INFERENCE_MODE)
+    parser.add_argument("--viewers", type=int, default=2, help="Simulated MJPEG clients")
+    parser.add_argument("--viewer-width", type=int, default=STREAM_WIDTH)
+    parser.add_argument("--viewer-quality", type=int, default=STREAM_JPEG_QUALITY)
+    parser.add_argument("--viewer-fps", type=float, default=30.0)
+    parser.add_argument("--viewer-raw", action="store_true", help="Viewers take overlay-free frames (client draws)")
+    parser.add_argument("--clients", type=int, default=4, help="Simulated Socket.IO clients")
+    parser.add_argument("--binary", action="store_true", help="Clients subscribe to msgpack telemetry")
+    parser.add_argument("--channels", default="", help="Telemetry channels, e.g. tilt,gaze (default: all)")
+    parser.add_argument("--telemetry-hz", type=float, default=TELEMETRY_RATE_HZ)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--config", default="{}", help="Extra engine config as JSON")
+    parser.add_argument("--out", help="Write result JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    if args.source == "video":
+        if not args.video: parser.error("--source video requires --video")
+        cams = {"tilt_type": "Video", "tilt_val": args.video,
+                "posture_type": "Video", "posture_val": args.video2 or args.video}
+    else:
+        cams = {"tilt_type": "Synthetic", "tilt_val": args.size,
+                "posture_type": "Synthetic", "posture_val": args.size}
+    config = {**cams, "tilt_model": args.tilt_model, "posture_model": args.posture_model,
+              "use_gaze": not args.no_gaze, "inference_mode": args.mode, **json.loads(args.config)}
+
+    result = run_benchmark(
+        config, args.duration, args.warmup,
+        stub_costs=_parse_costs(args.stub_cost) if args.detectors == "stub" else None, spin=args.spin,
+        viewers=args.viewers, viewer_width=args.viewer_width, viewer_quality=args.viewer_quality,
+        viewer_fps=args.viewer_fps, viewer_overlay=not args.viewer_raw, clients=args.clients, binary=args.binary,
+        channels=[c for c in args.channels.split(",") if c] or None, telemetry_hz=args.telemetry_hz)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        result["regressions"] = compare(result, baseline, args.tolerance)
+        for r in result["regressions"]:
+            print(f"REGRESSION {r['metric']}: {r['baseline']} -> {r['current']} ({r['change_pct']:+.1f}%)",
+                  file=sys.stderr)
+        status = 1 if result["regressions"] else 0
+
+    text = json.dumps(result, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""Thu tín hiệu BIOPAC (1-2 kHz) song song với video.
+
+- Reader cắm được (READERS): `synthetic` (sóng giả), `file` (phát lại CSV/.npy
+  theo đúng nhịp lấy mẫu), `socket` (TCP, float32 little-endian, mỗi mẫu một
+  giá trị cho từng kênh). `read()` trả về (ts[n], values[n, kênh]) hoặc None.
+- Mỗi kênh một SignalRing (numpy, một người ghi, không khóa); thread ingest là
+  OS thread riêng nên không chặn engine.
+- Khi ghi log: mẫu thô vào `biopac.rec` (+ .rec.json), và `biopac_frames.csv`
+  gắn mỗi Frame của log_pro với chỉ số mẫu / giá trị tại thời điểm chụp frame.
+- Payload cho UI: cửa sổ BIOPAC_WINDOW_SECONDS gần nhất rút gọn còn
+  BIOPAC_POINTS điểm mỗi kênh bằng min/max hoặc LTTB.
+"""
+import collections
+import csv
+import itertools
+import json
+import os
+import socket
+import time
+
+import numpy as np
+
+from native_threads import threading, queue
+from config import (BIOPAC_BUFFER_SECONDS, BIOPAC_WINDOW_SECONDS, BIOPAC_POINTS, BIOPAC_DECIMATION,
+                    BIOPAC_UPDATE_HZ)
+
+
+class SignalRing:
+    """Ring buffer một kênh: ts (f8) + giá trị (f4). Một thread ghi, nhiều thread đọc, không khóa.
+
+    Người ghi chép dữ liệu vào ô rồi mới tăng `head` (tổng số mẫu đã ghi); người
+    đọc đọc `head` lại sau khi chép và bỏ phần đã bị ghi đè trong lúc chép.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self.ts = np.zeros(self.capacity, dtype=np.float64)
+        self.values = np.zeros(self.capacity, dtype=np.float32)
+        self.head = 0
+
+    def write(self, ts, values):
+        total = n = len(ts)
+        # Khối dài hơn ring: chỉ ghi phần đuôi nhưng head vẫn tính mọi mẫu (chỉ số mẫu khớp biopac.rec)
+        if n > self.capacity: ts, values, n = ts[-self.capacity:], values[-self.capacity:], self.capacity
+        start = (self.head + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.ts[start:start + first], self.values[start:start + first] = ts[:first], values[:first]
+        if first < n: self.ts[:n - first], self.values[:n - first] = ts[first:], values[first:]
+        self.head += total
+
+    def read(self, since: int = 0):
+        """(chỉ số mẫu đầu, ts, values) của các mẫu có chỉ số >= since còn trong ring"""
+        head = self.head
+        start = max(since, head - self.capacity, 0)
+        idx = np.arange(start, head) % self.capacity
+        ts, values = self.ts[idx], self.values[idx]
+        # Phần bị người ghi đè trong lúc chép
+        lost = max(0, self.head - self.capacity - start)
+        return start + lost, ts[lost:], values[lost:]
+
+    def read_window(self, seconds: float):
+        """Các mẫu trong `seconds` giây cuối"""
+        head = self.head
+        if head == 0: return 0, self.ts[:0], self.values[:0]
+        last = self.ts[(head - 1) % self.capacity]
+        n = min(head, self.capacity)
+        # Bước lùi gần đúng theo số mẫu rồi mới cắt chính xác theo ts
+        start, ts, values = self.read(head - n)
+        cut = int(np.searchsorted(ts, last - seconds))
+        return start + cut, ts[cut:], values[cut:]
+
+
+# --- Rút gọn điểm cho biểu đồ ---
+def decimate_minmax(ts, values, points: int):
+    """Giữ min và max của mỗi bucket (đúng thứ tự thời gian): không mất đỉnh nhọn"""
+    n = len(values)
+    buckets = max(1, points // 2)
+    if n <= points: return ts, values
+    size = -(-n // buckets)
+    # Bucket cuối được đệm bằng mẫu cuối để không bỏ sót phần dư
+    v = np.concatenate([values, np.repeat(values[-1:], size * buckets - n)]).reshape(buckets, size)
+    base = np.arange(buckets) * size
+    lo, hi = base + v.argmin(axis=1), base + v.argmax(axis=1)
+    idx = np.unique(np.minimum(np.concatenate([lo, hi]), n - 1))
+    return ts[idx], values[idx]
+
+
+def decimate_lttb(ts, values, points: int):
+    """Largest-Triangle-Three-Buckets: giữ hình dạng tín hiệu với `points` điểm"""
+    n = len(values)
+    if n <= points or points < 3: return ts, values
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    # Trung bình từng bucket tính một lần (điểm thứ ba của tam giác là trung bình bucket kế tiếp)
+    counts = np.diff(np.append(edges, n - 1))
+    counts[-1] = max(counts[-1], 1)
+    mx = np.add.reduceat(ts[:n - 1], edges[:-1]) / np.maximum(counts[:-1], 1)
+    my = np.add.reduceat(values[:n - 1].astype(np.float64), edges[:-1]) / np.maximum(counts[:-1], 1)
+    mx, my = np.append(mx[1:], ts[-1]), np.append(my[1:], values[-1])
+    out = np.empty(points, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = ts[a], values[a]
+        area = np.abs((ax - mx[i]) * (values[lo:hi] - ay) - (ax - ts[lo:hi]) * (my[i] - ay))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return ts[out], values[out]
+
+
+DECIMATORS = {"minmax": decimate_minmax, "lttb": decimate_lttb}
+
+
+# --- Reader ---
+class SyntheticReader:
+    """Tín hiệu giả (ECG-like + trôi chậm) để thử toàn bộ đường đi dữ liệu"""
+
+    def __init__(self, channels=("ECG", "EDA"), rate: float = 2000.0, chunk: float = 0.02):
+        self.channels = list(channels)
+        self.rate = float(rate)
+        self.chunk = int(max(1, rate * chunk))
+        self.n = 0
+        self.t0 = time.time()
+
+    def read(self):
+        due = self.t0 + (self.n + self.chunk) / self.rate
+        wait = due - time.time()
+        if wait > 0: time.sleep(wait)
+        i = np.arange(self.n, self.n + self.chunk)
+        t = i / self.rate
+        self.n += self.chunk
+        beat = np.exp(-((t % 0.9) - 0.2) ** 2 / 0.0002) * 1.5
+        cols = [beat + 0.05 * np.sin(2 * np.pi * 0.3 * t) if k == 0 else
+                2.0 + 0.5 * np.sin(2 * np.pi * 0.05 * t + k) for k in range(len(self.channels))]
+        return self.t0 + t, np.stack(cols, axis=1).astype(np.float32)
+
+    def close(self):
+        pass
+
+
+class FileReplayReader:
+    """Phát lại file ghi sẵn: CSV (header = tên kênh, cột 'time' nếu có bị bỏ qua) hoặc .npy [mẫu, kênh]"""
+
+    def __init__(self, path: str, rate: float = 1000.0, channels=None, loop: bool = True, chunk: float = 0.02):
+        if path.endswith(".npy"):
+            data = np.load(path).astype(np.float32)
+            names = channels or [f"CH{i + 1}" for i in range(data.shape[1])]
+        else:
+            with open(path, newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f))
+            keep = [i for i, h in enumerate(header) if h.strip().lower() not in ("time", "timestamp", "t")]
+            data = np.loadtxt(path, delimiter=",", skiprows=1, usecols=keep, dtype=np.float32, ndmin=2)
+            names = channels or [header[i].strip() for i in keep]
+        self.data = data.reshape(len(data), -1)
+        self.channels = list(names)
+        self.rate = float(rate)
+        self.loop = loop
+        self.chunk = int(max(1, rate * chunk))
+        self.pos = 0
+        self.n = 0
+        self.t0 = time.time()
+
+    def read(self):
+        if self.pos >= len(self.data):
+            if not self.loop or not len(self.data): return None
+            self.pos = 0
+        due = self.t0 + (self.n + self.chunk) / self.rate
+        wait = due - time.time()
+        if wait > 0: time.sleep(wait)
+        block = self.data[self.pos:self.pos + self.chunk]
+        ts = self.t0 + (self.n + np.arange(len(block))) / self.rate
+        self.pos += len(block)
+        self.n += len(block)
+        return ts, block
+
+    def close(self):
+        pass
+
+
+class SocketReader:
+    """Luồng TCP float32 little-endian (vd. network data transfer của AcqKnowledge), xen kẽ theo kênh"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 15010, channels=("CH1",), rate: float = 1000.0,
+                 timeout: float = 5.0):
+        self.channels = list(channels)
+        self.rate = float(rate)
+        self.frame = 4 * len(self.channels)
+        self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+        self.buf = b""
+        self.n = 0
+        self.t0 = None
+
+    def read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return np.zeros(0), np.zeros((0, len(self.channels)), np.float32)
+        if not data: return None
+        self.buf += data
+        n = len(self.buf) // self.frame
+        block = np.frombuffer(self.buf[:n * self.frame], dtype="<f4").reshape(n, len(self.channels))
+        self.buf = self.buf[n * self.frame:]
+        # Đồng hồ mẫu neo vào thời điểm nhận mẫu đầu tiên
+        if self.t0 is None: self.t0 = time.time() - n / self.rate
+        ts = self.t0 + (self.n + np.arange(n)) / self.rate
+        self.n += n
+        return ts, block
+
+    def close(self):
+        self.sock.close()
+
+
+READERS = {"synthetic": SyntheticReader, "file": FileReplayReader, "socket": SocketReader}
+
+
+def create_reader(spec: dict):
+    """spec = {"type": "synthetic" | "file" | "socket", ...tham số của reader}"""
+    spec = dict(spec)
+    return READERS[spec.pop("type", "synthetic")](**spec)
+
+
+class BiopacIngest:
+    """Đọc reader trên OS thread, ghi vào ring từng kênh; ghi file phiên khi `attach`"""
+
+    def __init__(self, reader, buffer_seconds: float = BIOPAC_BUFFER_SECONDS):
+        self.reader = reader
+        self.channels = reader.channels
+        self.rate = reader.rate
+        self.rings = {ch: SignalRing(int(reader.rate * buffer_seconds)) for ch in self.channels}
+        self.stop_event = threading.Event()
+        self.error = None
+        self._session = None  # (file .rec, csv writer, file csv) khi đang ghi
+        self._lock = threading.Lock()  # chỉ tranh chấp lúc attach/detach
+        # Engine đưa (frame, ts) qua hàng đợi; chỉ thread ingest (giữ _lock) đụng tới deque _marks
+        self._incoming = queue.Queue()
+        self._marks = collections.deque()  # (frame, ts) chờ mẫu BIOPAC tới để căn
+        self._cache = (0.0, None)
+        self.thread = threading.Thread(target=self._run, name="biopac-ingest", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=2.0)
+        self.detach()
+        self.reader.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                chunk = self.reader.read()
+            except Exception as e:
+                self.error = str(e)
+                print(f"BIOPAC reader error: {e}")
+                break
+            if chunk is None: break
+            ts, values = chunk
+            if not len(ts): continue
+            start = self.rings[self.channels[0]].head
+            for k, ch in enumerate(self.channels): self.rings[ch].write(ts, values[:, k])
+            if not self._session: continue
+            with self._lock:
+                if self._session:
+                    self._write_raw(self._session, start, ts, values)
+                    self._take_marks()
+                    if self._marks: self._align(self._session)
+
+    # --- Ghi file theo phiên ---
+    def attach(self, session_dir: str):
+        """Bắt đầu ghi mẫu thô + bảng căn Frame vào thư mục phiên"""
+        dtype = self._dtype()
+        with open(os.path.join(session_dir, "biopac.rec.json"), "w", encoding="utf-8") as f:
+            json.dump({"dtype": dtype.descr, "rate": self.rate, "channels": self.channels}, f)
+        csv_file = open(os.path.join(session_dir, "biopac_frames.csv"), "w", newline="", encoding="utf-8")
+        writer = csv.writer(csv_file)
+        writer.writerow(["Frame", "Timestamp", "Sample", *self.channels])
+        with self._lock:
+            self._session = (open(os.path.join(session_dir, "biopac.rec"), "wb"), writer, csv_file)
+
+    def detach(self):
+        with self._lock:
+            session, self._session = self._session, None
+            self._take_marks()
+            self._marks.clear()
+        if session:
+            session[0].close()
+            session[2].close()
+
+    def _dtype(self):
+        return np.dtype([("Timestamp", "f8"), ("Sample", "i8")] + [(ch, "f4") for ch in self.channels])
+
+    def _write_raw(self, session, start, ts, values):
+        rec = np.empty(len(ts), dtype=self._dtype())
+        rec["Timestamp"], rec["Sample"] = ts, np.arange(start, start + len(ts))
+        for k, ch in enumerate(self.channels): rec[ch] = values[:, k]
+        rec.tofile(session[0])
+        session[0].flush()
+
+    def mark_frame(self, frame_idx: int, ts: float):
+        """Engine gọi mỗi Frame được log; giá trị được căn khi đã có mẫu sau thời điểm `ts`"""
+        if self._session: self._incoming.put((frame_idx, ts))
+
+    def _take_marks(self):
+        while True:
+            try:
+                self._marks.append(self._incoming.get_nowait())
+            except queue.Empty:
+                return
+
+    def _align(self, session):
+        ring = self.rings[self.channels[0]]
+        head = ring.head
+        if not head: return
+        last_ts = ring.ts[(head - 1) % ring.capacity]
+        ready = list(itertools.takewhile(lambda m: m[1] <= last_ts, self._marks))
+        if not ready: return
+        # Chỉ đọc đoạn cuối ring đủ phủ frame cũ nhất đang chờ
+        back = int((last_ts - ready[0][1]) * self.rate) + 2
+        start, sts, _ = ring.read(head - back)
+        if not len(sts): return
+        values = {ch: self.rings[ch].read(start)[2] for ch in self.channels}
+        marks = np.array([ts for _, ts in ready])
+        # Mẫu gần thời điểm chụp nhất
+        pos = np.clip(np.searchsorted(sts, marks), 1, len(sts) - 1) if len(sts) > 1 else np.zeros(len(ready), int)
+        if len(sts) > 1: pos -= np.abs(sts[pos - 1] - marks) <= np.abs(sts[pos] - marks)
+        rows = []
+        for (frame_idx, ts), p in zip(ready, pos):
+            rows.append([frame_idx, f"{ts:.6f}", start + p, *(f"{values[ch][p]:.5g}" for ch in self.channels)])
+            self._marks.popleft()
+        session[1].writerows(rows)
+        session[2].flush()
+
+    # --- Payload cho UI ---
+    def snapshot(self, window: float = BIOPAC_WINDOW_SECONDS, points: int = BIOPAC_POINTS,
+                 method: str = BIOPAC_DECIMATION):
+        """{"t0": ms epoch, "channels": {tên: {"t": [ms so với t0], "v": [...]}}}; tính lại tối đa BIOPAC_UPDATE_HZ lần/giây"""
+        now = time.time()
+        stamp, cached = self._cache
+        if cached is not None and now - stamp < 1.0 / BIOPAC_UPDATE_HZ: return cached
+        decimate = DECIMATORS.get(method, decimate_minmax)
+        channels = {}
+        for ch, ring in self.rings.items():
+            _, ts, values = ring.read_window(window)
+            values = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)  # NaN làm hỏng JSON phía client
+            ts, values = decimate(ts, values, points)
+            channels[ch] = {"t": np.round((ts - now) * 1000.0).astype(int).tolist(),
+                            "v": np.round(values.astype(float), 4).tolist()}
+        out = {"t0": round(now * 1000.0), "rate": self.rate, "method": method, "channels": channels}
+        if self.error: out["error"] = self.error
+        self._cache = (now, out)
+        return out
@@ -0,0 +1,317 @@
+"""Nhiều camera / nhiều trạm: mỗi camera là một pipeline chạy trong process riêng.
+
+Process con chạy đúng ProcessingEngine (PipelineEngine) cho một camera với tập
+detector được cấu hình - cùng scheduler, ROI tracking, motion gate, chớp mắt,
+ghi log / ghi frame / analytics / BIOPAC như chế độ 2 camera. Frame đi vào ring
+shared memory và kết quả (JSON) vào ring thứ hai - không pickle frame qua Pipe.
+Server (PipelineManager, green thread) đọc kết quả mới nhất để phát telemetry
+(channel `pipe:<tên>`, trạng thái fps/scheduler ở `pipe:<tên>:status`) và chỉ
+đọc frame khi có người xem `/video_feed/<tên>`.
+Khi ghi log, mỗi camera là một phiên riêng `session_<thời điểm>_<tên>`.
+
+    {"cameras": [{"name": "desk1", "type": "Webcam", "value": "0", "detectors": ["tilt", "gaze"]},
+                 {"name": "desk1_wide", "type": "IP", "value": "rtsp://...", "detectors": ["posture"],
+                  "width": 1920, "height": 1080, "schedule": {"posture": {"hz": 5}}}],
+     "tilt_model": "...", "posture_model": "...", "confidence": 0.25, "backend": "torch", "logging": true}
+
+Khóa khác của một camera (schedule, roi_tracking, record_frames, biopac...) ghi đè config chung cho
+riêng camera đó; `biopac` của config chung chỉ áp dụng cho camera đầu tiên (một nguồn, một người đọc).
+"""
+import atexit
+import json
+import multiprocessing as mp
+import os
+import re
+import threading
+import time
+
+import cv2
+import eventlet
+
+from config import WEBCAM_WIDTH, WEBCAM_HEIGHT, PIPELINE_RING_SLOTS, PIPELINE_RESULT_BYTES
+from shm_ring import ShmRing
+from stream_encoder import StreamEncoder
+from frame_broadcaster import FrameBroadcaster
+from processing_engine import ProcessingEngine, draw_tilt_gaze, draw_posture
+from frame_cache import PreparedFrame
+from metrics import REGISTRY
+
+CAM_NAME_RE = re.compile(r'^[\w-]{1,32}$')
+ALL_DETECTORS = ("tilt", "gaze", "posture")
+# Khóa mô tả camera; các khóa còn lại của camera là config engine riêng của camera đó
+CAMERA_KEYS = ("name", "type", "value", "detectors", "width", "height")
+# Pipeline còn giữ ring shared memory: unlink khi server thoát (atexit, hoặc shutdown trước os._exit)
+_LIVE = set()
+
+
+def _json_default(o):
+    if hasattr(o, 'tolist'): return o.tolist()
+    return str(o)
+
+
+def _detectors(cam):
+    """Không khai báo 'detectors' = chạy tất cả; danh sách rỗng = chỉ stream video"""
+    return ALL_DETECTORS if cam.get('detectors') is None else cam['detectors']
+
+
+def _frame_size(cam):
+    return int(cam.get('width') or WEBCAM_WIDTH), int(cam.get('height') or WEBCAM_HEIGHT)
+
+
+class PipelineEngine(ProcessingEngine):
+    """ProcessingEngine của một camera trong process con: frame ra ring shared memory, payload ra ring JSON.
+
+    Không encode/broadcast (server làm khi có người xem); bật/tắt ghi log theo `logging_event` của server.
+    """
+
+    def __init__(self, cam, config, frames, results, stop_event, logging_event):
+        self.cam = cam
+        self.frames = frames
+        self.results = results
+        self.parent_stop = stop_event
+        self.logging_event = logging_event
+        super().__init__({**config, 'logging': logging_event.is_set()}, self._publish)
+        self._mark = time.time()
+        self._grabbed = 0
+        self._too_big = False
+        self.fps = 0.0
+
+    def _camera_specs(self):
+        width, height = _frame_size(self.cam)
+        return {self.cam['name']: {"type": self.cam.get('type', "Webcam"), "value": self.cam.get('value', "0"),
+                                   "detectors": tuple(_detectors(self.cam)), "stream": self.cam['name'],
+                                   "width": width, "height": height}}
+
+    def _detector_specs(self):
+        wanted = set(_detectors(self.cam))
+        return [spec for spec in super()._detector_specs() if spec[0] in wanted]
+
+    def _session_name(self):
+        return f"{super()._session_name()}_{self.cam['name']}"
+
+    def _grab(self, src, cam_key):
+        frame = super()._grab(src, cam_key)
+        # Ring có kích thước cố định: đưa frame về đúng cỡ trước khi detector thấy (toạ độ khớp frame stream)
+        height, width = self.frames.slot_shape[:2]
+        if frame is not None and frame.shape[:2] != (height, width):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _stream(self, cam_key, src, prep):
+        # Seq của nguồn đi kèm frame: server ghép được frame với seq trong kết quả
+        self.frames.write(prep.frame, self.frame_time[cam_key], seq=prep.seq)
+        self._grabbed += 1
+
+    def _publish(self, payload):
+        if self.parent_stop.is_set(): self.stop()
+        if self.logging_event.is_set() != bool(self.session_logger): self.update_logging(self.logging_event.is_set())
+        now = time.time()
+        status = payload["status"]
+        out = {**payload, "status": {
+            **status, "frame_seq": self.last_seq[self.cam['name']], "ts": now,
+            "infer_ms": {name: info["cost_ms"] for name, info in status["sched"]["detectors"].items()
+                         if name in self.workers and info["cost_ms"] is not None}}}
+        if now - self._mark >= 1.0:
+            self.fps = round(self._grabbed / (now - self._mark), 1)
+            self._grabbed, self._mark = 0, now
+            # Thống kê phiên cho /analytics và event stats của server (analytics sống trong process này)
+            if self.analytics:
+                out["analytics"] = {"session": os.path.basename(self.session_dir),
+                                    "pending": self.analytics.pending(), "live": self.analytics.live()}
+            # Server chết (os._exit) thì process con tự dừng
+            if not mp.parent_process().is_alive(): self.stop()
+        out["status"]["fps"] = self.fps
+        data = json.dumps(out, default=_json_default).encode()
+        if self.results.write_bytes(data, now) < 0 and not self._too_big:
+            self._too_big = True
+            print(f"Pipeline {self.cam['name']}: result ({len(data)} bytes) exceeds PIPELINE_RESULT_BYTES")
+
+
+def _pipeline_main(cam, config, frame_spec, result_spec, stop_event, logging_event):
+    """Process con: chạy PipelineEngine ngay trên main thread tới khi server yêu cầu dừng"""
+    frames, results = ShmRing(*frame_spec), ShmRing(*result_spec)
+    try:
+        PipelineEngine(cam, config, frames, results, stop_event, logging_event).run()
+    except Exception as e:
+        print(f"Pipeline {cam['name']} crash: {e}")
+    finally:
+        frames.close()
+        results.close()
+
+
+class CameraPipeline:
+    """Phía server của một camera: sở hữu hai ring shared memory và process con"""
+
+    def __init__(self, cam: dict, config: dict, logging: bool = False, slots: int = PIPELINE_RING_SLOTS,
+                 result_bytes: int = PIPELINE_RESULT_BYTES):
+        self.name = cam['name']
+        self.cam = cam
+        width, height = _frame_size(cam)
+        self.frames = ShmRing.create(slots, (height, width, 3))
+        self.results = ShmRing.create(slots, (result_bytes,))
+        ctx = mp.get_context("spawn")
+        self.stop_event = ctx.Event()
+        self.logging_event = ctx.Event()
+        if logging: self.logging_event.set()
+        self.process = ctx.Process(target=_pipeline_main,
+                                   args=(cam, config, self.frames.spec(), self.results.spec(),
+                                         self.stop_event, self.logging_event),
+                                   name=f"pipeline-{self.name}", daemon=True)
+        _LIVE.add(self)
+        self.data = {}
+        self.state = {}  # channel status: fps, infer_ms, frame_seq, scheduler...
+        self.analytics = None  # {"session", "pending", "live"} của phiên đang ghi
+        self.result_seq = -1
+        self.frame_seq = -1
+
+    def start(self):
+        self.process.start()
+
+    def update_logging(self, enabled: bool):
+        if enabled:
+            self.logging_event.set()
+        else:
+            self.logging_event.clear()
+            self.analytics = None
+
+    def poll_results(self) -> bool:
+        """Đọc kết quả mới nhất (nếu có) vào self.data"""
+        item = self.results.read_bytes(self.result_seq)
+        if item is None: return False
+        self.result_seq, _, payload = item
+        self.data = json.loads(payload)
+        self.state = self.data.pop("status", {})
+        analytics = self.data.pop("analytics", None)
+        if analytics: self.analytics = analytics
+        return True
+
+    def latest_frame(self):
+        """Bản copy frame mới nhất chưa lấy, None nếu chưa có frame mới"""
+        item = self.frames.read_latest(self.frame_seq)
+        if item is None: return None
+        self.frame_seq, _, frame = item
+        return frame
+
+    def status(self) -> dict:
+        return {"name": self.name, "alive": self.process.is_alive(), "pid": self.process.pid,
+                "detectors": list(_detectors(self.cam)),
+                "frames": self.frames.latest_seq + 1, "fps": self.state.get("fps", 0.0),
+                "infer_ms": self.state.get("infer_ms", {}),
+                "session": (self.analytics or {}).get("session")}
+
+    def stop(self, timeout: float = 5.0):
+        self.stop_event.set()
+        if self.process.pid is not None:
+            # Chờ process bằng eventlet.sleep: process.join() chặn cả hub eventlet của server
+            deadline = time.time() + timeout
+            while self.process.is_alive() and time.time() < deadline: eventlet.sleep(0.05)
+            if self.process.is_alive(): self.process.terminate()
+        self.frames.close()
+        self.results.close()
+        self.unlink()
+
+    def unlink(self):
+        """Xoá tên ring khỏi hệ thống (mapping đang mở vẫn dùng được tới khi close)"""
+        _LIVE.discard(self)
+        self.frames.unlink()
+        self.results.unlink()
+
+
+@atexit.register
+def unlink_all():
+    """Unlink ring của mọi pipeline chưa dừng hẳn (server thoát giữa chừng)"""
+    for p in list(_LIVE): p.unlink()
+
+
+def parse_cameras(config) -> list:
+    """Danh sách camera hợp lệ (tên duy nhất, đúng CAM_NAME_RE) từ config"""
+    cams, seen = [], set()
+    for cam in config.get('cameras') or []:
+        name = str(cam.get('name', ''))
+        if not CAM_NAME_RE.match(name) or name in seen:
+            print(f"Skipping camera with invalid/duplicate name: '{name}'")
+            continue
+        seen.add(name)
+        cams.append({**cam, "name": name})
+    return cams
+
+
+def camera_config(config, cam, first: bool) -> dict:
+    """Config engine của một camera: config chung + khóa riêng của camera"""
+    out = {k: v for k, v in config.items() if k not in ('cameras', 'logging')}
+    if not first: out['biopac'] = None
+    out.update({k: v for k, v in cam.items() if k not in CAMERA_KEYS})
+    return out
+
+
+class PipelineManager(threading.Thread):
+    """Chạy các CameraPipeline, phát kết quả qua `result_callback` và frame (có overlay) qua broadcaster"""
+
+    def __init__(self, config, result_callback, broadcaster=None):
+        super().__init__(daemon=True)
+        self.config = config
+        self.result_callback = result_callback
+        self.broadcaster = broadcaster or FrameBroadcaster()
+        self.encoder = StreamEncoder(self.broadcaster)
+        self.stop_event = threading.Event()
+        self.pipelines = {}
+        for i, cam in enumerate(parse_cameras(config)):
+            try:
+                self.pipelines[cam['name']] = CameraPipeline(cam, camera_config(config, cam, i == 0),
+                                                             logging=bool(config.get('logging', False)))
+            except Exception as e:
+                print(f"Error creating pipeline {cam['name']}: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        return [p.status() for p in self.pipelines.values()]
+
+    def update_logging(self, enabled: bool):
+        for p in self.pipelines.values(): p.update_logging(enabled)
+
+    def analytics(self) -> dict:
+        """Phiên đang ghi của từng camera -> {"pending", "live"} (từ process con, cập nhật mỗi giây)"""
+        return {p.analytics["session"]: p.analytics for p in self.pipelines.values() if p.analytics}
+
+    def run(self):
+        print(f"Starting {len(self.pipelines)} camera pipeline(s)...")
+        try:
+            for p in self.pipelines.values(): p.start()
+            self.encoder.start()
+            mark = time.time()
+            while not self.stop_event.is_set():
+                updates = {}
+                for name, p in self.pipelines.items():
+                    if p.poll_results():
+                        updates[f"pipe:{name}"] = p.data
+                        updates[f"pipe:{name}:status"] = p.state
+                    if not self.encoder.wants(name): continue
+                    frame = p.latest_frame()
+                    if frame is None: continue
+                    raw = self.encoder.wants(name, overlay=False)
+                    if raw: self.encoder.submit(name, PreparedFrame(frame, p.frame_seq), p.frame_seq, overlay=False)
+                    if not self.encoder.wants(name, overlay=True): continue
+                    # latest_frame đã là bản copy; chỉ copy thêm khi frame gốc cũng đang được stream
+                    disp = frame.copy() if raw else frame
+                    with REGISTRY.time("stage_seconds", stage="overlay", target=name):
+                        draw_tilt_gaze(disp, p.data.get('tilt') or {}, p.data.get('gaze') or {})
+                        draw_posture(disp, p.data.get('posture') or {})
+                    self.encoder.submit(name, disp, p.frame_seq)
+                if updates: self.result_callback(updates)
+
+                now = time.time()
+                if now - mark >= 1.0:
+                    mark = now
+                    for name, p in self.pipelines.items():
+                        REGISTRY.set("camera_fps", p.state.get("fps", 0.0), cam=name)
+                eventlet.sleep(0.01)
+        except Exception as e:
+            print(f"Pipeline manager crash: {e}")
+        finally:
+            self.encoder.stop()
+            # Báo dừng tất cả trước rồi mới chờ từng process: các camera dừng song song
+            for p in self.pipelines.values(): p.stop_event.set()
+            for p in self.pipelines.values(): p.stop()
+            print("Camera pipelines stopped")
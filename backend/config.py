@@ -5,5 +5,121 @@ WEBCAM_HEIGHT = 720
 YOLO_CONFIDENCE = 0.25
 GAZE_DEVICE = "cpu"
 
+# Backend cho model YOLO: "torch" (ultralytics/yolov5) hoặc "onnx" (ONNX Runtime CPU, export .pt một lần
+# và cache trong ONNX_CACHE_DIR). ONNX_QUANTIZE = lượng tử hóa động int8; ONNX_THREADS = 0 -> nửa số CPU.
+DETECTOR_BACKEND = "torch"
+ONNX_QUANTIZE = False
+ONNX_THREADS = 0
+ONNX_IMGSZ = 640
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(__file__), "onnx_cache")
+
+# Capture: mỗi camera đọc trên thread riêng, chỉ giữ frame mới nhất
+THREADED_CAPTURE = True
+IP_RECONNECT_BACKOFF_MIN = 0.5
+IP_RECONNECT_BACKOFF_MAX = 10.0
+
+# Nhiều camera: mỗi camera chạy trong process riêng (xem camera_pipeline.py), frame/kết quả trao đổi qua
+# ring shared memory PIPELINE_RING_SLOTS ô; kết quả JSON tối đa PIPELINE_RESULT_BYTES. Đặt CAMERA_PIPELINES
+# (cùng dạng event start_pipelines: {"cameras": [...], "tilt_model": ...}) để chạy ngay khi server khởi động.
+CAMERA_PIPELINES = None
+PIPELINE_RING_SLOTS = 4
+PIPELINE_RESULT_BYTES = 65536
+
+# Inference: "thread" (OS thread mỗi model) hoặc "process" (process mỗi model)
+INFERENCE_MODE = "thread"
+
+# Batch: worker gom tối đa INFER_MAX_BATCH frame đang chờ (từ nhiều camera/phiên) vào một lần predict,
+# chờ thêm tối đa INFER_BATCH_WINDOW_MS (0 = chỉ gom frame đã có sẵn, không tăng độ trễ)
+INFER_MAX_BATCH = 4
+INFER_BATCH_WINDOW_MS = 0
+
+# ROI: tilt/gaze trên camera cận cảnh chạy trên vùng crop quanh mặt, mất dấu thì quay lại full-frame
+ROI_TRACKING = True
+ROI_PADDING = 0.35
+ROI_MIN_SIZE = 192
+
+# Gaze hai tầng ('gaze_two_tier'): FaceMesh chỉ chạy mỗi GAZE_FULL_INTERVAL_S giây để định vị mắt, các frame
+# ở giữa ước lượng EAR / mống mắt trên hai vùng mắt nhỏ (eye_tracker.py) nên gaze chạy tới GAZE_FAST_HZ.
+# Chớp mắt: nhắm khi EAR < 0.15, mở lại khi EAR > BLINK_OPEN_EAR; chỉ tính lần nhắm dài BLINK_MIN_MS..BLINK_MAX_MS.
+GAZE_TWO_TIER = False
+GAZE_FULL_INTERVAL_S = 0.5
+GAZE_FAST_HZ = 30
+BLINK_OPEN_EAR = 0.18
+BLINK_MIN_MS = 30
+BLINK_MAX_MS = 1000
+
+# Log phiên: "csv", "rec" (numpy record, đọc bằng session_logger.load_records), "parquet" (cần pyarrow).
+# LOG_DEDUP bỏ qua các mẫu không đổi so với mẫu trước.
+LOG_FORMATS = ("csv", "rec")
+LOG_DEDUP = True
+
+# Ghi frame thô (JPEG segment + chỉ mục) cạnh log để playback: bật bằng 'record_frames' khi ghi log.
+# Giới hạn RECORD_FPS mỗi camera, RECORD_WIDTH = 0 giữ nguyên độ phân giải.
+RECORD_FRAMES = False
+RECORD_FPS = 15
+RECORD_WIDTH = 0
+RECORD_JPEG_QUALITY = 80
+RECORD_SEGMENT_SECONDS = 60
+
+# Thống kê phiên: rollup mỗi ANALYTICS_BUCKET_SECONDS giây ra analytics.jsonl, cửa sổ trượt cho UI,
+# khoảng cách tối đa giữa hai mẫu được tính thời gian (engine dừng/lag không bị cộng dồn).
+ANALYTICS_BUCKET_SECONDS = 60
+ANALYTICS_WINDOW_SECONDS = 60
+ANALYTICS_MAX_GAP = 1.0
+
+# Telemetry Socket.IO: số lần gửi mỗi giây (chỉ gửi channel thay đổi); ghi đè bằng 'telemetry_hz'
+TELEMETRY_RATE_HZ = 15
+# Channel trạng thái (scheduler, ROI, motion, tuổi frame) đổi mỗi vòng lặp: chỉ gửi bấy nhiêu lần/giây
+TELEMETRY_STATUS_HZ = 1.0
+
+# Metrics: chu kỳ (giây) gửi event 'stats' cho client đã 'subscribe_stats' (route /metrics luôn bật)
+STATS_INTERVAL = 2.0
+
+# Model registry: số model (worker) không còn engine dùng vẫn được giữ sẵn để restart nhanh (LRU).
+# PRELOAD_MODELS: config dạng start_processing (tilt_model, posture_model, use_gaze...) để load nền
+# khi server khởi động, None = không preload.
+MODEL_CACHE_SIZE = 3
+PRELOAD_MODELS = None
+
+# Scheduler: tần suất mục tiêu (Hz), tối thiểu khi quá tải và độ ưu tiên từng detector.
+# Ghi đè được qua key 'schedule' / 'latency_budget_ms' / 'inference_capacity' của start_processing.
+SCHEDULE = {
+    "tilt": {"hz": 15, "min_hz": 2, "priority": 2},
+    "gaze": {"hz": 10, "min_hz": 2, "priority": 2},
+    "posture": {"hz": 10, "min_hz": 1, "priority": 1},
+}
+LATENCY_BUDGET_MS = 150
+INFERENCE_CAPACITY = max(1, (os.cpu_count() or 2) // 2)
+
+# Motion gating: bỏ qua inference khi vùng ảnh (ROI) của detector gần như không đổi so với lần chạy trước,
+# bắt buộc chạy lại sau MOTION_MAX_STALE_S giây. MOTION_GATE = tỉ lệ pixel thay đổi (lệch > MOTION_PIXEL_DELTA
+# trên ảnh xám rộng MOTION_THUMB_WIDTH px) tối thiểu để chạy lại; gaze nhạy hơn để không lỡ chớp mắt.
+MOTION_GATING = False
+MOTION_GATE = {"tilt": 0.01, "gaze": 0.002, "posture": 0.01}
+MOTION_MAX_STALE_S = 2.0
+MOTION_THUMB_WIDTH = 64
+MOTION_PIXEL_DELTA = 12
+
+# BIOPAC (xem biopac.py): None = không có tín hiệu (payload biopac = 0). Ví dụ
+# {"type": "synthetic", "channels": ["ECG", "EDA"], "rate": 2000}, {"type": "file", "path": "rec.csv", "rate": 1000},
+# {"type": "socket", "host": "127.0.0.1", "port": 15010, "channels": ["ECG"], "rate": 2000}. Ghi đè bằng 'biopac'.
+# UI nhận BIOPAC_WINDOW_SECONDS giây gần nhất rút còn BIOPAC_POINTS điểm/kênh ("minmax" hoặc "lttb"),
+# tính lại tối đa BIOPAC_UPDATE_HZ lần/giây; ring giữ BIOPAC_BUFFER_SECONDS giây mẫu thô.
+BIOPAC_SOURCE = None
+BIOPAC_BUFFER_SECONDS = 60
+BIOPAC_WINDOW_SECONDS = 10
+BIOPAC_POINTS = 300
+BIOPAC_DECIMATION = "minmax"
+BIOPAC_UPDATE_HZ = 10
+
+# MJPEG stream: FPS tối đa mỗi client (ghi đè bằng ?fps=), độ rộng preview (?w=, 0 = full)
+# và chất lượng JPEG (?q=). Chỉ encode các profile đang có client xem.
+# STREAM_OVERLAY = False (hoặc ?overlay=0): gửi frame gốc kèm header X-Frame-Seq, client tự vẽ overlay từ
+# telemetry; camera kiểu "MJPEG" (HTTP multipart) được chuyển thẳng JPEG gốc khi ?w=0.
+STREAM_MAX_FPS = 30
+STREAM_WIDTH = 640
+STREAM_JPEG_QUALITY = 75
+STREAM_OVERLAY = True
+
 EXPORT_BASE_DIR = os.path.join(os.path.dirname(__file__), "exports")
 os.makedirs(EXPORT_BASE_DIR, exist_ok=True)
\ No newline at end of file
@@ -1,32 +1,49 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
 import cv2
 import numpy as np
-import torch
 from config import YOLO_CONFIDENCE
+from lazy_imports import timed_import
+from frame_cache import unpack, to_source
 
-# Patch torch load
-_original_torch_load = torch.load
-def torch_load_compat(*args, **kwargs):
-    if "weights_only" not in kwargs: kwargs["weights_only"] = False
-    return _original_torch_load(*args, **kwargs)
-torch.load = torch_load_compat
-
-# Import Ultralytics
-try:
-    from ultralytics import YOLO as UltralyticsYOLO
-except ImportError:
-    UltralyticsYOLO = None
-    print("WARNING: 'ultralytics' not installed. Tilt detection will fail.")
-
-# Import Yolov5
-try:
-    import yolov5
-except ImportError:
-    yolov5 = None
-    print("WARNING: 'yolov5' not installed. Posture detection will fail.")
+# torch / ultralytics / yolov5 chỉ được import khi tạo detector cần đến
+
+
+def _load_torch():
+    import torch
+
+    # Patch torch load
+    if not getattr(torch.load, "_compat", False):
+        _original_torch_load = torch.load
+
+        def torch_load_compat(*args, **kwargs):
+            if "weights_only" not in kwargs: kwargs["weights_only"] = False
+            return _original_torch_load(*args, **kwargs)
+        torch_load_compat._compat = True
+        torch.load = torch_load_compat
+    return torch
+
+
+def _ultralytics_yolo():
+    if timed_import("torch", _load_torch) is None: return None
+    def load():
+        from ultralytics import YOLO
+        return YOLO
+    return timed_import("ultralytics", load)
+
+
+def _yolov5():
+    if timed_import("torch", _load_torch) is None: return None
+    def load():
+        import yolov5
+        return yolov5
+    return timed_import("yolov5", load)
 
 class TiltDetector:
+    # Đầu vào lấy từ frame_cache: ảnh BGR cạnh dài 640 (ultralytics chỉ còn pad, không resize lại)
+    PREPROCESS = {"size": 640}
+
     def __init__(self, model_path: str, conf_thres: float = YOLO_CONFIDENCE):
+        UltralyticsYOLO = _ultralytics_yolo()
         if UltralyticsYOLO is None: raise RuntimeError("Chưa cài ultralytics")
         print(f"Initializing YOLOv8 with: {model_path}")
         try:
@@ -36,11 +53,25 @@ class TiltDetector:
             raise RuntimeError(f"Failed to load YOLOv8 model: {e}")
 
     def infer(self, frame_bgr) -> Dict[str, Any]:
+        """frame_bgr: frame BGR hoặc frame_cache.ModelInput"""
         if frame_bgr is None: return {}
-        results = self.model.predict(frame_bgr, verbose=False, conf=self.conf_thres)
+        img, scale, pad, _ = unpack(frame_bgr)
+        results = self.model.predict(img, verbose=False, conf=self.conf_thres)
         if not results: return {}
+        return self._parse(results[0], scale, pad)
+
+    def infer_batch(self, frames_bgr: List[Any]) -> List[Dict[str, Any]]:
+        """Một lần predict cho nhiều frame, kết quả trả về theo đúng thứ tự frame"""
+        valid = [i for i, f in enumerate(frames_bgr) if f is not None]
+        out = [{} for _ in frames_bgr]
+        if not valid: return out
+        inputs = [unpack(frames_bgr[i]) for i in valid]
+        results = self.model.predict([m[0] for m in inputs], verbose=False, conf=self.conf_thres)
+        for i, m, r in zip(valid, inputs, results):
+            out[i] = self._parse(r, m[1], m[2])
+        return out
 
-        r = results[0]
+    def _parse(self, r, scale: float = 1.0, pad=(0, 0)) -> Dict[str, Any]:
         label, conf, keypoints = None, None, None
 
         if r.boxes and len(r.boxes) > 0:
@@ -51,13 +82,17 @@ class TiltDetector:
 
         if r.keypoints is not None and r.keypoints.xy is not None and len(r.keypoints.xy) > 0:
             kpts = r.keypoints.xy[0].cpu().numpy()
-            limited_kpts = kpts[:7]
+            limited_kpts = to_source(kpts[:7], scale, pad)
             keypoints = [(float(x), float(y)) for x, y in limited_kpts]
 
         return {"label": label, "confidence": conf, "keypoints": keypoints}
 
 class PostureDetector:
+    # yolov5 AutoShape nhận RGB; ảnh 640 từ frame_cache nên không phải cvtColor / resize lại
+    PREPROCESS = {"size": 640, "rgb": True}
+
     def __init__(self, model_path: str, conf_thres: float = YOLO_CONFIDENCE):
+        yolov5 = _yolov5()
         if yolov5 is None: raise RuntimeError("Chưa cài yolov5")
         print(f"Initializing YOLOv5 with: {model_path}")
         try:
@@ -66,15 +101,36 @@ class PostureDetector:
         except Exception as e:
             raise RuntimeError(f"Failed to load YOLOv5 model: {e}")
 
+    @staticmethod
+    def _rgb(frame):
+        img, scale, pad, rgb = unpack(frame)
+        return (img if rgb else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)), scale, pad
+
     def infer(self, frame_bgr) -> Dict[str, Any]:
+        """frame_bgr: frame BGR hoặc frame_cache.ModelInput"""
         if frame_bgr is None: return {}
-        img_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        img_rgb, scale, pad = self._rgb(frame_bgr)
         results = self.model(img_rgb, size=640)
+        return self._parse(results, 0, scale, pad)
+
+    def infer_batch(self, frames_bgr: List[Any]) -> List[Dict[str, Any]]:
+        """Một lần forward cho nhiều frame, kết quả trả về theo đúng thứ tự frame"""
+        valid = [i for i, f in enumerate(frames_bgr) if f is not None]
+        out = [{} for _ in frames_bgr]
+        if not valid: return out
+        inputs = [self._rgb(frames_bgr[i]) for i in valid]
+        results = self.model([m[0] for m in inputs], size=640)
+        for j, (i, m) in enumerate(zip(valid, inputs)):
+            out[i] = self._parse(results, j, m[1], m[2])
+        return out
 
-        if len(results.xywh[0]) == 0: return {}
+    def _parse(self, results, idx: int, scale: float = 1.0, pad=(0, 0)) -> Dict[str, Any]:
+        if len(results.xywh[idx]) == 0: return {}
 
-        det = results.xywh[0][0]
+        det = results.xywh[idx][0]
         x_c, y_c, w, h, conf, cls = det.tolist()
         label = results.names[int(cls)]
 
-        return {"label": label, "confidence": float(conf), "bbox": (float(x_c), float(y_c), float(w), float(h))}
\ No newline at end of file
+        return {"label": label, "confidence": float(conf),
+                "bbox": (float((x_c - pad[0]) / scale), float((y_c - pad[1]) / scale), float(w / scale),
+                         float(h / scale))}
\ No newline at end of file
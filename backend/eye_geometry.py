@@ -0,0 +1,102 @@
+"""Hình học mắt (EAR, gaze ratio) dạng vector hóa trên các landmark FaceMesh.
+
+Chỉ lấy các landmark cần dùng (mắt, mống mắt, 4 điểm viền mặt) thay vì toàn bộ
+478 điểm. Mọi hàm nhận mảng có thể có thêm chiều batch ở đầu: (..., N_POINTS, 2).
+"""
+import numpy as np
+
+# MediaPipe Face Mesh Constants
+LEFT_EYE = [362, 385, 387, 263, 373, 380]
+RIGHT_EYE = [33, 160, 158, 133, 153, 144]
+LEFT_IRIS = [474, 475, 476, 477]
+RIGHT_IRIS = [469, 470, 471, 472]
+FACE_EXTENT = [10, 152, 234, 454]  # trán, cằm, má trái, má phải
+
+# Thứ tự các điểm trong mảng đã gom
+EYE_INDICES = LEFT_EYE + RIGHT_EYE + LEFT_IRIS + RIGHT_IRIS + FACE_EXTENT
+N_POINTS = len(EYE_INDICES)
+_EYES = slice(0, 12)
+_IRISES = slice(12, 20)
+_FACE = slice(20, 24)
+
+BLINK_EAR = 0.15
+GAZE_RIGHT = 0.45
+GAZE_LEFT = 0.55
+
+
+def extract_points(landmarks, w: int, h: int) -> np.ndarray:
+    """Gom đúng N_POINTS landmark cần dùng sang pixel, shape (N_POINTS, 2)"""
+    pts = np.array([(landmarks[i].x, landmarks[i].y) for i in EYE_INDICES], dtype=np.float32)
+    pts *= (w, h)
+    return pts
+
+
+def gather(mesh_points: np.ndarray) -> np.ndarray:
+    """Lấy các điểm cần dùng từ mảng landmark đầy đủ (..., 478, 2)"""
+    return mesh_points[..., EYE_INDICES, :]
+
+
+def _dist(a, b):
+    return np.linalg.norm(a - b, axis=-1)
+
+
+def eye_landmarks(points: np.ndarray) -> np.ndarray:
+    """6 điểm viền của mỗi mắt [trái, phải], shape (..., 2, 6, 2); điểm 0 và 3 là hai khóe mắt"""
+    return points[..., _EYES, :].reshape(points.shape[:-2] + (2, 6, 2))
+
+
+def iris_circles(points: np.ndarray):
+    """Tâm (..., 2, 2) và bán kính (..., 2) mống mắt [trái, phải]"""
+    iris = points[..., _IRISES, :].reshape(points.shape[:-2] + (2, 4, 2))
+    centers = iris.mean(axis=-2)
+    radius = _dist(iris, centers[..., None, :]).mean(axis=-1)
+    return centers, radius
+
+
+def eye_aspect_ratios(points: np.ndarray) -> np.ndarray:
+    """EAR của hai mắt cùng lúc, shape (..., 2)"""
+    eyes = eye_landmarks(points)
+    p1, p2, p3, p4, p5, p6 = (eyes[..., i, :] for i in range(6))
+    ear_v = (_dist(p2, p6) + _dist(p3, p5)) / 2.0
+    ear_h = _dist(p1, p4)
+    return ear_v / (ear_h + 1e-6)
+
+
+def gaze_ratios(points: np.ndarray, centers: np.ndarray = None) -> np.ndarray:
+    """Khoảng cách tâm mống mắt tới khóe trong / độ rộng mắt, shape (..., 2)"""
+    if centers is None: centers, _ = iris_circles(points)
+    eyes = eye_landmarks(points)
+    inner, outer = eyes[..., 0, :], eyes[..., 3, :]
+    width = _dist(inner, outer)
+    ratio = _dist(centers, inner) / np.where(width == 0, 1.0, width)
+    return np.where(width == 0, 0.5, ratio)
+
+
+def face_box(points: np.ndarray) -> np.ndarray:
+    """(x0, y0, x1, y1) bao quanh mặt từ 4 điểm viền, shape (..., 4)"""
+    face = points[..., _FACE, :]
+    return np.concatenate([face.min(axis=-2), face.max(axis=-2)], axis=-1)
+
+
+def classify(avg_ear, avg_gaze):
+    """Nhãn blinking / right / left / center; hoạt động trên scalar lẫn mảng"""
+    return np.where(avg_ear < BLINK_EAR, "blinking",
+                    np.where(avg_gaze < GAZE_RIGHT, "right",
+                             np.where(avg_gaze > GAZE_LEFT, "left", "center")))
+
+
+def analyze(points: np.ndarray):
+    """Tính toàn bộ đặc trưng cho một hoặc nhiều bộ điểm (..., N_POINTS, 2)"""
+    centers, radius = iris_circles(points)
+    ear = eye_aspect_ratios(points)
+    gaze = gaze_ratios(points, centers)
+    avg_ear, avg_gaze = ear.mean(axis=-1), gaze.mean(axis=-1)
+    return {
+        "ear": ear,
+        "gaze": gaze,
+        "label": classify(avg_ear, avg_gaze),
+        "blink": avg_ear < BLINK_EAR,
+        "centers": centers,
+        "radius": radius,
+        "face_box": face_box(points),
+    }
@@ -0,0 +1,177 @@
+"""Theo dõi mắt theo thời gian giữa các lần FaceMesh và phát hiện chớp mắt.
+
+- EyePatchTracker: fast path mỗi frame trên hai vùng mắt nhỏ. Vị trí mắt bám bằng
+  template matching (template lấy ở lần FaceMesh gần nhất), độ mở mắt ước lượng
+  theo diện tích vùng tối (mống mắt/đồng tử) so với lúc hiệu chỉnh, tâm mống mắt
+  là trọng tâm vùng tối. Mỗi lần FaceMesh chạy lại thì hiệu chỉnh lại (`reset`).
+- BlinkDetector: chuỗi EAR theo thời gian -> sự kiện {onset, duration} có hysteresis.
+"""
+import collections
+
+import cv2
+import numpy as np
+
+import eye_geometry
+from eye_geometry import BLINK_EAR
+
+
+class EyePatchTracker:
+    """Bám hai vùng mắt giữa các lần FaceMesh; `track` rẻ (vài crop nhỏ), `reset` sau mỗi lần FaceMesh.
+
+    Dịch chuyển đầu đo bằng template của cả vùng lông mày - hai mắt (nửa độ phân giải) đã che phần
+    khe mắt, để mống mắt liếc hay mí mắt khép không bị hiểu nhầm là đầu di chuyển; vùng từng mắt dịch theo đó.
+    """
+
+    def __init__(self, margin: float = 0.35, min_score: float = 0.9, max_weak: int = 15):
+        self.margin = margin        # vùng tìm kiếm nới thêm (theo độ rộng mắt) mỗi phía
+        self.min_score = min_score  # điểm khớp template tối thiểu để cập nhật dịch chuyển
+        self.max_weak = max_weak    # số frame khớp kém liên tiếp trước khi coi là mất dấu
+        self.eyes = None
+        self.face = None            # (box, template nửa độ phân giải, mask bỏ khe mắt)
+        self.shift = (0, 0)
+        self.weak = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.eyes is not None
+
+    def lose(self):
+        self.eyes = self.face = None
+        self.weak = 0
+
+    def reset(self, frame, points, ear):
+        """Hiệu chỉnh từ kết quả FaceMesh (points theo eye_geometry, toạ độ frame)"""
+        h, w = frame.shape[:2]
+        eyes = eye_geometry.eye_landmarks(points)
+        centers, radius = eye_geometry.iris_circles(points)
+        new = []
+        for k in range(2):
+            inner, outer = eyes[k, 0], eyes[k, 3]
+            width = float(np.linalg.norm(outer - inner))
+            if width < 6: return self.lose()
+            cx, cy = eyes[k].mean(axis=0)
+            box = _clip_box(cx - 0.75 * width, cy - 0.45 * width, cx + 0.75 * width, cy + 0.45 * width, w, h)
+            if box is None: return self.lose()
+            x0, y0, x1, y1 = box
+            gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            eye = {"box": box, "inner": inner - (x0, y0), "width": width}
+            old = self.eyes[k] if self.eyes else None
+            if ear[k] >= BLINK_EAR * 1.2:
+                # Mắt đang mở: ngưỡng tối = giữa độ sáng trong mống mắt và phần còn lại của vùng mắt
+                mask = np.zeros_like(gray)
+                ic = centers[k] - (x0, y0)
+                cv2.circle(mask, (int(ic[0]), int(ic[1])), max(2, int(radius[k])), 255, -1)
+                inside = gray[mask > 0]
+                outside = gray[mask == 0]
+                if not len(inside) or not len(outside): return self.lose()
+                thr = (float(inside.mean()) + float(outside.mean())) / 2.0
+                area = int(np.count_nonzero(gray < thr))
+                if area < 4: return self.lose()
+                eye.update(thr=thr, area0=area, ear0=float(ear[k]))
+            elif old:
+                # FaceMesh chạy đúng lúc đang nhắm: giữ hiệu chỉnh của lần mở mắt trước
+                eye.update(thr=old["thr"], area0=old["area0"], ear0=old["ear0"])
+            else:
+                return self.lose()
+            new.append(eye)
+
+        width = max(e["width"] for e in new)
+        fbox = _clip_box(min(e["box"][0] for e in new) - 0.3 * width, min(e["box"][1] for e in new) - 0.6 * width,
+                         max(e["box"][2] for e in new) + 0.3 * width, max(e["box"][3] for e in new) + 0.2 * width, w, h)
+        if fbox is None: return self.lose()
+        x0, y0, x1, y1 = fbox
+        tpl = _half(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY))
+        mask = np.full_like(tpl, 255)
+        for k in range(2):
+            cv2.fillConvexPoly(mask, np.round((eyes[k] - (x0, y0)) / 2).astype(np.int32), 0)
+        self.face = (fbox, tpl, mask)
+        self.eyes = new
+        self.shift = (0, 0)
+        self.weak = 0
+
+    def track(self, frame):
+        """{"ear": (2,), "gaze": (2,), "centers": [(x, y) | None] * 2, "shift": (dx, dy)} hoặc None khi mất dấu.
+        `shift` là dịch chuyển (px) so với lần FaceMesh gần nhất"""
+        if self.eyes is None: return None
+        h, w = frame.shape[:2]
+        (x0, y0, x1, y1), tpl, mask = self.face
+        m = int(self.margin * self.eyes[0]["width"]) + 2
+        dx, dy = self.shift
+        sx0, sy0 = max(0, x0 + dx - m), max(0, y0 + dy - m)
+        sx1, sy1 = min(w, x1 + dx + m), min(h, y1 + dy + m)
+        gray = cv2.cvtColor(frame[sy0:sy1, sx0:sx1], cv2.COLOR_BGR2GRAY)
+        search = _half(gray)
+        if search.shape[0] < tpl.shape[0] or search.shape[1] < tpl.shape[1]: return self.lose()
+        _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(search, tpl, cv2.TM_CCORR_NORMED, mask=mask))
+        if score >= self.min_score:
+            self.shift = (sx0 + 2 * loc[0] - x0, sy0 + 2 * loc[1] - y0)
+            self.weak = 0
+        else:
+            # Khớp kém (che mặt, quay đầu): giữ dịch chuyển cũ, quá max_weak frame thì chờ FaceMesh
+            self.weak += 1
+            if self.weak > self.max_weak: return self.lose()
+        dx, dy = self.shift
+
+        ears, gazes, centers = [], [], []
+        for eye in self.eyes:
+            bx0, by0, bx1, by1 = eye["box"]
+            bx0, by0, bx1, by1 = bx0 + dx - sx0, by0 + dy - sy0, bx1 + dx - sx0, by1 + dy - sy0
+            patch = gray[max(0, by0):max(0, by1), max(0, bx0):max(0, bx1)]
+            dark = (patch < eye["thr"]).astype(np.uint8)
+            area = int(dark.sum())
+            ears.append(eye["ear0"] * min(1.5, area / eye["area0"]))
+            mom = cv2.moments(dark, binaryImage=True)
+            if area >= 0.25 * eye["area0"] and mom["m00"] > 0:
+                cx, cy = mom["m10"] / mom["m00"] + max(0, bx0), mom["m01"] / mom["m00"] + max(0, by0)
+                ix, iy = eye["inner"][0] + bx0, eye["inner"][1] + by0
+                gazes.append(float(np.hypot(cx - ix, cy - iy)) / eye["width"])
+                centers.append((sx0 + cx, sy0 + cy))
+            else:
+                gazes.append(0.5)
+                centers.append(None)
+        return {"ear": np.array(ears), "gaze": np.array(gazes), "centers": centers, "shift": (dx, dy)}
+
+
+def _half(gray):
+    return cv2.resize(gray, (max(1, gray.shape[1] // 2), max(1, gray.shape[0] // 2)), interpolation=cv2.INTER_AREA)
+
+
+def _clip_box(x0, y0, x1, y1, w, h):
+    x0, y0, x1, y1 = int(max(0, x0)), int(max(0, y0)), int(min(w, x1)), int(min(h, y1))
+    return (x0, y0, x1, y1) if x1 - x0 > 4 and y1 - y0 > 4 else None
+
+
+class BlinkDetector:
+    """Sự kiện chớp mắt từ EAR theo thời gian thực của frame.
+
+    Nhắm khi EAR < close_ear, mở lại khi EAR > open_ear (hysteresis chống rung).
+    Lần nhắm dài hơn max_duration (nhắm mắt, cúi mặt) hoặc ngắn hơn min_duration
+    (nhiễu một frame ở FPS cao) không tính là chớp mắt.
+    """
+
+    def __init__(self, close_ear: float = BLINK_EAR, open_ear: float = 0.18, min_duration: float = 0.03,
+                 max_duration: float = 1.0, keep: int = 20):
+        self.close_ear = close_ear
+        self.open_ear = open_ear
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.closed_at = None
+        self.count = 0
+        self.events = collections.deque(maxlen=keep)
+
+    def update(self, ear, ts: float):
+        """EAR (None = không thấy mặt) tại thời điểm chụp `ts`; trả về sự kiện vừa kết thúc hoặc None"""
+        if ear is None:
+            self.closed_at = None
+            return None
+        if self.closed_at is None:
+            if ear < self.close_ear: self.closed_at = ts
+            return None
+        if ear <= self.open_ear: return None
+        duration, onset = ts - self.closed_at, self.closed_at
+        self.closed_at = None
+        if not self.min_duration <= duration <= self.max_duration: return None
+        event = {"onset": round(onset, 3), "duration": round(duration, 3)}
+        self.events.append(event)
+        self.count += 1
+        return event
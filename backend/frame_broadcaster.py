@@ -0,0 +1,56 @@
+import collections
+import threading
+
+
+class FrameBroadcaster:
+    """Phát mỗi frame JPEG đã encode đúng một lần cho mọi client MJPEG.
+
+    Engine gọi `publish`; mỗi client chờ bằng `wait_for` và chỉ nhận frame có
+    seq mới hơn frame nó đã gửi. Client chậm không bị dồn hàng đợi: khi rảnh
+    nó lấy luôn frame mới nhất, các frame ở giữa bị bỏ qua.
+
+    Dùng `threading` thông thường (green dưới eventlet.monkey_patch), nên chỉ
+    được publish từ green thread (engine), không phải từ native_threads.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frames = {}
+        self.subscribers = collections.Counter()
+
+    def publish(self, stream, jpeg: bytes, frame_seq: int = 0, source_width: int = 0) -> int:
+        """`frame_seq` = số thứ tự frame camera, `source_width` = độ rộng frame trước khi thu nhỏ;
+        gửi kèm cho client (X-Frame-Seq, X-Source-Width) để vẽ overlay đúng frame, đúng tỉ lệ"""
+        with self.cond:
+            seq = self.frames[stream][0] + 1 if stream in self.frames else 1
+            self.frames[stream] = (seq, jpeg, frame_seq, source_width)
+            self.cond.notify_all()
+        return seq
+
+    def latest(self, stream):
+        item = self.frames.get(stream)
+        return item[1] if item else None
+
+    def wait_for(self, stream, after_seq: int = 0, timeout: float = 1.0):
+        """Chờ frame có seq > after_seq; trả về (seq, jpeg, frame_seq, source_width) hoặc None khi hết timeout"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frames.get(stream, (0,))[0] > after_seq, timeout)
+            item = self.frames.get(stream)
+            if item and item[0] > after_seq: return item
+        return None
+
+    def subscribe(self, stream):
+        with self.cond:
+            self.subscribers[stream] += 1
+
+    def unsubscribe(self, stream):
+        with self.cond:
+            self.subscribers[stream] -= 1
+            if self.subscribers[stream] <= 0: del self.subscribers[stream]
+
+    def subscriber_count(self, stream) -> int:
+        return self.subscribers.get(stream, 0)
+
+    def active_streams(self):
+        """Các stream đang có ít nhất một client"""
+        return list(self.subscribers)
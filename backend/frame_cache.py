@@ -0,0 +1,131 @@
+"""Tiền xử lý dùng chung cho mỗi frame: detector, encoder, motion gate và recorder cùng lấy từ đây.
+
+`PreparedFrame` bọc một frame BGR và tính lười, tối đa một lần cho mỗi frame (an toàn giữa các thread):
+- `level(k)`: kim tự tháp preview, mỗi tầng nhỏ một nửa tầng trước (INTER_AREA);
+- `resized(width)`: preview rộng bất kỳ, resize từ tầng nhỏ nhất còn rộng hơn;
+- `region(box, min_width)`: vùng box trên tầng nhỏ nhất còn rộng >= min_width px (motion gate);
+- `model_input(spec, box)`: đầu vào model (thu nhỏ, RGB, letterbox) theo `PREPROCESS` của detector.
+Ảnh dẫn xuất cấp phát mới cho từng frame: consumer (worker, encoder, recorder) giữ được bao lâu
+cũng được mà không bị frame sau ghi đè.
+"""
+import collections
+
+import cv2
+import numpy as np
+
+from native_threads import threading
+
+# Ảnh đưa vào model: toạ độ trên img = toạ độ gốc * scale + pad. rgb = thứ tự kênh của img
+ModelInput = collections.namedtuple("ModelInput", "img scale pad rgb")
+
+LETTERBOX_COLOR = 114
+
+
+def unpack(frame):
+    """(ảnh, scale, pad, rgb) của đầu vào detector: ModelInput hoặc frame BGR thô"""
+    if isinstance(frame, ModelInput): return frame
+    return frame, 1.0, (0, 0), False
+
+
+def to_source(points, scale, pad):
+    """Đổi toạ độ trên ảnh đầu vào model về toạ độ gốc (mảng (..., 2) hoặc list (x, y))"""
+    if scale == 1.0 and not any(pad): return points
+    return (np.asarray(points, dtype=np.float32) - pad) / scale
+
+
+class PreparedFrame:
+    """Một frame BGR (không copy) + các ảnh dẫn xuất, tính khi có consumer cần lần đầu"""
+
+    def __init__(self, frame, seq: int = 0):
+        self.frame = frame
+        self.seq = seq
+        self.shape = frame.shape
+        self._levels = [frame]
+        self._sized = {}
+        self._inputs = {}
+        self._lock = threading.RLock()
+
+    def level(self, k: int):
+        """Tầng k của kim tự tháp (0 = frame gốc), kích thước giảm một nửa mỗi tầng"""
+        with self._lock:
+            while len(self._levels) <= k:
+                src = self._levels[-1]
+                h, w = src.shape[:2]
+                if h < 2 or w < 2: break
+                self._levels.append(cv2.resize(src, (w // 2, h // 2), interpolation=cv2.INTER_AREA))
+            return self._levels[min(k, len(self._levels) - 1)]
+
+    def _level_for(self, width: int, full_width: int) -> int:
+        """Tầng nhỏ nhất mà vùng rộng `full_width` px (ở frame gốc) vẫn còn >= width px"""
+        k = 0
+        while width > 0 and (full_width >> (k + 1)) >= width: k += 1
+        return k
+
+    def resized(self, width: int):
+        """Preview giữ tỉ lệ rộng `width` px; 0 hoặc >= độ rộng gốc = frame gốc"""
+        h, w = self.shape[:2]
+        if width <= 0 or width >= w: return self.frame
+        with self._lock:
+            out = self._sized.get(width)
+            if out is not None: return out
+            src = self.level(self._level_for(width, w))
+            if src.shape[1] != width:
+                nh = max(1, int(h * width / w))
+                out = cv2.resize(src, (width, nh), interpolation=cv2.INTER_AREA)
+            else:
+                out = src
+            self._sized[width] = out
+            return out
+
+    def region(self, box=None, min_width: int = 0):
+        """Vùng box (x0, y0, x1, y1 theo frame gốc, None = cả frame) trên tầng nhỏ nhất còn rộng >= min_width"""
+        h, w = self.shape[:2]
+        x0, y0, x1, y1 = box or (0, 0, w, h)
+        k = self._level_for(min_width, x1 - x0)
+        img = self.level(k)
+        sy, sx = h / img.shape[0], w / img.shape[1]
+        y0, y1, x0, x1 = int(y0 / sy), int(y1 / sy), int(x0 / sx), int(x1 / sx)
+        return img[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+
+    def model_input(self, spec, box=None) -> ModelInput:
+        """Đầu vào model theo spec {"size": cạnh dài tối đa (None = giữ nguyên), "rgb": bool,
+        "letterbox": bool (ô vuông size x size)} trên vùng box; cùng spec + box chỉ tính một lần"""
+        key = (spec.get("size"), bool(spec.get("rgb")), bool(spec.get("letterbox")), box)
+        with self._lock:
+            out = self._inputs.get(key)
+            if out is None: out = self._inputs[key] = self._model_input(*key)
+            return out
+
+    def _model_input(self, size, rgb, boxed, box):
+        h, w = self.shape[:2]
+        x0, y0, x1, y1 = box or (0, 0, w, h)
+        bw, bh = x1 - x0, y1 - y0
+        # Như letterbox của YOLO: ô vuông thì phóng to được, còn lại chỉ thu nhỏ
+        scale = size / max(bw, bh) if size and (boxed or max(bw, bh) > size) else 1.0
+        if scale == 1.0:
+            img = self.frame[y0:y1, x0:x1]
+        else:
+            tw, th = max(1, int(round(bw * scale))), max(1, int(round(bh * scale)))
+            src = self.region(box, tw)
+            if src.shape[:2] == (th, tw):
+                img = src
+            else:
+                img = cv2.resize(src, (tw, th), interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+        if rgb: img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        pad = (0, 0)
+        if boxed:
+            ih, iw = img.shape[:2]
+            left, top = (size - iw) // 2, (size - ih) // 2
+            out = np.full((size, size) + self.shape[2:], LETTERBOX_COLOR, dtype=self.frame.dtype)
+            out[top:top + ih, left:left + iw] = img
+            img, pad = out, (left, top)
+        return ModelInput(img, scale, pad, rgb)
+
+
+def resize_to(frame, width: int):
+    """Frame (ndarray hoặc PreparedFrame) thu nhỏ giữ tỉ lệ về `width` px; 0 = giữ nguyên"""
+    if isinstance(frame, PreparedFrame): return frame.resized(width)
+    h, w = frame.shape[:2]
+    if 0 < width < w:
+        frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+    return frame
@@ -1,107 +1,130 @@
+import time
 from typing import Any, Dict
 import cv2
 import numpy as np
-import mediapipe as mp
 
-# MediaPipe Face Mesh Constants
-mp_face_mesh = mp.solutions.face_mesh
-LEFT_EYE = [362, 385, 387, 263, 373, 380]
-RIGHT_EYE = [33, 160, 158, 133, 153, 144]
-LEFT_IRIS = [474, 475, 476, 477]
-RIGHT_IRIS = [469, 470, 471, 472]
+import eye_geometry
+from eye_geometry import LEFT_EYE, RIGHT_EYE, LEFT_IRIS, RIGHT_IRIS
+from eye_tracker import EyePatchTracker
+from roi_tracker import RoiTracker
+from frame_cache import unpack, to_source
+from lazy_imports import timed_import
+from config import GAZE_FULL_INTERVAL_S, ROI_PADDING, ROI_MIN_SIZE
+
+
+def _face_mesh_module():
+    """mediapipe chỉ được import khi tạo GazeEstimator đầu tiên"""
+    def load():
+        import mediapipe as mp
+        return mp.solutions.face_mesh
+    mod = timed_import("mediapipe", load)
+    if mod is None: raise RuntimeError("Chưa cài mediapipe")
+    return mod
 
 
 class GazeEstimator:
-    def __init__(self, device: str = "cpu"):
-        self.face_mesh = mp_face_mesh.FaceMesh(
+    """FaceMesh -> nhãn gaze / chớp mắt.
+
+    two_tier=True: FaceMesh (trên crop quanh mặt) chỉ chạy mỗi `full_interval` giây để định vị
+    mắt, các frame ở giữa đi fast path EyePatchTracker trên hai vùng mắt nhỏ (~1 ms) nên có thể
+    chạy mỗi frame. Khi đó engine phải gửi full-frame BGR thô theo đúng thứ tự (tracker giữ trạng thái).
+    Kết quả có "ear" (trung bình hai mắt, cho BlinkDetector) và "tier" ("full" / "fast").
+    """
+
+    # FaceMesh nhận RGB độ phân giải gốc: frame_cache đổi màu sẵn (chỉ vùng ROI)
+    PREPROCESS = {"rgb": True}
+    # FaceMesh (chế độ video) và tracker hai tầng bám theo frame trước: MODELS cấp worker riêng cho mỗi camera
+    STATEFUL = True
+
+    def __init__(self, device: str = "cpu", two_tier: bool = False, full_interval: float = GAZE_FULL_INTERVAL_S):
+        self.face_mesh = _face_mesh_module().FaceMesh(
             max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
         self._available = True
-
-    def _euclidean_distance(self, point1, point2):
-        return np.linalg.norm(point1 - point2)
-
-    def _get_blink_ratio(self, eye_points, landmarks):
-        p1 = landmarks[eye_points[0]]
-        p2 = landmarks[eye_points[1]]
-        p3 = landmarks[eye_points[2]]
-        p4 = landmarks[eye_points[3]]
-        p5 = landmarks[eye_points[4]]
-        p6 = landmarks[eye_points[5]]
-
-        ear_v = (self._euclidean_distance(p2, p6) + self._euclidean_distance(p3, p5)) / 2.0
-        ear_h = self._euclidean_distance(p1, p4)
-        return ear_v / (ear_h + 1e-6)
-
-    def _get_gaze_ratio(self, eye_points, iris_center, landmarks):
-        inner = landmarks[eye_points[0]]
-        outer = landmarks[eye_points[3]]
-        eye_width = self._euclidean_distance(inner, outer)
-        dist_to_inner = self._euclidean_distance(iris_center, inner)
-        if eye_width == 0: return 0.5
-        return dist_to_inner / eye_width
-
-    def infer(self, frame_bgr) -> Dict[str, Any]:
+        self.two_tier = two_tier
+        self.full_interval = full_interval
+        self.tracker = EyePatchTracker() if two_tier else None
+        self.roi = RoiTracker(pad=ROI_PADDING, min_size=ROI_MIN_SIZE) if two_tier else None
+        self._last_full = 0.0
+        self._face_box = None
+
+    def infer(self, frame_bgr, annotate: bool = False) -> Dict[str, Any]:
+        """annotate=True mới tạo bản copy có vẽ mống mắt (key 'annotated')"""
         if frame_bgr is None: return {"status": "no_frame"}
-
-        h, w = frame_bgr.shape[:2]
-        rgb_frame = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        if not self.two_tier: return self._full(frame_bgr, annotate)
+        if self.tracker.ready and time.monotonic() - self._last_full < self.full_interval:
+            res = self._fast(frame_bgr, annotate)
+            if res is not None: return res
+        return self._full(frame_bgr, annotate)
+
+    def _full(self, frame, annotate):
+        image, scale, pad, is_rgb = unpack(frame)
+        img, (ox, oy) = self.roi.crop(image) if self.roi else (image, (0, 0))
+        h, w = img.shape[:2]
+        rgb_frame = img if is_rgb else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         results = self.face_mesh.process(rgb_frame)
+        annotated = None
+        if annotate: annotated = cv2.cvtColor(image, cv2.COLOR_RGB2BGR) if is_rgb else image.copy()
 
-        label = "unknown"
-        blink = False
-        annotated = frame_bgr.copy()
-        eyes_data = []
-
-        if results.multi_face_landmarks:
-            mesh_points = np.array(
-                [np.multiply([p.x, p.y], [w, h]).astype(int) for p in results.multi_face_landmarks[0].landmark])
-
-            # 1. Tính Blink Ratio
-            left_ear = self._get_blink_ratio(LEFT_EYE, mesh_points)
-            right_ear = self._get_blink_ratio(RIGHT_EYE, mesh_points)
-            avg_ear = (left_ear + right_ear) / 2.0
-
-            if avg_ear < 0.15:
-                blink = True
-                label = "blinking"
-            else:
-                # 2. Tính Gaze Direction & Toạ độ
-                (l_cx, l_cy), l_radius = cv2.minEnclosingCircle(mesh_points[LEFT_IRIS])
-                (r_cx, r_cy), r_radius = cv2.minEnclosingCircle(mesh_points[RIGHT_IRIS])
-
-                center_left = np.array([l_cx, l_cy], dtype=np.int32)
-                center_right = np.array([r_cx, r_cy], dtype=np.int32)
-
-                eyes_data = [
-                    {"rel": (int(l_cx), int(l_cy))},  # Mắt trái
-                    {"rel": (int(r_cx), int(r_cy))}  # Mắt phải
-                ]
-
-                # Vẽ visual
-                cv2.circle(annotated, center_left, int(l_radius), (0, 255, 0), 1, cv2.LINE_AA)
-                cv2.circle(annotated, center_right, int(r_radius), (0, 255, 0), 1, cv2.LINE_AA)
-
-                gaze_l = self._get_gaze_ratio(LEFT_EYE, center_left, mesh_points)
-                gaze_r = self._get_gaze_ratio(RIGHT_EYE, center_right, mesh_points)
-                avg_gaze = (gaze_l + gaze_r) / 2.0
-
-                if avg_gaze < 0.45:
-                    label = "right"
-                elif avg_gaze > 0.55:
-                    label = "left"
-                else:
-                    label = "center"
-        else:
+        if not results.multi_face_landmarks:
+            if self.two_tier:
+                self.roi.update(None, image.shape)
+                self.tracker.lose()
             return {"status": "no_face", "label": "no_face", "annotated": annotated, "eyes_data": []}
 
+        # Chỉ gom các landmark mắt/mống mắt/viền mặt, không duyệt cả 478 điểm
+        points = eye_geometry.extract_points(results.multi_face_landmarks[0].landmark, w, h)
+        if ox or oy: points += (ox, oy)
+        points = to_source(points, scale, pad)
+        geo = eye_geometry.analyze(points)
+        x0, y0, x1, y1 = (int(v) for v in geo["face_box"])
+        if self.two_tier:
+            self.roi.update([(x0, y0), (x1, y1)], image.shape)
+            self.tracker.reset(image, points, geo["ear"])
+            self._last_full = time.monotonic()
+            self._face_box = (x0, y0, x1, y1)
+        return self._result(geo["ear"], geo["gaze"], geo["centers"], geo["radius"], (x0, y0, x1, y1),
+                            annotated, "full")
+
+    def _fast(self, frame_bgr, annotate):
+        """Fast path: EAR / mống mắt từ EyePatchTracker, None khi mất dấu (chạy FaceMesh)"""
+        track = self.tracker.track(frame_bgr)
+        if track is None: return None
+        dx, dy = track["shift"]
+        x0, y0, x1, y1 = self._face_box
+        annotated = frame_bgr.copy() if annotate else None
+        return self._result(track["ear"], track["gaze"], track["centers"], (3, 3), (x0 + dx, y0 + dy, x1 + dx, y1 + dy),
+                            annotated, "fast")
+
+    def _result(self, ear, gaze, centers, radius, face_box, annotated, tier):
+        avg_ear = float(np.mean(ear))
+        label = str(eye_geometry.classify(avg_ear, float(np.mean(gaze))))
+        blink = avg_ear < eye_geometry.BLINK_EAR
+
+        eyes_data = []
+        if not blink:
+            # 2. Toạ độ tâm mống mắt [trái, phải]
+            # (fast path: None = không thấy mống mắt ở mắt đó)
+            eyes_data = [{"rel": (int(c[0]), int(c[1]))} for c in centers if c is not None]
+            if annotated is not None:
+                for (cx, cy), r in ((c, r) for c, r in zip(centers, radius) if c is not None):
+                    cv2.circle(annotated, (int(cx), int(cy)), int(r), (0, 255, 0), 1, cv2.LINE_AA)
+
         return {
             "status": "ok",
             "label": label,
             "blink": blink,
             "annotated": annotated,
-            "eyes_data": eyes_data
-        }
\ No newline at end of file
+            "eyes_data": eyes_data,
+            "face_box": face_box,
+            "ear": round(avg_ear, 4),
+            "tier": tier
+        }
+
+    @staticmethod
+    def analyze_points(points_batch: np.ndarray) -> Dict[str, Any]:
+        """Dạng batch cho xử lý offline: points_batch shape (N, eye_geometry.N_POINTS, 2)"""
+        return eye_geometry.analyze(np.asarray(points_batch, dtype=np.float32))
@@ -0,0 +1,74 @@
+"""Đo thời gian import lúc khởi động server (python -X importtime) để giữ startup nhanh.
+
+    python import_report.py                 # 15 package tốn thời gian nhất khi `import server`
+    python import_report.py --json --max-ms 1500
+
+Thoát với mã 1 nếu tổng thời gian vượt --max-ms hoặc một stack ML nặng
+(lazy_imports.HEAVY_MODULES) bị import ngay từ đầu.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from lazy_imports import HEAVY_MODULES
+
+
+def measure(module: str = "server"):
+    """Chạy `import module` trong process mới; trả về [(tên, self_us, cumulative_us, độ sâu)]"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit(): continue  # dòng tiêu đề
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def report(rows, module: str = "server", top: int = 15):
+    """Tổng thời gian import `module` + các package (gộp theo tên gốc) tốn thời gian nhất"""
+    total_us = next((cum for name, _, cum, _ in rows if name == module), sum(r[1] for r in rows))
+    packages = {}
+    for name, own, _, _ in rows:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + own
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000.0, 1),
+        "modules": len(rows),
+        "heavy_loaded": sorted(m for m in HEAVY_MODULES if m in packages),
+        "slowest": [{"package": name, "self_ms": round(us / 1000.0, 1)}
+                    for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time report")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if total import time exceeds this")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    result = report(measure(args.module), args.module, args.top)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import {args.module}: {result['total_ms']:.0f} ms, {result['modules']} modules")
+        for r in result["slowest"]:
+            print(f"  {r['self_ms']:8.1f} ms  {r['package']}")
+        if result["heavy_loaded"]: print(f"Heavy modules imported at startup: {', '.join(result['heavy_loaded'])}")
+
+    failed = bool(result["heavy_loaded"])
+    if args.max_ms is not None and result["total_ms"] > args.max_ms: failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
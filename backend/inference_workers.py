@@ -0,0 +1,156 @@
+import collections
+import multiprocessing as mp
+import time
+
+from native_threads import threading, queue
+
+
+def _build(factory, args):
+    return factory(*args)
+
+
+def _run_batch(detector, frames):
+    """Một lần predict cho cả batch nếu detector hỗ trợ `infer_batch`"""
+    if len(frames) > 1 and hasattr(detector, 'infer_batch'):
+        return detector.infer_batch(frames)
+    return [detector.infer(f) for f in frames]
+
+
+def _worker_loop(factory, args, get, put, max_batch, batch_window):
+    """Vòng lặp của worker: tự load model, gom frame thành batch rồi infer"""
+    try:
+        detector = _build(factory, args)
+    except Exception as e:
+        put((None, -1, {"error": str(e)}, 0.0))
+        return
+    stopping = False
+    while not stopping:
+        item = get(None)
+        if item is None: break
+        batch = [item]
+        # Gom thêm frame (từ camera/phiên khác) trong cửa sổ batch_window
+        deadline = time.perf_counter() + batch_window
+        while len(batch) < max_batch:
+            try:
+                nxt = get(max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if nxt is None:
+                stopping = True
+                break
+            batch.append(nxt)
+
+        t0 = time.perf_counter()
+        try:
+            results = _run_batch(detector, [frame for _, _, frame in batch])
+        except Exception as e:
+            results = [{"error": str(e)}] * len(batch)
+        # Chia đều thời gian batch cho từng frame để scheduler tính đúng chi phí
+        dt = (time.perf_counter() - t0) / len(batch)
+        for (source, seq, _), res in zip(batch, results):
+            put((source, seq, res, dt))
+
+
+def _process_main(factory, args, conn, max_batch, batch_window):
+    def get(timeout):
+        if timeout is not None and not conn.poll(timeout): raise queue.Empty
+        return conn.recv()
+    _worker_loop(factory, args, get, conn.send, max_batch, batch_window)
+
+
+class InferenceWorker:
+    """Chạy một detector trên worker riêng (OS thread hoặc process).
+
+    Mỗi nguồn (`source`: camera/phiên) được giữ tối đa `max_pending` frame chưa
+    có kết quả: `submit` trả về False khi nguồn đó còn bận, frame bị bỏ qua thay
+    vì xếp hàng. Worker gom các frame đang chờ (tối đa `max_batch`, chờ thêm
+    `batch_window` giây) thành một lần `infer_batch`. Kết quả lấy bằng `poll`
+    dưới dạng (seq, result, seconds) theo từng nguồn.
+    """
+
+    def __init__(self, name: str, factory, args=(), mode: str = "thread",
+                 max_batch: int = 1, batch_window: float = 0.0, max_pending: int = 1):
+        self.name = name
+        self.mode = mode
+        self.failed = False
+        self.max_pending = max(1, max_pending)
+        self._inflight = collections.Counter()
+        self._results = collections.defaultdict(list)
+
+        if mode == "process":
+            # Pipe thay vì multiprocessing.Queue: Queue cần feeder thread, không chạy được dưới eventlet
+            ctx = mp.get_context("spawn")
+            self.conn, child_conn = ctx.Pipe()
+            self.worker = ctx.Process(target=_process_main,
+                                      args=(factory, args, child_conn, max_batch, batch_window),
+                                      name=f"infer-{name}", daemon=True)
+        else:
+            self.in_q = queue.Queue()
+            self.out_q = queue.Queue()
+            self.worker = threading.Thread(target=self._thread_main,
+                                           args=(factory, args, max_batch, batch_window),
+                                           name=f"infer-{name}", daemon=True)
+        self.worker.start()
+
+    def _thread_main(self, factory, args, max_batch, batch_window):
+        get = lambda timeout: self.in_q.get(timeout=timeout) if timeout is not None else self.in_q.get()
+        _worker_loop(factory, args, get, self.out_q.put, max_batch, batch_window)
+
+    def busy_for(self, source="default") -> bool:
+        return self._inflight[source] >= self.max_pending
+
+    @property
+    def busy(self) -> bool:
+        return self.busy_for("default")
+
+    def submit(self, seq: int, frame, source="default") -> bool:
+        if self.failed or self.busy_for(source): return False
+        if self.mode == "process":
+            self.conn.send((source, seq, frame))
+        else:
+            self.in_q.put_nowait((source, seq, frame))
+        self._inflight[source] += 1
+        return True
+
+    def _get_nowait(self):
+        if self.mode == "process":
+            if not self.conn.poll(): raise queue.Empty
+            return self.conn.recv()
+        return self.out_q.get_nowait()
+
+    def _drain(self):
+        while True:
+            try:
+                source, seq, res, dt = self._get_nowait()
+            except queue.Empty:
+                break
+            if seq < 0:
+                self.failed = True
+                print(f"Error Loading {self.name} model: {res.get('error')}")
+                continue
+            # Kết quả muộn của nguồn đã `forget` (engine đã dừng) -> bỏ
+            if source not in self._inflight: continue
+            self._inflight[source] -= 1
+            self._results[source].append((seq, res, dt))
+
+    def poll(self, source="default"):
+        """Lấy các kết quả đã xong của một nguồn, không chặn"""
+        self._drain()
+        return self._results.pop(source, [])
+
+    def forget(self, source):
+        """Bỏ trạng thái của một nguồn (khi engine trả worker về registry)"""
+        self._inflight.pop(source, None)
+        self._results.pop(source, None)
+
+    def stop(self, timeout: float = 2.0):
+        try:
+            if self.mode == "process":
+                self.conn.send(None)
+            else:
+                self.in_q.put(None, timeout=timeout)
+        except Exception:
+            pass
+        self.worker.join(timeout=timeout)
+        if self.mode == "process" and self.worker.is_alive():
+            self.worker.terminate()
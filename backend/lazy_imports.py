@@ -0,0 +1,31 @@
+"""Import các stack ML nặng (torch, ultralytics, yolov5, mediapipe) khi thật sự cần.
+
+Server chỉ cần Flask/Socket.IO/OpenCV để trả lời UI; các thư viện model được
+import lần đầu khi tạo detector tương ứng (trong worker), có đo thời gian.
+"""
+import time
+
+from metrics import REGISTRY
+
+# Các module không được có mặt sau khi import server (xem import_report.py)
+HEAVY_MODULES = ("torch", "ultralytics", "yolov5", "mediapipe")
+
+_modules = {}
+timings = {}  # tên -> giây import lần đầu
+
+
+def timed_import(name: str, loader):
+    """Gọi `loader()` một lần và nhớ kết quả; None nếu thiếu thư viện"""
+    if name not in _modules:
+        t0 = time.perf_counter()
+        try:
+            _modules[name] = loader()
+        except ImportError:
+            _modules[name] = None
+        timings[name] = dt = time.perf_counter() - t0
+        REGISTRY.observe("stage_seconds", dt, stage="import", target=name)
+        if _modules[name] is None:
+            print(f"WARNING: '{name}' not installed.")
+        else:
+            print(f"Imported {name} in {dt:.2f}s")
+    return _modules[name]
@@ -0,0 +1,147 @@
+"""Đo thời gian từng stage (histogram), counter và gauge cho hot path.
+
+Không phụ thuộc thư viện ngoài: `render()` xuất định dạng text của Prometheus
+(route /metrics), `snapshot()` trả về dict gọn (mean/p50/p95 ước lượng từ
+bucket) cho event Socket.IO 'stats'. Khóa là lock thật (native_threads) vì
+capture/log/encode ghi từ OS thread; mỗi lần ghi chỉ giữ khóa vài micro giây.
+
+    with REGISTRY.time("stage_seconds", stage="overlay", target="cam1"):
+        ...
+    REGISTRY.inc("frames_dropped_total", cam="cam1")
+"""
+import bisect
+import time
+from contextlib import contextmanager
+
+from native_threads import threading
+
+PREFIX = "biovision_"
+# Bucket (giây) cho mọi histogram thời gian: 0.1 ms tới 2.5 s, dày ở vùng 5-100 ms của inference
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05,
+           0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5)
+
+# name -> (loại, mô tả)
+METRICS = {
+    "stage_seconds": ("histogram", "Time spent per pipeline stage"),
+    "frames_total": ("counter", "Frames grabbed by the engine per camera"),
+    "frames_dropped_total": ("counter", "Camera frames overwritten before the engine took them"),
+    "results_stale_total": ("counter", "Detector results discarded because a newer frame already had one"),
+    "inference_errors_total": ("counter", "Detector inference errors"),
+    "jpeg_passthrough_total": ("counter", "Camera-native JPEG frames streamed without decode/re-encode"),
+    "inferences_saved_total": ("counter", "Inferences skipped by the motion gate because the scene was static"),
+    "log_dropped_total": ("counter", "Session log samples dropped because the writer queue was full"),
+    "camera_fps": ("gauge", "Achieved frames per second per camera"),
+    "detector_hz": ("gauge", "Achieved inference rate per detector"),
+    "stream_clients": ("gauge", "Connected MJPEG clients"),
+    "telemetry_clients": ("gauge", "Connected Socket.IO telemetry clients"),
+}
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Ước lượng phân vị bằng nội suy tuyến tính trong bucket"""
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {name: {} for name in METRICS}
+
+    def observe(self, name, value, **labels):
+        key = _key(labels)
+        with self.lock:
+            h = self.series[name].get(key)
+            if h is None: h = self.series[name][key] = _Histogram()
+            h.observe(value)
+
+    def inc(self, name, n=1, **labels):
+        if not n: return
+        key = _key(labels)
+        with self.lock:
+            self.series[name][key] = self.series[name].get(key, 0) + n
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.series[name][_key(labels)] = value
+
+    @contextmanager
+    def time(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def render(self) -> str:
+        """Định dạng text exposition của Prometheus"""
+        lines = []
+        with self.lock:
+            for name, (kind, doc) in METRICS.items():
+                series = self.series[name]
+                if not series: continue
+                full = PREFIX + name
+                lines.append(f"# HELP {full} {doc}")
+                lines.append(f"# TYPE {full} {kind}")
+                for key, v in sorted(series.items()):
+                    if kind != "histogram":
+                        lines.append(f"{full}{_fmt_labels(key)} {v}")
+                        continue
+                    cum = 0
+                    for le, n in zip(list(BUCKETS) + ["+Inf"], v.counts):
+                        cum += n
+                        lines.append(f"{full}_bucket{_fmt_labels(key, [('le', le)])} {cum}")
+                    lines.append(f"{full}_sum{_fmt_labels(key)} {v.total:.6f}")
+                    lines.append(f"{full}_count{_fmt_labels(key)} {v.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Dạng gọn cho UI: histogram -> {count, mean_ms, p50_ms, p95_ms}, còn lại giữ giá trị"""
+        out = {}
+        with self.lock:
+            for name, series in self.series.items():
+                for key, v in series.items():
+                    label = ",".join(str(val) for _, val in key) or "_"
+                    if isinstance(v, _Histogram):
+                        v = {"count": v.count, "mean_ms": round(v.total / v.count * 1000, 2) if v.count else 0.0,
+                             "p50_ms": round(v.quantile(0.5) * 1000, 2), "p95_ms": round(v.quantile(0.95) * 1000, 2)}
+                    out.setdefault(name, {})[label] = v
+        return out
+
+    def reset(self):
+        with self.lock:
+            self.series = {name: {} for name in METRICS}
+
+
+REGISTRY = Registry()
@@ -0,0 +1,102 @@
+"""Registry model dùng chung cho cả process server.
+
+Model sống bên trong InferenceWorker (thread/process đã load sẵn detector), nên
+registry giữ worker theo khóa (class detector, tham số đã resolve - đường dẫn
+tuyệt đối + confidence, mode). Detector giữ trạng thái giữa các frame
+(`STATEFUL = True`, vd. tracker của GazeEstimator) có thêm nguồn (camera) trong
+khóa: mỗi camera một worker, không trộn trạng thái giữa các nguồn. Engine `acquire` khi bắt đầu và `release` khi
+dừng; worker không còn engine nào dùng vẫn được giữ "ấm" để lần start_processing
+sau dùng lại ngay. Số worker rảnh tối đa là `max_idle`, vượt quá thì dừng worker
+rảnh lâu nhất (LRU); `unload` dừng hẳn theo yêu cầu.
+"""
+import collections
+import time
+
+from native_threads import threading
+from inference_workers import InferenceWorker
+from config import MODEL_CACHE_SIZE
+
+
+class ModelRegistry:
+    def __init__(self, max_idle: int = MODEL_CACHE_SIZE):
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.workers = {}  # key -> InferenceWorker
+        self.refs = collections.Counter()
+        self.idle = collections.OrderedDict()  # key -> thời điểm rảnh (cũ nhất đứng đầu)
+
+    @staticmethod
+    def key(factory, args=(), mode: str = "thread", source=None):
+        return (factory, tuple(args), mode, source if getattr(factory, 'STATEFUL', False) else None)
+
+    def acquire(self, name: str, factory, args=(), mode: str = "thread", source=None,
+                **kwargs) -> InferenceWorker:
+        """Worker đã load (hoặc đang load) cho model này; tạo mới nếu chưa có / lỗi.
+        source: nguồn frame (camera), chỉ dùng trong khóa của detector STATEFUL"""
+        key = self.key(factory, args, mode, source)
+        stale = None
+        with self.lock:
+            worker = self.workers.get(key)
+            # poll để nhận lỗi load của worker đang rảnh (chưa engine nào đọc kết quả)
+            if worker is not None: worker.poll(None)
+            if worker is not None and worker.failed:
+                stale = self._drop(key)
+                worker = None
+            if worker is None:
+                worker = InferenceWorker(name, factory, args, mode=mode, **kwargs)
+                self.workers[key] = worker
+            else:
+                print(f"Reusing warm {name} model")
+            self.idle.pop(key, None)
+            self.refs[key] += 1
+        if stale: stale.stop()
+        return worker
+
+    def release(self, worker: InferenceWorker, source="default"):
+        """Engine trả worker; worker vẫn giữ model, chỉ bị dừng khi bị LRU đẩy ra"""
+        evicted = []
+        with self.lock:
+            key = self._find(worker)
+            if key is None: return
+            worker.forget(source)
+            self.refs[key] -= 1
+            if self.refs[key] > 0: return
+            del self.refs[key]
+            self.idle[key] = time.time()
+            if worker.failed: evicted.append(self._drop(key))
+            while len(self.idle) > self.max_idle:
+                evicted.append(self._drop(next(iter(self.idle))))
+        for w in evicted: w.stop()
+
+    def preload(self, name: str, factory, args=(), mode: str = "thread", source=None, **kwargs):
+        """Load nền (worker tự load model trong thread/process của nó) rồi để ở trạng thái rảnh"""
+        self.release(self.acquire(name, factory, args, mode, source, **kwargs))
+
+    def unload(self, name: str = None) -> int:
+        """Dừng các worker rảnh (của model `name`, hoặc tất cả); trả về số worker đã dừng"""
+        with self.lock:
+            keys = [k for k in self.idle if name is None or self.workers[k].name == name]
+            stopped = [self._drop(k) for k in keys]
+        for w in stopped: w.stop()
+        return len(stopped)
+
+    def status(self):
+        with self.lock:
+            return [{"name": w.name, "args": [str(a) for a in key[1]], "mode": key[2], "source": key[3],
+                     "refs": self.refs.get(key, 0), "idle_s": round(time.time() - self.idle[key], 1)
+                     if key in self.idle else 0.0, "failed": w.failed}
+                    for key, w in self.workers.items()]
+
+    def _find(self, worker):
+        for key, w in self.workers.items():
+            if w is worker: return key
+        return None
+
+    def _drop(self, key):
+        self.idle.pop(key, None)
+        self.refs.pop(key, None)
+        return self.workers.pop(key)
+
+
+# Dùng chung cho mọi engine trong process server
+MODELS = ModelRegistry()
@@ -0,0 +1,14 @@
+"""Thread hệ điều hành thật (OS threads) cho các tác vụ chặn (blocking).
+
+server.py gọi eventlet.monkey_patch() nên `threading`/`queue` thông thường chỉ
+tạo green thread: một lệnh `cv2.VideoCapture.read()` hay một lần inference sẽ
+chặn toàn bộ hub. Các module cần song song thật lấy `threading`/`queue` từ đây.
+Không được gọi hàm eventlet (sleep, emit...) bên trong các thread này.
+"""
+try:
+    from eventlet.patcher import original as _original
+    threading = _original('threading')
+    queue = _original('queue')
+except ImportError:
+    import threading
+    import queue
@@ -0,0 +1,223 @@
+"""Backend ONNX Runtime (CPU) cho TiltDetector / PostureDetector.
+
+Model `.pt` được export sang ONNX một lần (cần torch + ultralytics/yolov5 ở lần
+đầu) và cache trong ONNX_CACHE_DIR theo tên + kích thước + mtime của file; có
+thể lượng tử hóa động int8 (`quantize=True`, cache riêng). Khi chạy chỉ cần
+onnxruntime: letterbox + hậu xử lý bằng numpy, kết quả cùng dạng dict với
+detector PyTorch (tilt: label/confidence/keypoints, posture: label/confidence/bbox).
+"""
+import ast
+import hashlib
+import os
+import shutil
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from config import YOLO_CONFIDENCE, ONNX_CACHE_DIR, ONNX_THREADS, ONNX_IMGSZ
+from lazy_imports import timed_import
+from frame_cache import unpack
+
+
+def _ort():
+    def load():
+        import onnxruntime
+        return onnxruntime
+    ort = timed_import("onnxruntime", load)
+    if ort is None: raise RuntimeError("Chưa cài onnxruntime")
+    return ort
+
+
+def _cache_path(model_path: str, kind: str, imgsz: int, quantize: bool) -> str:
+    st = os.stat(model_path)
+    tag = hashlib.sha1(f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:10]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(ONNX_CACHE_DIR, f"{stem}-{kind}-{imgsz}-{tag}{'-int8' if quantize else ''}.onnx")
+
+
+def _export(model_path: str, kind: str, imgsz: int) -> str:
+    """Export bằng chính stack PyTorch của detector; trả về file .onnx vừa tạo"""
+    from detectors import _ultralytics_yolo, _yolov5
+    if kind == "tilt":
+        YOLO = _ultralytics_yolo()
+        if YOLO is None: raise RuntimeError("Export ONNX cho tilt cần ultralytics")
+        return YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True)
+    yolov5 = _yolov5()
+    if yolov5 is None: raise RuntimeError("Export ONNX cho posture cần yolov5")
+    from yolov5 import export
+    files = export.run(weights=model_path, imgsz=(imgsz, imgsz), include=("onnx",), dynamic=True)
+    return next(str(f) for f in files if str(f).endswith(".onnx"))
+
+
+def prepare(model_path: str, kind: str, quantize: bool = False, imgsz: int = ONNX_IMGSZ) -> str:
+    """Đường dẫn file ONNX (đã cache) cho model `.pt` (hoặc `.onnx` có sẵn); export/quantize nếu chưa có"""
+    os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+    fp32 = model_path if model_path.endswith(".onnx") else _cache_path(model_path, kind, imgsz, False)
+    if not os.path.exists(fp32):
+        print(f"Exporting {model_path} to ONNX...")
+        exported = _export(model_path, kind, imgsz)
+        tmp = fp32 + ".tmp"
+        shutil.move(exported, tmp)
+        os.replace(tmp, fp32)
+    if not quantize: return fp32
+
+    int8 = _cache_path(model_path, kind, imgsz, True)
+    if not os.path.exists(int8):
+        _ort()
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantizing {os.path.basename(fp32)} to int8...")
+        tmp = int8 + ".tmp"
+        quantize_dynamic(fp32, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, int8)
+    return int8
+
+
+def letterbox(img, size: int, color: int = 114):
+    """Resize giữ tỉ lệ vào khung size x size; trả về (ảnh, tỉ lệ, (pad_x, pad_y))"""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nw, nh = int(round(w * r)), int(round(h * r))
+    if (nw, nh) != (w, h): img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    left, top = (size - nw) // 2, (size - nh) // 2
+    out = np.full((size, size, 3), color, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = img
+    return out, r, (left, top)
+
+
+class _OnnxModel:
+    def __init__(self, model_path: str, kind: str, conf_thres: float, quantize: bool, threads: int):
+        ort = _ort()
+        path = prepare(model_path, kind, quantize)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads or ONNX_THREADS or max(1, (os.cpu_count() or 2) // 2)
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        print(f"Initializing ONNX Runtime with: {path} ({opts.intra_op_num_threads} threads)")
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        # Batch/kích thước động nếu export với dynamic=True, ngược lại cố định theo model
+        dims = self.input.shape
+        self.dynamic_batch = not isinstance(dims[0], int)
+        self.imgsz = dims[2] if isinstance(dims[2], int) else ONNX_IMGSZ
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = self._literal(meta.get("names"), {})
+        self.kpt_shape = self._literal(meta.get("kpt_shape"), None)
+        self.conf_thres = conf_thres
+
+    @staticmethod
+    def _literal(text, default):
+        try:
+            return ast.literal_eval(text) if text else default
+        except (ValueError, SyntaxError):
+            return default
+
+    def label(self, cls_id: int) -> str:
+        return self.names.get(cls_id, str(cls_id)) if isinstance(self.names, dict) else self.names[cls_id]
+
+    def run(self, frames_bgr):
+        """Letterbox + forward; trả về (output[0], danh sách (tỉ lệ, pad)).
+        ModelInput đã letterbox sẵn đúng imgsz (frame_cache) thì dùng luôn"""
+        boxed, geo = [], []
+        for f in frames_bgr:
+            img, r, pad, rgb = unpack(f)
+            if img.shape[:2] != (self.imgsz, self.imgsz):
+                img, r2, pad2 = letterbox(img, self.imgsz)
+                r, pad = r * r2, (pad[0] * r2 + pad2[0], pad[1] * r2 + pad2[1])
+            if rgb: img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+            boxed.append(img)
+            geo.append((r, pad))
+        blob = cv2.dnn.blobFromImages(boxed, 1 / 255.0, swapRB=True)
+        if self.dynamic_batch or len(boxed) == 1:
+            out = self.session.run(None, {self.input.name: blob})[0]
+        else:
+            out = np.concatenate([self.session.run(None, {self.input.name: blob[i:i + 1]})[0]
+                                  for i in range(len(boxed))])
+        return out, geo
+
+
+def _nms_best(xywh, conf, cls, conf_thres: float, iou: float):
+    """Chỉ số detection đứng đầu sau lọc conf + NMS theo lớp (như boxes[0] của torch); None nếu không còn"""
+    idx = np.flatnonzero(conf >= conf_thres)
+    if not len(idx): return None
+    boxes = xywh[idx].astype(np.float32)
+    boxes[:, :2] -= boxes[:, 2:] / 2  # tâm -> góc trên trái
+    keep = cv2.dnn.NMSBoxesBatched(boxes.tolist(), conf[idx].astype(np.float32).tolist(),
+                                   cls[idx].astype(np.int32).tolist(), conf_thres, iou)
+    keep = np.asarray(keep).reshape(-1)
+    # NMSBoxes trả chỉ số theo điểm giảm dần
+    return int(idx[keep[0]]) if len(keep) else None
+
+
+class OnnxTiltDetector:
+    """YOLOv8 pose (ultralytics) qua ONNX Runtime; output (N, 4 + nc + nk*nd, anchors)"""
+
+    PREPROCESS = {"size": ONNX_IMGSZ, "letterbox": True}
+    # IoU NMS mặc định của ultralytics predict
+    NMS_IOU = 0.7
+
+    def __init__(self, model_path: str, conf_thres: float = YOLO_CONFIDENCE, quantize: bool = False,
+                 threads: int = 0):
+        self.model = _OnnxModel(model_path, "tilt", conf_thres, quantize, threads)
+
+    def infer(self, frame_bgr) -> Dict[str, Any]:
+        if frame_bgr is None: return {}
+        return self.infer_batch([frame_bgr])[0]
+
+    def infer_batch(self, frames_bgr: List[Any]) -> List[Dict[str, Any]]:
+        valid = [i for i, f in enumerate(frames_bgr) if f is not None]
+        out = [{} for _ in frames_bgr]
+        if not valid: return out
+        preds, geo = self.model.run([frames_bgr[i] for i in valid])
+        for j, i in enumerate(valid):
+            out[i] = self._parse(preds[j].T, *geo[j])
+        return out
+
+    def _parse(self, pred, r, pad) -> Dict[str, Any]:
+        nk, nd = self.model.kpt_shape or (0, 3)
+        nc = len(self.model.names) or pred.shape[1] - 4 - nk * nd
+        scores = pred[:, 4:4 + nc]
+        conf, cls = scores.max(axis=1), scores.argmax(axis=1)
+        # Chỉ dùng detection tốt nhất sau NMS (giống boxes[0] của ultralytics)
+        best = _nms_best(pred[:, :4], conf, cls, self.model.conf_thres, self.NMS_IOU)
+        if best is None:
+            return {"label": None, "confidence": None, "keypoints": None}
+        kpts = pred[best, 4 + nc:].reshape(-1, nd)[:7, :2]
+        kpts = (kpts - pad) / r
+        return {"label": self.model.label(int(cls[best])), "confidence": float(conf[best]),
+                "keypoints": [(float(x), float(y)) for x, y in kpts]}
+
+
+class OnnxPostureDetector:
+    """YOLOv5 (pip yolov5) qua ONNX Runtime; output (N, anchors, 5 + nc)"""
+
+    PREPROCESS = {"size": ONNX_IMGSZ, "letterbox": True}
+    # IoU NMS mặc định của yolov5 AutoShape (model.iou)
+    NMS_IOU = 0.45
+
+    def __init__(self, model_path: str, conf_thres: float = YOLO_CONFIDENCE, quantize: bool = False,
+                 threads: int = 0):
+        self.model = _OnnxModel(model_path, "posture", conf_thres, quantize, threads)
+
+    def infer(self, frame_bgr) -> Dict[str, Any]:
+        if frame_bgr is None: return {}
+        return self.infer_batch([frame_bgr])[0]
+
+    def infer_batch(self, frames_bgr: List[Any]) -> List[Dict[str, Any]]:
+        valid = [i for i, f in enumerate(frames_bgr) if f is not None]
+        out = [{} for _ in frames_bgr]
+        if not valid: return out
+        preds, geo = self.model.run([frames_bgr[i] for i in valid])
+        for j, i in enumerate(valid):
+            out[i] = self._parse(preds[j], *geo[j])
+        return out
+
+    def _parse(self, pred, r, pad) -> Dict[str, Any]:
+        scores = pred[:, 5:] * pred[:, 4:5]
+        conf, cls = scores.max(axis=1), scores.argmax(axis=1)
+        best = _nms_best(pred[:, :4], conf, cls, self.model.conf_thres, self.NMS_IOU)
+        if best is None: return {}
+        x, y, w, h = pred[best, :4]
+        return {"label": self.model.label(int(cls[best])), "confidence": float(conf[best]),
+                "bbox": (float((x - pad[0]) / r), float((y - pad[1]) / r), float(w / r), float(h / r))}
@@ -0,0 +1,119 @@
+"""So sánh độ chính xác / độ trễ giữa backend PyTorch và ONNX Runtime (fp32, int8).
+
+    python onnx_compare.py --kind tilt --model best_tilt.pt --video study.mp4 --frames 300 --quantize
+    python onnx_compare.py --kind posture --model best_posture.pt --images "samples/*.jpg" --out cmp.json
+
+Kết quả PyTorch là chuẩn: báo tỉ lệ trùng nhãn, trùng có/không detection, sai số
+keypoint (px, tilt) hoặc IoU bbox (posture), cùng phân vị độ trễ mỗi frame.
+"""
+import argparse
+import glob
+import json
+import time
+
+import cv2
+import numpy as np
+
+
+def read_frames(video=None, images=None, limit=200, stride=1):
+    frames = []
+    if video:
+        cap = cv2.VideoCapture(video)
+        idx = 0
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret: break
+            if idx % stride == 0: frames.append(frame)
+            idx += 1
+        cap.release()
+    for path in sorted(glob.glob(images or ""))[:max(0, limit - len(frames))]:
+        img = cv2.imread(path)
+        if img is not None: frames.append(img)
+    return frames
+
+
+def run(detector, frames, warmup=5):
+    for f in frames[:warmup]: detector.infer(f)
+    results, times = [], []
+    for f in frames:
+        t0 = time.perf_counter()
+        results.append(detector.infer(f) or {})
+        times.append(time.perf_counter() - t0)
+    return results, np.asarray(times) * 1000.0
+
+
+def _iou(a, b):
+    """IoU của hai bbox dạng (x_center, y_center, w, h)"""
+    ax0, ay0, ax1, ay1 = a[0] - a[2] / 2, a[1] - a[3] / 2, a[0] + a[2] / 2, a[1] + a[3] / 2
+    bx0, by0, bx1, by1 = b[0] - b[2] / 2, b[1] - b[3] / 2, b[0] + b[2] / 2, b[1] + b[3] / 2
+    iw, ih = max(0.0, min(ax1, bx1) - max(ax0, bx0)), max(0.0, min(ay1, by1) - max(ay0, by0))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def accuracy(kind, reference, results):
+    n = len(reference)
+    found = [bool(r.get('label')) for r in reference]
+    same_detect = sum(bool(r.get('label')) == f for r, f in zip(results, found))
+    same_label = sum(r.get('label') == ref.get('label') for r, ref in zip(results, reference))
+    out = {"detection_agreement": round(same_detect / n, 4), "label_agreement": round(same_label / n, 4)}
+    both = [(ref, r) for ref, r in zip(reference, results) if ref.get('label') and r.get('label')]
+    if kind == "tilt":
+        errs = []
+        for ref, r in both:
+            a, b = np.asarray(ref.get('keypoints') or []), np.asarray(r.get('keypoints') or [])
+            k = min(len(a), len(b))
+            if k: errs.append(float(np.linalg.norm(a[:k] - b[:k], axis=1).mean()))
+        out["keypoint_error_px"] = round(float(np.mean(errs)), 2) if errs else None
+    else:
+        ious = [_iou(ref['bbox'], r['bbox']) for ref, r in both if ref.get('bbox') and r.get('bbox')]
+        out["bbox_iou"] = round(float(np.mean(ious)), 4) if ious else None
+    confs = [abs(r['confidence'] - ref['confidence']) for ref, r in both
+             if r.get('confidence') is not None and ref.get('confidence') is not None]
+    out["confidence_abs_diff"] = round(float(np.mean(confs)), 4) if confs else None
+    return out
+
+
+def latency(ms):
+    return {"mean_ms": round(float(ms.mean()), 2), "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PyTorch and ONNX Runtime detector backends")
+    parser.add_argument("--kind", choices=["tilt", "posture"], required=True)
+    parser.add_argument("--model", required=True, help=".pt model (exported to ONNX on first use)")
+    parser.add_argument("--video")
+    parser.add_argument("--images", help="Glob of image files")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--stride", type=int, default=1, help="Use every N-th video frame")
+    parser.add_argument("--quantize", action="store_true", help="Also evaluate the int8 model")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = auto)")
+    parser.add_argument("--out", help="Write JSON report to this file")
+    args = parser.parse_args()
+
+    frames = read_frames(args.video, args.images, args.frames, max(1, args.stride))
+    if not frames: parser.error("no frames (use --video or --images)")
+
+    from detectors import TiltDetector, PostureDetector
+    from onnx_backend import OnnxTiltDetector, OnnxPostureDetector
+    torch_cls, onnx_cls = (TiltDetector, OnnxTiltDetector) if args.kind == "tilt" else \
+        (PostureDetector, OnnxPostureDetector)
+
+    reference, torch_ms = run(torch_cls(args.model), frames)
+    report = {"kind": args.kind, "model": args.model, "frames": len(frames),
+              "torch": latency(torch_ms), "onnx": {}}
+    for name, quantize in [("fp32", False)] + ([("int8", True)] if args.quantize else []):
+        results, ms = run(onnx_cls(args.model, quantize=quantize, threads=args.threads), frames)
+        report["onnx"][name] = {**latency(ms), "speedup": round(float(torch_ms.mean() / ms.mean()), 2),
+                                **accuracy(args.kind, reference, results)}
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
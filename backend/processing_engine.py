@@ -1,5 +1,4 @@
 import os
-import csv
 import datetime
 import threading
 import time
@@ -7,106 +6,466 @@ import cv2
 import eventlet
 import numpy as np
 
-from config import EXPORT_BASE_DIR, WEBCAM_WIDTH, WEBCAM_HEIGHT, GAZE_DEVICE
-from video_sources import WebcamSource, IPCameraSource
-from detectors import TiltDetector, PostureDetector
-from gaze_wrapper import GazeEstimator
+from config import (EXPORT_BASE_DIR, WEBCAM_WIDTH, WEBCAM_HEIGHT, GAZE_DEVICE, YOLO_CONFIDENCE, DETECTOR_BACKEND,
+                    ONNX_QUANTIZE, ONNX_THREADS, THREADED_CAPTURE, IP_RECONNECT_BACKOFF_MIN, IP_RECONNECT_BACKOFF_MAX,
+                    INFERENCE_MODE, SCHEDULE, LATENCY_BUDGET_MS, INFERENCE_CAPACITY, INFER_MAX_BATCH,
+                    INFER_BATCH_WINDOW_MS, ROI_TRACKING, ROI_PADDING, ROI_MIN_SIZE, LOG_FORMATS, LOG_DEDUP,
+                    MOTION_GATING, MOTION_GATE, MOTION_MAX_STALE_S, MOTION_THUMB_WIDTH, MOTION_PIXEL_DELTA,
+                    RECORD_FRAMES, RECORD_FPS, RECORD_WIDTH, RECORD_JPEG_QUALITY, RECORD_SEGMENT_SECONDS,
+                    BIOPAC_SOURCE, GAZE_TWO_TIER, GAZE_FULL_INTERVAL_S, GAZE_FAST_HZ, BLINK_OPEN_EAR, BLINK_MIN_MS,
+                    BLINK_MAX_MS)
+from video_sources import source_factory, LOCAL_SOURCES, ThreadedSource
+from model_registry import MODELS
+from scheduler import AdaptiveScheduler
+from frame_broadcaster import FrameBroadcaster
+from stream_encoder import StreamEncoder
+from roi_tracker import RoiTracker, shift_points
+from frame_cache import PreparedFrame
+from motion_gate import MotionGate
+from metrics import REGISTRY
+from eye_tracker import BlinkDetector
+
+
+def resolve_model_path(path):
+    """Tìm file model ở nhiều vị trí khác nhau"""
+    if not path: return None
+
+    # 1. Đường dẫn tuyệt đối hoặc đường dẫn do người dùng nhập
+    if os.path.exists(path):
+        return path
+
+    # 2. Tìm trong thư mục hiện tại (Current Working Directory)
+    cwd_path = os.path.join(os.getcwd(), path)
+    if os.path.exists(cwd_path):
+        return cwd_path
+
+    # 3. Tìm trong thư mục chứa file code này
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    script_path = os.path.join(script_dir, path)
+    if os.path.exists(script_path):
+        return script_path
+
+    return None
+
+
+def detector_specs(config, resolve=resolve_model_path):
+    """(tên, class detector, tham số) của các detector theo config start_processing"""
+    specs = []
+    raw_tilt_path = config.get('tilt_model', '').strip().strip('"')
+    raw_posture_path = config.get('posture_model', '').strip().strip('"')
+    # Đường dẫn tuyệt đối + confidence (+ tùy chọn ONNX) là khóa của model trong MODELS
+    conf = float(config.get('confidence', YOLO_CONFIDENCE))
+    # Module detector chỉ import khi có engine cần đến (server khởi động không tải backend không dùng)
+    if config.get('backend', DETECTOR_BACKEND) == "onnx":
+        from onnx_backend import OnnxTiltDetector as tilt_cls, OnnxPostureDetector as posture_cls
+        extra = (bool(config.get('onnx_quantize', ONNX_QUANTIZE)), int(config.get('onnx_threads', ONNX_THREADS)))
+    else:
+        from detectors import TiltDetector as tilt_cls, PostureDetector as posture_cls
+        extra = ()
+
+    # Resolve Tilt Path
+    tilt_path = resolve(raw_tilt_path)
+    if tilt_path:
+        print(f"Loading Tilt Model from: {tilt_path}")
+        specs.append(('tilt', tilt_cls, (os.path.abspath(tilt_path), conf) + extra))
+    else:
+        print(f"ERROR: Tilt Model file not found: '{raw_tilt_path}'")
+
+    # Resolve Posture Path
+    posture_path = resolve(raw_posture_path)
+    if posture_path:
+        print(f"Loading Posture Model from: {posture_path}")
+        specs.append(('posture', posture_cls, (os.path.abspath(posture_path), conf) + extra))
+    else:
+        print(f"ERROR: Posture Model file not found: '{raw_posture_path}'")
+
+    if config.get('use_gaze', True):
+        from gaze_wrapper import GazeEstimator
+        gaze_args = (GAZE_DEVICE,)
+        if config.get('gaze_two_tier', GAZE_TWO_TIER):
+            gaze_args += (True, float(config.get('gaze_full_interval', GAZE_FULL_INTERVAL_S)))
+        specs.append(('gaze', GazeEstimator, gaze_args))
+    return specs
+
+
+def worker_options(config):
+    """Tùy chọn gom batch của InferenceWorker (cùng config -> cùng worker trong MODELS)"""
+    return {
+        "max_batch": int(config.get('max_batch', INFER_MAX_BATCH)),
+        "batch_window": float(config.get('batch_window_ms', INFER_BATCH_WINDOW_MS)) / 1000.0,
+    }
+
+
+def camera_specs(config):
+    """Chế độ 2 camera: camera 1 (mặt) chạy tilt + gaze, camera 2 (toàn thân) chạy posture"""
+    return {"cam1": {"type": config.get('tilt_type', "Webcam"), "value": config.get('tilt_val', "0"),
+                     "detectors": ('tilt', 'gaze'), "stream": 1},
+            "cam2": {"type": config.get('posture_type', "Webcam"), "value": config.get('posture_val', "0"),
+                     "detectors": ('posture',), "stream": 2}}
+
+
+def source_id(spec):
+    return f"{spec['type']}:{spec['value']}"
+
+
+def preload(config):
+    """Load nền các model của config (dạng start_processing) vào MODELS mà không tạo engine"""
+    sources = {name: source_id(spec) for spec in camera_specs(config).values() for name in spec["detectors"]}
+    for name, factory, args in detector_specs(config):
+        MODELS.preload(name, factory, args, mode=config.get('inference_mode', INFERENCE_MODE),
+                       source=sources[name], **worker_options(config))
+
+
+def input_specs(specs, config):
+    """Spec tiền xử lý (frame_cache) của từng detector, theo PREPROCESS của class; None = nhận frame BGR thô"""
+    out = {name: getattr(factory, 'PREPROCESS', None) for name, factory, _ in specs}
+    # Gaze hai tầng: tracker cần full-frame BGR của mọi frame
+    if config.get('gaze_two_tier', GAZE_TWO_TIER) and 'gaze' in out: out['gaze'] = None
+    return out
+
+
+def create_gates(config):
+    """MotionGate cho từng detector được gate (rỗng khi tắt motion gating)"""
+    if not config.get('motion_gating', MOTION_GATING): return {}
+    thresholds = {**MOTION_GATE, **(config.get('motion_gate') or {})}
+    # Gaze hai tầng phải thấy mọi frame (tracker bám liên tục, không bỏ lỡ chớp mắt): không gate
+    if config.get('gaze_two_tier', GAZE_TWO_TIER): thresholds.pop('gaze', None)
+    max_stale = float(config.get('motion_max_stale', MOTION_MAX_STALE_S))
+    return {name: MotionGate(th, max_stale, MOTION_THUMB_WIDTH, MOTION_PIXEL_DELTA)
+            for name, th in thresholds.items() if th is not None}
+
+
+def create_blink_detector(config):
+    return BlinkDetector(open_ear=float(config.get('blink_open_ear', BLINK_OPEN_EAR)),
+                         min_duration=float(config.get('blink_min_ms', BLINK_MIN_MS)) / 1000.0,
+                         max_duration=float(config.get('blink_max_ms', BLINK_MAX_MS)) / 1000.0)
+
+
+def draw_tilt_gaze(disp, t_d, g_d):
+    """Vẽ (tại chỗ) kết quả tilt/gaze lên frame"""
+    if t_d.get('label'):
+        cv2.putText(disp, f"T: {t_d['label']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                    (0, 255, 0), 2)
+        if t_d.get('keypoints'):
+            for x, y in t_d['keypoints']: cv2.circle(disp, (int(x), int(y)), 4, (0, 255, 255), -1)
+
+    if g_d.get('label'):
+        col = (0, 255, 0) if "CENTER" in str(g_d['label']) else (0, 0, 255)
+        cv2.putText(disp, f"G: {g_d['label']}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, col, 2)
+        for eye in g_d.get('eyes', []):
+            cv2.circle(disp, tuple(int(v) for v in eye['rel']), 3, (0, 255, 0), 1, cv2.LINE_AA)
+    return disp
+
+
+def draw_posture(disp, p_d):
+    """Vẽ (tại chỗ) bbox posture lên frame"""
+    if p_d.get('label'):
+        if p_d.get('bbox'):
+            x, y, w, h = p_d['bbox']
+            lbl = str(p_d['label']).lower()
+            c = (50, 50, 255) if "bad" in lbl or "wrong" in lbl else (50, 255, 50)
+            cv2.rectangle(disp, (int(x - w / 2), int(y - h / 2)), (int(x + w / 2), int(y + h / 2)),
+                          c, 2)
+            cv2.putText(disp, f"P: {p_d['label']}", (int(x - w / 2), int(y - h / 2) - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, c, 2)
+    return disp
 
 
 class ProcessingEngine(threading.Thread):
-    def __init__(self, config, result_callback):
+    def __init__(self, config, result_callback, broadcaster=None):
         super().__init__()
         self.config = config
         self.result_callback = result_callback
+        self.broadcaster = broadcaster or FrameBroadcaster()
+        self.encoder = StreamEncoder(self.broadcaster)
         self.stop_event = threading.Event()
         self.logging_enabled = config.get('logging', False)
 
-        # Detector Objects
-        self.tilt_src = None
-        self.posture_src = None
-        self.tilt_det = None
-        self.posture_det = None
-        self.gaze_est = None
+        # Camera: cam_key -> {"type", "value", "detectors" chạy trên frame của camera, "stream" id cho encoder}
+        self.cameras = self._camera_specs()
+        self.det_cam = {name: cam for cam, spec in self.cameras.items() for name in spec["detectors"]}
+        self.srcs = {}
+
+        # Detector Objects: mỗi model chạy trên một InferenceWorker riêng
+        self.workers = {}
+        self.inputs = {}
+        self.inference_mode = config.get('inference_mode', INFERENCE_MODE)
+        self.gaze_two_tier = bool(config.get('gaze_two_tier', GAZE_TWO_TIER))
+        self.scheduler = self._create_scheduler()
 
         # Chống giật (State Persistence)
         self.last_tilt_data = {}
         self.last_gaze_data = {}
         self.last_posture_data = {}
 
-        self.csv_file = None
-        self.csv_writer = None
+        self.session_dir = None
+        self.session_logger = None
+        self.recorder = None
+        self.analytics = None
+        self.biopac = None
         self.frame_idx = 0
-        self.current_frame_1 = None
-        self.current_frame_2 = None
-        self.lock = threading.Lock()
+        # Số thứ tự frame cuối đã xử lý + tuổi frame (giây) theo từng camera
+        self.last_seq = {cam: -1 for cam in self.cameras}
+        self.frame_age = {cam: 0.0 for cam in self.cameras}
+        self.frame_time = {cam: 0.0 for cam in self.cameras}  # thời điểm chụp của frame vừa lấy
+        # Đếm frame đã lấy để tính FPS thực tế mỗi giây (metrics)
+        self.frames_grabbed = {cam: 0 for cam in self.cameras}
+        self._rate_mark = (time.time(), dict(self.frames_grabbed))
+        # Seq của frame sinh ra kết quả đang giữ trong last_*_data
+        self.result_seq = {"tilt": -1, "gaze": -1, "posture": -1}
+        # Seq gửi client: chỉ đổi khi kết quả thực sự đổi (channel seq không phát lại mỗi lần inference)
+        self.shown_seq = dict(self.result_seq)
+        # Chớp mắt: EAR của từng kết quả gaze theo thời điểm chụp frame (gaze_ts[seq])
+        self.blinks = create_blink_detector(config)
+        self.gaze_ts = {}
+        self.new_blinks = []
+
+        # ROI camera cận cảnh: tilt/gaze chạy trên vùng crop quanh mặt thay vì full 720p
+        # (gaze hai tầng tự crop quanh mặt và cần full-frame cho tracker)
+        self.rois = {}
+        if config.get('roi_tracking', ROI_TRACKING):
+            names = ('tilt',) if self.gaze_two_tier else ('tilt', 'gaze')
+            self.rois = {name: RoiTracker(pad=ROI_PADDING, min_size=ROI_MIN_SIZE) for name in names}
+        self.roi_pending = {}
+        self.gates = create_gates(config)
 
     def stop(self):
         """Hàm dừng thread an toàn"""
         self.stop_event.set()
 
     def _resolve_model_path(self, path):
-        """Tìm file model ở nhiều vị trí khác nhau"""
-        if not path: return None
-
-        # 1. Đường dẫn tuyệt đối hoặc đường dẫn do người dùng nhập
-        if os.path.exists(path):
-            return path
+        return resolve_model_path(path)
 
-        # 2. Tìm trong thư mục hiện tại (Current Working Directory)
-        cwd_path = os.path.join(os.getcwd(), path)
-        if os.path.exists(cwd_path):
-            return cwd_path
+    def _camera_specs(self):
+        return camera_specs(self.config)
 
-        # 3. Tìm trong thư mục chứa file code này
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        script_path = os.path.join(script_dir, path)
-        if os.path.exists(script_path):
-            return script_path
+    def _source_id(self, name):
+        """Camera cấp frame cho detector `name` (khóa MODELS của detector STATEFUL)"""
+        return source_id(self.cameras[self.det_cam[name]])
 
-        return None
+    def _create_src(self, cam_key):
+        spec = self.cameras[cam_key]
+        c_type, c_val = spec["type"], spec["value"]
+        try:
+            factory = source_factory(c_type, c_val, spec.get("width", WEBCAM_WIDTH),
+                                     spec.get("height", WEBCAM_HEIGHT))
+            if not THREADED_CAPTURE:
+                return factory()
+            # Chỉ stream IP mới tự kết nối lại; webcam mất là mất hẳn
+            return ThreadedSource(factory, name=cam_key, reconnect=c_type not in LOCAL_SOURCES,
+                                  backoff_min=IP_RECONNECT_BACKOFF_MIN, backoff_max=IP_RECONNECT_BACKOFF_MAX)
+        except Exception as e:
+            print(f"Error creating camera {cam_key}: {e}")
+            return None
 
-    def _create_src(self, type_key, val_key):
-        c_type = self.config.get(type_key, "Webcam")
-        c_val = self.config.get(val_key, "0")
+    def _create_scheduler(self):
+        overrides = self.config.get('schedule') or {}
+        tasks = {name: {**cfg, **overrides.get(name, {})} for name, cfg in SCHEDULE.items()}
+        if self.gaze_two_tier and 'hz' not in overrides.get('gaze', {}): tasks['gaze']['hz'] = GAZE_FAST_HZ
+        return AdaptiveScheduler(
+            tasks,
+            latency_budget=float(self.config.get('latency_budget_ms', LATENCY_BUDGET_MS)) / 1000.0,
+            capacity=float(self.config.get('inference_capacity', INFERENCE_CAPACITY)),
+        )
+
+    def _detector_specs(self):
+        """(tên, class detector, tham số) của các detector sẽ chạy trong phiên"""
+        return detector_specs(self.config, self._resolve_model_path)
+
+    def _add_worker(self, name, factory, args):
+        """Model được load bên trong worker nên không chặn vòng lặp chính.
+        Worker lấy từ MODELS: dùng chung giữa các engine (gom batch) và còn giữ sau khi engine dừng."""
         try:
-            if c_type == "Webcam":
-                try:
-                    idx = int(c_val)
-                except:
-                    idx = 0
-                return WebcamSource(idx, WEBCAM_WIDTH, WEBCAM_HEIGHT)
+            self.workers[name] = MODELS.acquire(name, factory, args, mode=self.inference_mode,
+                                                source=self._source_id(name), **worker_options(self.config))
+        except Exception as e:
+            print(f"Error starting {name} worker: {e}")
+
+    def _submit(self, name, seq, prep):
+        """prep: PreparedFrame của frame; detector nhận đầu vào đã tiền xử lý theo self.inputs"""
+        w = self.workers.get(name)
+        if not w or w.busy_for(self.name) or not self.scheduler.should_run(name): return False
+        roi = self.rois.get(name)
+        frame, box = prep.frame, None
+        if roi:
+            frame, offset = roi.crop(frame)
+            box = roi.box
+        # Cảnh tĩnh trong ROI: giữ last_*_data, không tốn một lần infer.
+        # So sánh trên tầng preview nhỏ nhất còn đủ chi tiết thay vì thu nhỏ lại từ ảnh gốc
+        gate = self.gates.get(name)
+        if gate:
+            with REGISTRY.time("stage_seconds", stage="motion", target=name):
+                run = gate.should_run(prep.region(box, 4 * gate.width))
+            if not run:
+                self.scheduler.skipped(name)
+                REGISTRY.inc("inferences_saved_total", detector=name)
+                return False
+        spec = self.inputs.get(name)
+        if spec:
+            with REGISTRY.time("stage_seconds", stage="preprocess", target=name):
+                frame = prep.model_input(spec, box)
+        if not w.submit(seq, frame, source=self.name): return False
+        if gate: gate.ran()
+        if roi: self.roi_pending[(name, seq)] = (offset, prep.shape)
+        if name == 'gaze': self.gaze_ts[seq] = self.frame_time[self.det_cam['gaze']]
+        self.scheduler.started(name)
+        return True
+
+    def _map_roi(self, name, seq, res):
+        """Đưa toạ độ kết quả chạy trên crop về ảnh gốc và cập nhật ROI tracker"""
+        roi = self.rois.get(name)
+        pending = self.roi_pending.pop((name, seq), None)
+        if not roi or not pending: return res
+        offset, shape = pending
+        ox, oy = offset
+
+        if name == 'tilt':
+            res['keypoints'] = shift_points(res.get('keypoints'), offset)
+            roi.update(res.get('keypoints') if res.get('label') else None, shape)
+        elif name == 'gaze':
+            for eye in res.get('eyes_data', []):
+                eye['rel'] = (eye['rel'][0] + ox, eye['rel'][1] + oy)
+            box = res.get('face_box')
+            if box:
+                res['face_box'] = (box[0] + ox, box[1] + oy, box[2] + ox, box[3] + oy)
+                roi.update([res['face_box'][:2], res['face_box'][2:]], shape)
             else:
-                return IPCameraSource(c_val)
+                roi.update(None, shape)
+                # Mất mặt: thử lấy vùng từ keypoints mặt (mũi, mắt, tai) của tilt
+                roi.seed((self.last_tilt_data.get('keypoints') or [])[:5], shape)
+        return res
+
+    def _collect_results(self):
+        """Gộp kết quả các worker vào last_*_data, chỉ nhận kết quả của frame mới hơn"""
+        for name, w in self.workers.items():
+            for seq, res, dt in w.poll(self.name):
+                self.scheduler.record(name, dt)
+                REGISTRY.observe("stage_seconds", dt, stage="infer", target=name)
+                ts = self.gaze_ts.pop(seq, None) if name == 'gaze' else None
+                if res.get('error'):
+                    print(f"{name} inference error: {res['error']}")
+                    REGISTRY.inc("inference_errors_total", detector=name)
+                    self.roi_pending.pop((name, seq), None)
+                    continue
+                res = self._map_roi(name, seq, res)
+                if seq <= self.result_seq[name]:
+                    REGISTRY.inc("results_stale_total", detector=name)
+                    continue
+                self.result_seq[name] = seq
+                shown = (self.last_tilt_data, self.last_gaze_data, self.last_posture_data)
+                if name == 'tilt':
+                    if res and res.get('label'): self.last_tilt_data = res
+                elif name == 'gaze':
+                    self.last_gaze_data = {"label": res.get('label'), "eyes": res.get('eyes_data', [])}
+                    event = self.blinks.update(res.get('ear'), ts or time.time())
+                    if event: self.new_blinks.append(event)
+                elif name == 'posture':
+                    if res and res.get('label'): self.last_posture_data = res
+                if shown != (self.last_tilt_data, self.last_gaze_data, self.last_posture_data):
+                    self.shown_seq[name] = seq
+
+    def _create_biopac(self):
+        spec = self.config.get('biopac', BIOPAC_SOURCE)
+        if not spec: return None
+        try:
+            from biopac import BiopacIngest, create_reader
+            return BiopacIngest(create_reader(spec)).start()
         except Exception as e:
-            print(f"Error creating camera {type_key}: {e}")
+            print(f"Error starting BIOPAC source {spec}: {e}")
             return None
 
+    def _grab(self, src, cam_key):
+        """Lấy frame mới nhất chưa xử lý của camera, None nếu chưa có frame mới"""
+        if isinstance(src, ThreadedSource):
+            frame, seq, ts = src.read_latest(self.last_seq[cam_key])
+            if frame is None: return None
+        else:
+            with REGISTRY.time("stage_seconds", stage="capture", target=cam_key):
+                ret, frame = src.read()
+            if not ret: return None
+            seq, ts = self.last_seq[cam_key] + 1, time.time()
+        self.last_seq[cam_key] = seq
+        self.frame_age[cam_key] = time.time() - ts
+        self.frame_time[cam_key] = ts
+        self.frames_grabbed[cam_key] += 1
+        REGISTRY.inc("frames_total", cam=cam_key)
+        return frame
+
+    def _update_rates(self, now):
+        """Cập nhật gauge FPS camera / Hz detector khoảng mỗi giây"""
+        mark, counts = self._rate_mark
+        if now - mark < 1.0: return
+        for cam, n in self.frames_grabbed.items():
+            REGISTRY.set("camera_fps", round((n - counts[cam]) / (now - mark), 2), cam=cam)
+        for name, info in self.scheduler.report()["detectors"].items():
+            if name in self.workers: REGISTRY.set("detector_hz", info["hz"], detector=name)
+        self._rate_mark = (now, dict(self.frames_grabbed))
+
+    def _overlay(self, cam_key, frame):
+        """Bản copy của frame có vẽ kết quả các detector chạy trên camera đó"""
+        dets = self.cameras[cam_key]["detectors"]
+        disp = frame.copy()
+        if 'tilt' in dets or 'gaze' in dets:
+            draw_tilt_gaze(disp, self.last_tilt_data if 'tilt' in dets else {},
+                           self.last_gaze_data if 'gaze' in dets else {})
+        if 'posture' in dets: draw_posture(disp, self.last_posture_data)
+        return disp
+
+    def _stream(self, cam_key, src, prep):
+        """Gửi frame cho encoder: bản có overlay (vẽ trên copy) cho client xem ảnh đã vẽ, frame gốc
+        (PreparedFrame, preview dùng chung với detector) cho client tự vẽ từ telemetry; cả hai kèm seq"""
+        cam_id, seq = self.cameras[cam_key]["stream"], self.last_seq[cam_key]
+        if self.encoder.wants(cam_id, overlay=True):
+            with REGISTRY.time("stage_seconds", stage="overlay", target=cam_key):
+                disp = self._overlay(cam_key, prep.frame)
+            self.encoder.submit(cam_id, disp, seq)
+        if self.encoder.wants(cam_id, overlay=False):
+            jpeg = src.jpeg_for(seq) if isinstance(src, ThreadedSource) else getattr(src, "last_jpeg", None)
+            self.encoder.submit(cam_id, prep, seq, overlay=False, jpeg=jpeg)
+
     def update_logging(self, enabled):
         self.logging_enabled = enabled
-        if enabled and not self.csv_file:
-            self._init_csv()
-        elif not enabled and self.csv_file:
-            self._close_csv()
-
-    def _init_csv(self):
-        now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        d = os.path.join(EXPORT_BASE_DIR, f"session_{now}")
-        os.makedirs(d, exist_ok=True)
-        path = os.path.join(d, "log_pro.csv")
-        self.csv_file = open(path, "w", newline="", encoding="utf-8")
-        self.csv_writer = csv.writer(self.csv_file)
-        header = ["Timestamp", "Frame", "Tilt_Label", "Tilt_Conf"]
-        kp_names = ["Nose", "L_Eye", "R_Eye", "L_Ear", "R_Ear", "L_Sho", "R_Sho"]
-        for name in kp_names: header.extend([f"{name}_x", f"{name}_y"])
-        header.extend(["Gaze_Label", "Pupil_L_x", "Pupil_L_y", "Pupil_R_x", "Pupil_R_y"])
-        header.extend(["Posture_Label", "Box_x", "Box_y", "Box_w", "Box_h"])
-        self.csv_writer.writerow(header)
-
-    def _close_csv(self):
-        if self.csv_file:
-            self.csv_file.close()
-            self.csv_file = None
-            self.csv_writer = None
+        if enabled and not self.session_logger:
+            self._start_logging()
+        elif not enabled and self.session_logger:
+            self._stop_logging()
+
+    def _session_name(self):
+        return "session_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def _start_logging(self):
+        from session_logger import SessionLogger
+        from session_recorder import SessionRecorder
+        from session_analytics import SessionAnalytics
+        self.session_dir = os.path.join(EXPORT_BASE_DIR, self._session_name())
+        self.session_logger = SessionLogger(
+            self.session_dir,
+            formats=self.config.get('log_formats', LOG_FORMATS),
+            dedup=self.config.get('log_dedup', LOG_DEDUP),
+        )
+        self.analytics = SessionAnalytics(self.session_dir)
+        if self.config.get('record_frames', RECORD_FRAMES):
+            self.recorder = SessionRecorder(
+                self.session_dir,
+                cams=tuple(self.cameras),
+                segment_seconds=RECORD_SEGMENT_SECONDS,
+                quality=self.config.get('record_quality', RECORD_JPEG_QUALITY),
+                width=self.config.get('record_width', RECORD_WIDTH),
+                max_fps=self.config.get('record_fps', RECORD_FPS),
+            )
+        if self.biopac: self.biopac.attach(self.session_dir)
+
+    def _stop_logging(self):
+        if self.session_logger:
+            self.session_logger.close()
+            self.session_logger = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        if self.analytics:
+            self.analytics.close()
+            self.analytics = None
+        if self.biopac: self.biopac.detach()
 
     def run(self):
         print("Engine Running...")
@@ -117,134 +476,84 @@ class ProcessingEngine(threading.Thread):
             files = [f for f in os.listdir('.') if f.endswith('.pt')]
             print(f"DEBUG: .pt files found in root: {files}")
 
-            raw_tilt_path = self.config.get('tilt_model', '').strip().strip('"')
-            raw_posture_path = self.config.get('posture_model', '').strip().strip('"')
-
-            # Resolve Tilt Path
-            tilt_path = self._resolve_model_path(raw_tilt_path)
-            if tilt_path:
-                print(f"Loading Tilt Model from: {tilt_path}")
-                try:
-                    self.tilt_det = TiltDetector(tilt_path)
-                except Exception as e:
-                    print(f"Error Loading Tilt Model: {e}")
-            else:
-                print(f"ERROR: Tilt Model file not found: '{raw_tilt_path}'")
-
-            self.tilt_src = self._create_src('tilt_type', 'tilt_val')
-
-            # Resolve Posture Path
-            posture_path = self._resolve_model_path(raw_posture_path)
-            if posture_path:
-                print(f"Loading Posture Model from: {posture_path}")
-                try:
-                    self.posture_det = PostureDetector(posture_path)
-                except Exception as e:
-                    print(f"Error Loading Posture Model: {e}")
-            else:
-                print(f"ERROR: Posture Model file not found: '{raw_posture_path}'")
+            specs = self._detector_specs()
+            self.inputs = input_specs(specs, self.config)
+            for name, factory, args in specs:
+                self._add_worker(name, factory, args)
 
-            self.posture_src = self._create_src('posture_type', 'posture_val')
+            for cam in self.cameras:
+                src = self._create_src(cam)
+                if src: self.srcs[cam] = src
+            self.biopac = self._create_biopac()
 
-            if self.config.get('use_gaze', True):
-                self.gaze_est = GazeEstimator(device=GAZE_DEVICE)
-
-            if self.logging_enabled: self._init_csv()
+            if self.logging_enabled: self._start_logging()
+            self.encoder.start()
 
             # --- MAIN LOOP ---
             while not self.stop_event.is_set():
                 start_time = time.time()
-
-                # CAM 1
-                if self.tilt_src:
-                    ret, frame = self.tilt_src.read()
-                    if ret:
-                        disp = frame.copy()
-                        if self.frame_idx % 2 == 0 and self.tilt_det:
-                            res = self.tilt_det.infer(frame)
-                            if res and res.get('label'): self.last_tilt_data = res
-
-                        if self.gaze_est and (self.frame_idx % 3 == 0):
-                            res = self.gaze_est.infer(frame)
-                            self.last_gaze_data = {"label": res.get('label'), "eyes": res.get('eyes_data', [])}
-                            if res.get('annotated') is not None: disp = res['annotated']
-
-                        t_d = self.last_tilt_data
-                        if t_d.get('label'):
-                            cv2.putText(disp, f"T: {t_d['label']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                                        (0, 255, 0), 2)
-                            if t_d.get('keypoints'):
-                                for x, y in t_d['keypoints']: cv2.circle(disp, (int(x), int(y)), 4, (0, 255, 255), -1)
-
-                        g_d = self.last_gaze_data
-                        if g_d.get('label'):
-                            col = (0, 255, 0) if "CENTER" in str(g_d['label']) else (0, 0, 255)
-                            cv2.putText(disp, f"G: {g_d['label']}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, col, 2)
-
-                        with self.lock:
-                            r, b = cv2.imencode('.jpg', disp)
-                            if r: self.current_frame_1 = b.tobytes()
-
-                # CAM 2
-                if self.posture_src:
-                    ret, frame = self.posture_src.read()
-                    if ret:
-                        disp = frame.copy()
-                        if self.frame_idx % 3 == 0 and self.posture_det:
-                            res = self.posture_det.infer(frame)
-                            if res and res.get('label'): self.last_posture_data = res
-
-                        p_d = self.last_posture_data
-                        if p_d.get('label'):
-                            if p_d.get('bbox'):
-                                x, y, w, h = p_d['bbox']
-                                lbl = str(p_d['label']).lower()
-                                c = (50, 50, 255) if "bad" in lbl or "wrong" in lbl else (50, 255, 50)
-                                cv2.rectangle(disp, (int(x - w / 2), int(y - h / 2)), (int(x + w / 2), int(y + h / 2)),
-                                              c, 2)
-                                cv2.putText(disp, f"P: {p_d['label']}", (int(x - w / 2), int(y - h / 2) - 10),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, c, 2)
-
-                        with self.lock:
-                            r, b = cv2.imencode('.jpg', disp)
-                            if r: self.current_frame_2 = b.tobytes()
+                self._collect_results()
+                self.scheduler.rebalance(start_time)
+
+                # Mọi consumer của một frame (detector, motion gate, recorder, encoder) dùng chung một PreparedFrame
+                for cam, spec in self.cameras.items():
+                    src = self.srcs.get(cam)
+                    frame = self._grab(src, cam) if src else None
+                    if frame is None: continue
+                    prep = PreparedFrame(frame, self.last_seq[cam])
+                    for name in spec["detectors"]: self._submit(name, prep.seq, prep)
+                    if self.recorder: self.recorder.record(cam, prep, self.frame_idx, self.frame_time[cam])
+                    # Chỉ vẽ overlay + encode khi có người xem
+                    self._stream(cam, src, prep)
 
                 # SEND DATA
                 payload = {
                     "tilt": self.last_tilt_data,
                     "gaze": self.last_gaze_data,
                     "posture": self.last_posture_data,
-                    "biopac": 0
+                    "biopac": self.biopac.snapshot() if self.biopac else 0,
+                    "blinks": {"count": self.blinks.count, "recent": list(self.blinks.events)},
+                    "seq": dict(self.shown_seq),
+                    # Đổi mỗi vòng lặp: channel riêng, telemetry gửi thưa hơn (TELEMETRY_STATUS_HZ)
+                    "status": {
+                        "sched": self.scheduler.report(),
+                        "roi": {name: roi.stats() for name, roi in self.rois.items() if name in self.workers},
+                        "motion": {name: gate.stats() for name, gate in self.gates.items() if name in self.workers},
+                        "frame_age_ms": {k: round(v * 1000, 1) for k, v in self.frame_age.items()}
+                    }
                 }
-                self.result_callback(payload)
-
-                if self.logging_enabled and self.csv_writer:
-                    self._write_log(self.last_tilt_data, self.last_gaze_data, self.last_posture_data)
-
+                with REGISTRY.time("stage_seconds", stage="callback", target="engine"):
+                    self.result_callback(payload)
+
+                if self.logging_enabled and self.session_logger:
+                    self.session_logger.log(self.frame_idx, self.last_tilt_data, self.last_gaze_data,
+                                            self.last_posture_data)
+                    for event in self.new_blinks: self.session_logger.log_blink(self.frame_idx, event)
+                    # Chớp mắt đếm theo sự kiện của BlinkDetector (đủ tần suất), không theo nhãn mỗi vòng lặp
+                    self.analytics.add(self.last_tilt_data, self.last_gaze_data, self.last_posture_data,
+                                       blinks=len(self.new_blinks) if 'gaze' in self.workers else None)
+                    if self.biopac:
+                        self.biopac.mark_frame(self.frame_idx, self.frame_time[next(iter(self.cameras))] or start_time)
+
+                self.new_blinks = []
                 self.frame_idx += 1
+                REGISTRY.observe("stage_seconds", time.time() - start_time, stage="loop", target="engine")
+                self._update_rates(time.time())
                 eventlet.sleep(0.01)
 
         except Exception as e:
             print(f"Engine Crash: {e}")
         finally:
             # FORCE CLEANUP
-            if self.tilt_src: self.tilt_src.release()
-            if self.posture_src: self.posture_src.release()
-            self._close_csv()
+            self.encoder.stop()
+            for w in self.workers.values(): MODELS.release(w, source=self.name)
+            for src in self.srcs.values(): src.release()
+            self._stop_logging()
+            if self.biopac: self.biopac.stop()
             print("Engine Stopped & Resources Released")
 
-    def _write_log(self, t_d, g_d, p_d):
-        try:
-            ts = datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]
-            t_lbl = t_d.get('label', "") if t_d else ""
-            t_conf = t_d.get('confidence', 0) if t_d else 0
-            row = [ts, self.frame_idx, t_lbl, t_conf]
-            self.csv_writer.writerow(row)
-        except:
-            pass
-
     def get_frame(self, cam_id):
-        with self.lock:
-            if cam_id == 1: return self.current_frame_1
-            if cam_id == 2: return self.current_frame_2
+        for key in self.encoder.profiles(cam_id):
+            frame = self.broadcaster.latest(key)
+            if frame: return frame
         return None
\ No newline at end of file
@@ -0,0 +1,67 @@
+from typing import List, Optional, Sequence, Tuple
+
+
+def shift_points(points, offset):
+    """Đổi toạ độ từ ảnh crop về ảnh gốc; điểm (0, 0) là keypoint không thấy, giữ nguyên"""
+    if not points: return points
+    ox, oy = offset
+    return [(x + ox, y + oy) if (x or y) else (x, y) for x, y in points]
+
+
+class RoiTracker:
+    """Theo dõi vùng quan tâm (mặt / đầu-vai) để detector chạy trên ảnh crop.
+
+    Vùng được tính từ các điểm của lần detect trước (keypoints, face box), nới
+    thêm `pad` mỗi phía và không nhỏ hơn `min_size`. Sau `max_misses` lần liên
+    tiếp không tìm thấy, tracker coi như mất dấu và quay lại chạy full-frame.
+    """
+
+    def __init__(self, pad: float = 0.35, min_size: int = 192, max_misses: int = 2):
+        self.pad = pad
+        self.min_size = min_size
+        self.max_misses = max_misses
+        self.box: Optional[Tuple[int, int, int, int]] = None
+        self.misses = 0
+        self.last_area = 1.0
+
+    @property
+    def tracking(self) -> bool:
+        return self.box is not None
+
+    def update(self, points: Optional[Sequence[Tuple[float, float]]], frame_shape):
+        """Cập nhật vùng từ các điểm (toạ độ ảnh gốc); None/rỗng = không tìm thấy"""
+        pts = [(x, y) for x, y in (points or []) if x or y]
+        if not pts:
+            self.misses += 1
+            if self.misses >= self.max_misses: self.box = None
+            return
+        self.misses = 0
+
+        h, w = frame_shape[:2]
+        xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+        x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+        bw = max(x1 - x0, 1.0) * (1 + 2 * self.pad)
+        bh = max(y1 - y0, 1.0) * (1 + 2 * self.pad)
+        bw, bh = max(bw, self.min_size), max(bh, self.min_size)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+
+        x0, y0 = int(max(0, cx - bw / 2)), int(max(0, cy - bh / 2))
+        x1, y1 = int(min(w, cx + bw / 2)), int(min(h, cy + bh / 2))
+        self.box = (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+    def seed(self, points: Optional[List[Tuple[float, float]]], frame_shape):
+        """Khởi tạo từ nguồn khác (vd. keypoints mặt của tilt) khi đang mất dấu"""
+        if self.box is None and points: self.update(points, frame_shape)
+
+    def crop(self, frame):
+        """Trả về (ảnh crop, offset); full-frame với offset (0, 0) khi chưa/không tracking"""
+        if self.box is None:
+            self.last_area = 1.0
+            return frame, (0, 0)
+        x0, y0, x1, y1 = self.box
+        h, w = frame.shape[:2]
+        self.last_area = ((x1 - x0) * (y1 - y0)) / float(w * h)
+        return frame[y0:y1, x0:x1], (x0, y0)
+
+    def stats(self):
+        return {"tracking": self.tracking, "area": round(self.last_area, 3)}
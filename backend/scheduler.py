@@ -0,0 +1,120 @@
+import collections
+import time
+
+
+class _Task:
+    def __init__(self, name, target_hz, min_hz, priority):
+        self.name = name
+        self.target_hz = float(target_hz)
+        self.min_hz = float(min(min_hz, target_hz))
+        self.priority = int(priority)
+        self.allowed_hz = self.target_hz
+        self.cost = None          # EWMA thời gian infer (giây)
+        self.next_due = 0.0
+        self.runs = collections.deque()
+
+
+class AdaptiveScheduler:
+    """Quyết định khi nào chạy từng detector dựa trên thời gian infer đo được.
+
+    Mỗi detector có target Hz, min Hz và priority. Tổng tải (Hz x thời gian infer)
+    được giới hạn bởi `capacity` (số worker-giây mỗi giây). Khi quá tải, detector
+    priority thấp bị hạ xuống min Hz trước, sau đó mới tới detector priority cao.
+    `capacity` tự điều chỉnh (AIMD): giảm khi detector priority cao nhất vượt
+    latency budget, tăng dần lại khi mọi detector nằm trong budget.
+    """
+
+    def __init__(self, tasks, latency_budget: float = 0.15, capacity: float = 2.0,
+                 alpha: float = 0.2, window: float = 2.0, rebalance_every: float = 1.0):
+        self.tasks = {}
+        for name, cfg in tasks.items():
+            self.tasks[name] = _Task(name, cfg.get('hz', 10), cfg.get('min_hz', 1), cfg.get('priority', 1))
+        self.latency_budget = latency_budget
+        self.max_capacity = capacity
+        self.capacity = capacity
+        self.alpha = alpha
+        self.window = window
+        self.rebalance_every = rebalance_every
+        self._last_rebalance = 0.0
+        self._report = {}
+
+    def should_run(self, name: str, now: float = None) -> bool:
+        t = self.tasks.get(name)
+        if t is None or t.allowed_hz <= 0: return False
+        return (now or time.time()) >= t.next_due
+
+    def started(self, name: str, now: float = None):
+        t = self.tasks.get(name)
+        if t is None: return
+        now = now or time.time()
+        self._advance(t, now)
+        t.runs.append(now)
+
+    def skipped(self, name: str, now: float = None):
+        """Lượt chạy đến hạn nhưng được bỏ qua (vd. cảnh tĩnh): sang hạn kế tiếp, không tính là một lần chạy"""
+        t = self.tasks.get(name)
+        if t is not None: self._advance(t, now or time.time())
+
+    def _advance(self, t, now):
+        period = 1.0 / t.allowed_hz if t.allowed_hz > 0 else self.window
+        # Hạn kế tiếp tính từ hạn cũ (không trôi theo nhịp camera); trễ quá một chu kỳ thì đặt lại
+        t.next_due = t.next_due + period if now - t.next_due < period else now + period
+
+    def record(self, name: str, seconds: float):
+        """Cập nhật thời gian infer đo được (EWMA)"""
+        t = self.tasks.get(name)
+        if t is None: return
+        t.cost = seconds if t.cost is None else (1 - self.alpha) * t.cost + self.alpha * seconds
+
+    def rebalance(self, now: float = None):
+        now = now or time.time()
+        if now - self._last_rebalance < self.rebalance_every: return
+        self._last_rebalance = now
+
+        measured = [t for t in self.tasks.values() if t.cost is not None]
+        if measured:
+            top = max(t.priority for t in measured)
+            worst = max(t.cost for t in measured if t.priority == top)
+            if worst > self.latency_budget:
+                self.capacity = max(0.25, self.capacity * 0.8)
+            else:
+                self.capacity = min(self.max_capacity, self.capacity + 0.1)
+
+        self._allocate()
+        self._report = self._build_report(now)
+
+    def _allocate(self):
+        # Một worker không thể chạy nhanh hơn 1 / cost
+        for t in self.tasks.values():
+            t.allowed_hz = t.target_hz if t.cost is None else min(t.target_hz, 1.0 / max(t.cost, 1e-3))
+
+        # Bảo đảm min Hz cho tất cả, phần còn lại chia theo priority giảm dần
+        load = lambda t, hz: hz * (t.cost or 0.0)
+        remaining = self.capacity - sum(load(t, t.min_hz) for t in self.tasks.values())
+        for prio in sorted({t.priority for t in self.tasks.values()}, reverse=True):
+            group = [t for t in self.tasks.values() if t.priority == prio]
+            extra = sum(load(t, t.allowed_hz - t.min_hz) for t in group)
+            if extra <= remaining:
+                remaining -= extra
+                continue
+            # Không đủ: chia đều tỉ lệ trong nhóm, các nhóm thấp hơn chỉ còn min Hz
+            ratio = max(remaining, 0.0) / extra if extra > 0 else 0.0
+            for t in group:
+                t.allowed_hz = t.min_hz + (t.allowed_hz - t.min_hz) * ratio
+            remaining = 0.0
+
+    def _build_report(self, now):
+        detectors = {}
+        for t in self.tasks.values():
+            while t.runs and now - t.runs[0] > self.window: t.runs.popleft()
+            detectors[t.name] = {
+                "hz": round(len(t.runs) / self.window, 2),
+                "target_hz": t.target_hz,
+                "allowed_hz": round(t.allowed_hz, 2),
+                "cost_ms": round(t.cost * 1000, 1) if t.cost is not None else None,
+                "priority": t.priority,
+            }
+        return {"detectors": detectors, "capacity": round(self.capacity, 2)}
+
+    def report(self):
+        return self._report
@@ -1,16 +1,29 @@
 import os
+import re
 import sys
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import webbrowser
 import eventlet
 
 # Monkey patch FIRST
 eventlet.monkey_patch()
 
+import numpy as np
 from flask import Flask, Response, request, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 
-from processing_engine import ProcessingEngine
+from config import (STREAM_MAX_FPS, STREAM_WIDTH, STREAM_JPEG_QUALITY, STREAM_OVERLAY, TELEMETRY_RATE_HZ,
+                    TELEMETRY_STATUS_HZ, STATS_INTERVAL, PRELOAD_MODELS, EXPORT_BASE_DIR, CAMERA_PIPELINES)
+from processing_engine import ProcessingEngine, preload as preload_models
+from frame_broadcaster import FrameBroadcaster
+from stream_encoder import stream_key
+from telemetry import TelemetryPublisher, check_rate
+from metrics import REGISTRY
+from model_registry import MODELS
 
 # Xác định thư mục chứa file tĩnh (Frontend Build)
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -27,6 +40,14 @@ CORS(app)
 
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 engine = None
+pipelines = None  # PipelineManager cho chế độ nhiều camera
+# Dùng chung giữa các lần restart engine để client MJPEG không phải kết nối lại
+broadcaster = FrameBroadcaster()
+telemetry = TelemetryPublisher(socketio, TELEMETRY_RATE_HZ, TELEMETRY_STATUS_HZ)
+telemetry_rooms = {}  # sid -> room
+stats_clients = set()  # sid đang nhận event 'stats'
+stats_running = False
+STATS_ROOM = "stats"
 
 
 # --- ROUTES ---
@@ -45,42 +66,263 @@ def serve_static(path):
 
 
 # --- VIDEO STREAMING ---
-def gen_frames(cam_id):
-    global engine
-    while True:
-        if engine and engine.is_alive():
-            frame = engine.get_frame(cam_id)
-            if frame:
-                yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            else:
-                eventlet.sleep(0.01)
-        else:
-            eventlet.sleep(0.5)
+def gen_frames(key, max_fps):
+    """Chỉ gửi frame mới, tối đa max_fps; client chậm nhảy thẳng tới frame mới nhất"""
+    min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+    last_seq = 0
+    broadcaster.subscribe(key)
+    try:
+        while True:
+            item = broadcaster.wait_for(key, last_seq, timeout=1.0)
+            if item is None: continue
+            last_seq, frame, frame_seq, source_width = item
+            sent_at = time.time()
+            # Content-Length + X-Frame-Seq để client (fetch) tách ảnh và ghép với telemetry cùng seq
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\nX-Frame-Seq: %d\r\n'
+                   b'X-Source-Width: %d\r\n\r\n' % (len(frame), frame_seq, source_width) + frame + b'\r\n')
+            wait = min_interval - (time.time() - sent_at)
+            if wait > 0: eventlet.sleep(wait)
+    finally:
+        broadcaster.unsubscribe(key)
+
+
+def _query_num(name, default, cast=float):
+    try:
+        return cast(request.args.get(name, default))
+    except ValueError:
+        return default
+
+
+def _stream_response(cam_id):
+    """?w= (0 = full), ?q= (1-100), ?fps=, ?overlay=0|1; mặc định lấy từ config của phiên đang chạy"""
+    session_cfg = engine.config if engine else {}
+    width = _query_num('w', session_cfg.get('stream_width', STREAM_WIDTH), int)
+    quality = min(100, max(1, _query_num('q', session_cfg.get('stream_quality', STREAM_JPEG_QUALITY), int)))
+    max_fps = _query_num('fps', STREAM_MAX_FPS)
+    overlay = _query_num('overlay', int(session_cfg.get('stream_overlay', STREAM_OVERLAY)), int) != 0
+    key = stream_key(cam_id, max(0, width), quality, overlay)
+    return Response(gen_frames(key, max_fps), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 @app.route('/video_feed_1')
 def video_feed_1():
-    return Response(gen_frames(1), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return _stream_response(1)
 
 
 @app.route('/video_feed_2')
 def video_feed_2():
-    return Response(gen_frames(2), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return _stream_response(2)
+
+
+@app.route('/video_feed/<cam>')
+def video_feed(cam):
+    """Camera theo tên pipeline; '1' / '2' là hai camera của engine cũ"""
+    if pipelines and cam in pipelines.pipelines: return _stream_response(cam)
+    if cam in ('1', '2'): return _stream_response(int(cam))
+    return "Unknown camera", 404
+
+
+@app.route('/pipelines')
+def pipeline_list():
+    return {"running": bool(pipelines and pipelines.is_alive()),
+            "pipelines": pipelines.status() if pipelines else []}
+
+
+def _update_client_gauges():
+    REGISTRY.set("stream_clients", sum(broadcaster.subscribers.values()))
+    REGISTRY.set("telemetry_clients", len(telemetry_rooms))
+
+
+@app.route('/metrics')
+def metrics():
+    """Histogram từng stage + counter/gauge theo định dạng Prometheus"""
+    _update_client_gauges()
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+# --- PLAYBACK (phiên đã ghi với record_frames) ---
+SESSION_RE = re.compile(r'^session_\w+$')
+
+
+def _recording(session):
+    # Playback / log / analytics / pipeline chỉ import khi được dùng: khởi động server không tải các phần này
+    from session_recorder import RecordingReader, META_FILE
+    session_dir = os.path.join(EXPORT_BASE_DIR, session)
+    if not SESSION_RE.match(session) or not os.path.exists(os.path.join(session_dir, META_FILE)): return None
+    return RecordingReader(session_dir)
+
+
+@app.route('/sessions')
+def list_sessions():
+    out = []
+    if os.path.isdir(EXPORT_BASE_DIR):
+        for name in sorted(os.listdir(EXPORT_BASE_DIR), reverse=True):
+            try:
+                rec = _recording(name)
+            except (OSError, ValueError):
+                continue
+            if rec is None: continue
+            out.append({"session": name, "start": rec.start,
+                        "cams": {cam: {"frames": len(rec.index(cam)), "duration": round(rec.duration(cam), 3)}
+                                 for cam in rec.cams}})
+    return {"sessions": out}
+
+
+@app.route('/playback/<session>/<cam>/frame')
+def playback_frame(session, cam):
+    """Một ảnh JPEG tại ?t= (giây từ đầu phiên) hoặc ?frame= (cột Frame của log)"""
+    rec = _recording(session)
+    if rec is None or cam not in rec.cams: return "Not found", 404
+    if not len(rec.index(cam)): return "No frames", 404
+    if 'frame' in request.args:
+        pos = rec.seek_frame(cam, _query_num('frame', 0, int))
+    else:
+        pos = rec.seek(cam, _query_num('t', 0.0))
+    data, ts, frame_idx = rec.read(cam, pos)
+    return Response(data, mimetype='image/jpeg',
+                    headers={'X-Timestamp': f"{ts:.3f}", 'X-Offset': f"{ts - rec.start:.3f}", 'X-Frame': str(frame_idx)})
+
+
+def gen_playback(rec, cam, pos, speed):
+    """MJPEG theo đúng nhịp ghi (chia cho speed), đọc tuần tự từ vị trí đã seek"""
+    idx = rec.index(cam)
+    started, first_ts = time.time(), float(idx["ts"][pos])
+    while pos < len(idx):
+        data, ts, _ = rec.read(cam, pos)
+        wait = (ts - first_ts) / speed - (time.time() - started)
+        if wait > 0: eventlet.sleep(wait)
+        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+        pos += 1
+        if pos >= len(idx): idx = rec.index(cam)  # phiên đang ghi: đọc lại chỉ mục
+
+
+@app.route('/playback/<session>/<cam>/stream')
+def playback_stream(session, cam):
+    """?t= vị trí bắt đầu (giây), ?speed= tốc độ phát"""
+    rec = _recording(session)
+    if rec is None or cam not in rec.cams: return "Not found", 404
+    if not len(rec.index(cam)): return "No frames", 404
+    speed = max(0.1, _query_num('speed', 1.0))
+    pos = rec.seek(cam, _query_num('t', 0.0))
+    return Response(gen_playback(rec, cam, pos, speed), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/playback/<session>/data')
+def playback_data(session):
+    """Các dòng log (.rec) trong khoảng ?t0=&t1= (giây từ đầu phiên) để đồng bộ với video"""
+    rec = _recording(session)
+    path = os.path.join(EXPORT_BASE_DIR, session, "log_pro.rec")
+    if rec is None or not os.path.exists(path): return "Not found", 404
+    from session_logger import load_records
+    rows = load_records(path)
+    t0, t1 = rec.start + _query_num('t0', 0.0), rec.start + _query_num('t1', 1e9)
+    lo, hi = np.searchsorted(rows["Timestamp"], [t0, t1])
+    return {"session": session, "start": rec.start, "count": int(hi - lo),
+            "columns": {name: _json_column(rows[name][lo:hi]) for name in rows.dtype.names}}
+
+
+def _json_column(col):
+    from session_logger import decode_labels
+    if col.dtype.kind == "S": return decode_labels(col).tolist()
+    if col.dtype.kind == "f": return [None if v != v else round(v, 4) for v in col.tolist()]  # NaN -> null
+    return col.tolist()
+
+
+@app.route('/analytics')
+def analytics_query():
+    """?t0=&t1= (epoch giây), ?sessions=a,b (mặc định tất cả), ?series=1 kèm từng phút; tính từ rollup"""
+    import session_analytics
+    sessions = [s for s in request.args.get('sessions', '').split(',') if SESSION_RE.match(s)]
+    extra = {}
+    if engine and engine.analytics and engine.session_dir:
+        extra[os.path.basename(engine.session_dir)] = engine.analytics.pending()
+    if pipelines: extra.update({name: a["pending"] for name, a in pipelines.analytics().items()})
+    return session_analytics.query(EXPORT_BASE_DIR, _query_num('t0', 0.0), _query_num('t1', 0.0),
+                                   sessions=sessions, extra=extra, series=request.args.get('series') == '1')
 
 
 # --- SOCKET EVENTS ---
 def broadcast_data(data):
-    socketio.emit('data_update', data)
+    # Chỉ lưu bản mới nhất; TelemetryPublisher gom lại và gửi phần thay đổi theo nhịp cố định
+    telemetry.publish(data)
+
+
+def _join_telemetry(channels=None, binary=False):
+    old = telemetry_rooms.pop(request.sid, None)
+    if old:
+        leave_room(old)
+        telemetry.unsubscribe(old)
+    room = telemetry.subscribe(channels, binary)
+    telemetry_rooms[request.sid] = room
+    join_room(room)
+    # Client mới cần trạng thái đầy đủ, sau đó chỉ nhận delta
+    event, data = telemetry.encode(telemetry.snapshot(channels), telemetry.rooms[room][1])
+    emit(event, data)
+
+
+@socketio.on('connect')
+def handle_connect():
+    telemetry.start()
+    _join_telemetry()
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    room = telemetry_rooms.pop(request.sid, None)
+    if room: telemetry.unsubscribe(room)
+    stats_clients.discard(request.sid)
+
+
+def _stats_loop():
+    global stats_running
+    while stats_clients:
+        _update_client_gauges()
+        stats = {"ts": time.time(), "metrics": REGISTRY.snapshot()}
+        analytics = engine.analytics if engine else None
+        if analytics: stats["analytics"] = analytics.live()
+        if pipelines: stats["pipelines_analytics"] = {name: a["live"] for name, a in pipelines.analytics().items()}
+        socketio.emit('stats', stats, to=STATS_ROOM)
+        socketio.sleep(STATS_INTERVAL)
+    stats_running = False
+
+
+@socketio.on('subscribe_stats')
+def handle_subscribe_stats(data=None):
+    """data = {'enabled': bool}; client nhận event 'stats' mỗi STATS_INTERVAL giây"""
+    global stats_running
+    if (data or {}).get('enabled', True):
+        stats_clients.add(request.sid)
+        join_room(STATS_ROOM)
+        if not stats_running:
+            stats_running = True
+            socketio.start_background_task(_stats_loop)
+    else:
+        stats_clients.discard(request.sid)
+        leave_room(STATS_ROOM)
+
+
+@socketio.on('subscribe_telemetry')
+def handle_subscribe(data=None):
+    """data = {'channels': ['tilt', 'gaze', ...] (bỏ trống = tất cả), 'binary': bool}"""
+    data = data or {}
+    _join_telemetry(data.get('channels'), bool(data.get('binary', False)))
 
 
 @socketio.on('start_processing')
 def handle_start(config):
     global engine
+    # Kiểm tra trước khi dừng engine cũ: config lỗi không làm mất phiên đang chạy
+    try:
+        rate_hz = check_rate(config.get('telemetry_hz', TELEMETRY_RATE_HZ))
+    except (TypeError, ValueError) as e:
+        emit('status', {'msg': f'Invalid telemetry_hz: {e}', 'running': bool(engine and engine.is_alive())})
+        return
     if engine and engine.is_alive():
         engine.stop()
         engine.join()
 
-    engine = ProcessingEngine(config, broadcast_data)
+    telemetry.set_rate(rate_hz)
+    engine = ProcessingEngine(config, broadcast_data, broadcaster)
     engine.start()
     emit('status', {'msg': 'Started', 'running': True})
 
@@ -93,24 +335,83 @@ def handle_stop(data=None):
     emit('status', {'msg': 'Stopped', 'running': False})
 
 
+def _start_pipelines(config):
+    global pipelines
+    _stop_pipelines()
+    from camera_pipeline import PipelineManager
+    pipelines = PipelineManager(config, broadcast_data, broadcaster)
+    pipelines.start()
+
+
+def _stop_pipelines():
+    global pipelines
+    if pipelines and pipelines.is_alive():
+        pipelines.stop()
+        pipelines.join()
+    pipelines = None
+
+
+@socketio.on('start_pipelines')
+def handle_start_pipelines(config):
+    """config = {'cameras': [{'name', 'type', 'value', 'detectors'}...], + khóa model như start_processing}"""
+    _start_pipelines(config or {})
+    emit('pipeline_status', pipelines.status())
+
+
+@socketio.on('stop_pipelines')
+def handle_stop_pipelines(data=None):
+    _stop_pipelines()
+    emit('pipeline_status', [])
+
+
+@socketio.on('pipeline_status')
+def handle_pipeline_status(data=None):
+    emit('pipeline_status', pipelines.status() if pipelines else [])
+
+
 @socketio.on('shutdown_server')
 def handle_server_shutdown():
     print("SHUTDOWN COMMAND RECEIVED")
     global engine
     if engine: engine.stop()
+    if pipelines: pipelines.stop()
     emit('status', {'msg': 'Server Shutting Down'})
 
     def force_exit():
         eventlet.sleep(1)
+        # os._exit bỏ qua atexit: tự unlink shared memory của các pipeline còn chạy
+        camera_pipeline = sys.modules.get('camera_pipeline')
+        if camera_pipeline: camera_pipeline.unlink_all()
         os._exit(0)
 
     eventlet.spawn(force_exit)
 
 
+@socketio.on('preload_models')
+def handle_preload(config):
+    """Load nền model của config (cùng dạng start_processing) để lần start sau không phải chờ"""
+    preload_models(config or {})
+    emit('model_status', MODELS.status())
+
+
+@socketio.on('unload_models')
+def handle_unload(data=None):
+    """data = {'name': 'tilt' | 'posture' | 'gaze'} (bỏ trống = mọi model đang rảnh)"""
+    n = MODELS.unload((data or {}).get('name'))
+    print(f"Unloaded {n} idle model(s)")
+    emit('model_status', MODELS.status())
+
+
+@socketio.on('model_status')
+def handle_model_status(data=None):
+    emit('model_status', MODELS.status())
+
+
 @socketio.on('update_logging')
 def handle_logging(data):
     global engine
     if engine: engine.update_logging(data.get('logging', False))
+    if pipelines: pipelines.update_logging(data.get('logging', False))
 
 
 if __name__ == '__main__':
@@ -118,7 +419,7 @@ if __name__ == '__main__':
     URL = f"http://127.0.0.1:{PORT}"
 
     print(f"--- BioVision Server ---")
-    print(f"Serving at: {URL}")
+    print(f"Serving at: {URL} (startup imports: {time.perf_counter() - _IMPORT_STARTED:.2f}s)")
 
 
     def open_browser():
@@ -127,6 +428,11 @@ if __name__ == '__main__':
 
 
     eventlet.spawn(open_browser)
+    if PRELOAD_MODELS:
+        print("Preloading models in background...")
+        preload_models(PRELOAD_MODELS)
+    if CAMERA_PIPELINES:
+        _start_pipelines(CAMERA_PIPELINES)
 
     try:
         socketio.run(app, host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,330 @@
+"""Thống kê phiên tính dần theo thời gian thực, lưu rollup theo phút để truy vấn nhanh.
+
+Engine gọi `SessionAnalytics.add` mỗi vòng lặp: thời gian (giây) của từng nhãn
+tilt/gaze/posture được cộng dồn theo khoảng cách giữa hai mẫu (tối đa `max_gap`),
+chớp mắt đếm theo sự kiện engine truyền vào (`blinks`), không có thì theo lúc nhãn
+gaze chuyển sang "blinking", góc nghiêng đầu (đường
+nối hai mắt) vào histogram theo ANGLE_EDGES (giây mỗi bin). Mỗi phút xong được ghi
+một dòng JSON vào `analytics.jsonl` cạnh log_pro.csv; `query` trả lời cho khoảng thời gian bất kỳ
+trên nhiều phiên bằng cách cộng các rollup thay vì đọc lại từng dòng log.
+Phiên cũ chưa có rollup được dựng lại một lần từ `log_pro.rec` / `log_pro.csv`.
+"""
+import bisect
+import collections
+import csv
+import datetime
+import glob
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from config import ANALYTICS_BUCKET_SECONDS, ANALYTICS_WINDOW_SECONDS, ANALYTICS_MAX_GAP
+
+ROLLUP_FILE = "analytics.jsonl"
+DETECTORS = ("tilt", "gaze", "posture")
+BLINK_LABEL = "blinking"
+OFF_CENTER_LABELS = ("left", "right")
+# Histogram góc nghiêng đầu (độ), hai bin ngoài cùng gom phần vượt quá
+ANGLE_EDGES = np.arange(-45, 50, 5)
+
+
+def _label(d):
+    return (d or {}).get('label') or "none"
+
+
+def head_angle(t_d):
+    """Góc (độ) của đường nối hai mắt từ keypoints tilt; None nếu thiếu"""
+    kps = (t_d or {}).get('keypoints')
+    if not kps or len(kps) < 3 or kps[1] is None or kps[2] is None: return None
+    (lx, ly), (rx, ry) = kps[1][:2], kps[2][:2]
+    if lx == rx and ly == ry: return None
+    angle = math.degrees(math.atan2(ly - ry, lx - rx))
+    # Mắt trái/phải có thể đảo thứ tự theo hướng ảnh: đưa về [-90, 90]
+    if angle > 90: angle -= 180
+    elif angle < -90: angle += 180
+    return angle
+
+
+def _angle_bin(angle):
+    return int(np.clip(np.searchsorted(ANGLE_EDGES, angle, side="right") - 1, 0, len(ANGLE_EDGES) - 2))
+
+
+def empty_bucket(t=0.0):
+    return {"t": t, "seconds": 0.0, "samples": 0, "blinks": 0,
+            **{name: {} for name in DETECTORS}, "angle": [0.0] * (len(ANGLE_EDGES) - 1)}
+
+
+def merge(into, bucket):
+    into["seconds"] += bucket["seconds"]
+    into["samples"] += bucket["samples"]
+    into["blinks"] += bucket["blinks"]
+    for name in DETECTORS:
+        for label, sec in bucket[name].items():
+            into[name][label] = into[name].get(label, 0.0) + sec
+    into["angle"] = [a + b for a, b in zip(into["angle"], bucket["angle"])]
+    return into
+
+
+class _Accumulator:
+    """Gom mẫu (ts, nhãn, góc) thành bucket theo `bucket_seconds`"""
+
+    def __init__(self, bucket_seconds: float, max_gap: float, on_bucket):
+        self.bucket_seconds = bucket_seconds
+        self.max_gap = max_gap
+        self.on_bucket = on_bucket
+        self.current = None
+        self.prev = None  # (ts, labels, angle) của mẫu trước
+        self.blinking = False
+
+    def add(self, ts, labels, angle, blinks=None):
+        if self.prev is not None:
+            self._span(self.prev, min(ts - self.prev[0], self.max_gap))
+        self.prev = (ts, labels, angle)
+        blinking = labels[1] == BLINK_LABEL
+        if blinks is None: blinks = int(blinking and not self.blinking)
+        if blinks: self._bucket(ts)["blinks"] += blinks
+        self.blinking = blinking
+        self._bucket(ts)["samples"] += 1
+
+    def finish(self, ts=None):
+        """Tính nốt mẫu cuối (tới `ts`) và trả về bucket đang dở"""
+        if self.prev is not None and ts is not None:
+            self._span(self.prev, min(max(0.0, ts - self.prev[0]), self.max_gap))
+            self.prev = None
+        bucket, self.current = self.current, None
+        return bucket
+
+    def _bucket(self, ts):
+        start = ts - ts % self.bucket_seconds
+        if self.current is None or self.current["t"] != start:
+            if self.current is not None: self.on_bucket(self.current)
+            self.current = empty_bucket(start)
+        return self.current
+
+    def _span(self, sample, dt):
+        """Cộng dt giây cho nhãn của mẫu trước (cắt tại ranh giới bucket)"""
+        ts, labels, angle = sample
+        while dt > 0:
+            bucket = self._bucket(ts)
+            part = min(dt, bucket["t"] + self.bucket_seconds - ts)
+            bucket["seconds"] += part
+            for name, label in zip(DETECTORS, labels):
+                bucket[name][label] = bucket[name].get(label, 0.0) + part
+            if angle is not None: bucket["angle"][_angle_bin(angle)] += part
+            ts, dt = ts + part, dt - part
+
+
+class SessionAnalytics:
+    """Thống kê chạy của một phiên: rollup theo phút ra file + cửa sổ trượt cho UI"""
+
+    def __init__(self, session_dir: str = None, bucket_seconds: float = ANALYTICS_BUCKET_SECONDS,
+                 window_seconds: float = ANALYTICS_WINDOW_SECONDS, max_gap: float = ANALYTICS_MAX_GAP):
+        self.session_dir = session_dir
+        self.window_seconds = window_seconds
+        self.start = None
+        self.totals = empty_bucket()
+        self._file = open(os.path.join(session_dir, ROLLUP_FILE), "a", encoding="utf-8") if session_dir else None
+        self._acc = _Accumulator(bucket_seconds, max_gap, self._closed)
+        # Cửa sổ trượt: deque mẫu + bộ đếm cộng/trừ dần (O(1) mỗi mẫu)
+        self._window = collections.deque()
+        self._win_seconds = {name: collections.Counter() for name in DETECTORS}
+        self._win_blinks = 0
+        self._last = None
+
+    def add(self, t_d, g_d, p_d, ts: float = None, blinks: int = None):
+        """`blinks`: số chớp mắt kết thúc từ mẫu trước (BlinkDetector); None = đếm theo nhãn gaze"""
+        ts = ts or time.time()
+        if self.start is None: self.start = ts
+        labels = (_label(t_d), _label(g_d), _label(p_d))
+        self._acc.add(ts, labels, head_angle(t_d), blinks)
+
+        if self._last is not None:
+            dt = min(ts - self._last[0], self._acc.max_gap)
+            blink = blinks if blinks is not None else labels[1] == BLINK_LABEL and self._last[1][1] != BLINK_LABEL
+            self._push((ts, dt, self._last[1], blink))
+        self._last = (ts, labels)
+        while self._window and self._window[0][0] < ts - self.window_seconds:
+            _, dt, old, blink = self._window.popleft()
+            for name, label in zip(DETECTORS, old): self._win_seconds[name][label] -= dt
+            self._win_blinks -= blink
+
+    def _push(self, item):
+        _, dt, labels, blink = item
+        self._window.append(item)
+        for name, label in zip(DETECTORS, labels): self._win_seconds[name][label] += dt
+        self._win_blinks += blink
+
+    def _closed(self, bucket):
+        merge(self.totals, bucket)
+        if self._file:
+            self._file.write(json.dumps(_compact(bucket)) + "\n")
+            self._file.flush()
+
+    def pending(self):
+        """Bucket đang dở (chưa ghi file) để truy vấn phiên đang chạy"""
+        return [self._acc.current] if self._acc.current else []
+
+    def live(self) -> dict:
+        """Tóm tắt cả phiên (tới hiện tại) và cửa sổ window_seconds gần nhất"""
+        session = summarize(merge(merge(empty_bucket(), self.totals), self._acc.current or empty_bucket()))
+        win_total = sum(self._win_seconds["gaze"].values())
+        window = {"seconds": round(win_total, 1),
+                  "blink_rate_per_min": round(self._win_blinks * 60.0 / win_total, 1) if win_total > 0 else 0.0,
+                  **{name: {k: round(v / win_total, 3) for k, v in c.items() if v > 1e-9} if win_total > 0 else {}
+                     for name, c in self._win_seconds.items()}}
+        return {"start": self.start, "session": session, "window": window}
+
+    def close(self):
+        bucket = self._acc.finish(self._last[0] if self._last else None)
+        if bucket: self._closed(bucket)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def _compact(bucket):
+    out = dict(bucket, seconds=round(bucket["seconds"], 3))
+    for name in DETECTORS: out[name] = {k: round(v, 3) for k, v in bucket[name].items()}
+    out["angle"] = [round(v, 3) for v in bucket["angle"]]
+    return out
+
+
+def summarize(total) -> dict:
+    """Chỉ số dẫn xuất từ một bucket tổng: % tư thế xấu, tần suất chớp mắt, thời gian nhìn lệch..."""
+    seconds = total["seconds"]
+    posture = {k: v for k, v in total["posture"].items() if k != "none"}
+    posture_sec = sum(posture.values())
+    bad = sum(v for k, v in posture.items() if "bad" in k.lower())
+    angles = np.asarray(total["angle"], dtype=float)
+    centers = (ANGLE_EDGES[:-1] + ANGLE_EDGES[1:]) / 2.0
+
+    def share(d):
+        return {k: round(v / seconds, 4) for k, v in sorted(d.items())} if seconds > 0 else {}
+
+    return {
+        "seconds": round(seconds, 1),
+        "samples": total["samples"],
+        "posture_bad_pct": round(100.0 * bad / posture_sec, 2) if posture_sec > 0 else None,
+        "blinks": total["blinks"],
+        "blink_rate_per_min": round(total["blinks"] * 60.0 / seconds, 2) if seconds > 0 else None,
+        "gaze_off_center_seconds": round(sum(total["gaze"].get(k, 0.0) for k in OFF_CENTER_LABELS), 1),
+        "tilt": share(total["tilt"]),
+        "gaze": share(total["gaze"]),
+        "posture": share(total["posture"]),
+        "tilt_angle": {"edges": ANGLE_EDGES.tolist(), "seconds": [round(v, 1) for v in total["angle"]],
+                       "mean": round(float((angles * centers).sum() / angles.sum()), 2) if angles.sum() else None},
+    }
+
+
+# --- Truy vấn nhiều phiên ---
+def load_rollups(session_dir: str):
+    """Rollup của phiên; dựng lại từ log nếu phiên cũ chưa có"""
+    path = os.path.join(session_dir, ROLLUP_FILE)
+    if not os.path.exists(path) and not rebuild(session_dir): return []
+    buckets = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                buckets.append(json.loads(line))
+            except ValueError:
+                pass  # dòng cuối ghi dở
+    return buckets
+
+
+def query(base_dir: str, t0: float = None, t1: float = None, sessions=None, extra=None, series: bool = False,
+          bucket_seconds: float = ANALYTICS_BUCKET_SECONDS):
+    """Tổng hợp các bucket giao với [t0, t1) (epoch giây, độ phân giải = 1 bucket) trên các phiên.
+
+    `extra`: {tên phiên: [bucket]} chưa ghi file (phiên đang chạy), `series`: kèm chỉ số từng bucket.
+    """
+    t0 = t0 or 0.0
+    t1 = t1 or float("inf")
+    total, used, minutes = empty_bucket(), [], []
+    for session_dir in sorted(glob.glob(os.path.join(base_dir, "session_*"))):
+        name = os.path.basename(session_dir)
+        if sessions and name not in sessions: continue
+        # Phiên kết thúc trước t0 (file không đổi từ đó) thì bỏ qua, không cần đọc
+        path = os.path.join(session_dir, ROLLUP_FILE)
+        if os.path.exists(path) and os.path.getmtime(path) < t0: continue
+        picked = [b for b in load_rollups(session_dir) + list((extra or {}).get(name, []))
+                  if b["t"] < t1 and b["t"] + bucket_seconds > t0]
+        if not picked: continue
+        used.append(name)
+        for b in picked:
+            merge(total, b)
+            if series: minutes.append({"session": name, "t": b["t"], **summarize(b)})
+    out = {"sessions": used, "t0": t0 if t0 else None, "t1": t1 if t1 != float("inf") else None, **summarize(total)}
+    if series: out["series"] = sorted(minutes, key=lambda m: m["t"])
+    return out
+
+
+def rebuild(session_dir: str, bucket_seconds: float = ANALYTICS_BUCKET_SECONDS) -> bool:
+    """Dựng analytics.jsonl từ log_pro.rec (hoặc log_pro.csv của phiên cũ); False nếu không có log"""
+    rows = _read_log(session_dir)
+    if rows is None: return False
+    # Log có dedup: mỗi dòng giữ nguyên tới dòng sau, nên khoảng trống được phép dài
+    analytics = SessionAnalytics(session_dir, bucket_seconds=bucket_seconds, max_gap=bucket_seconds)
+    onsets = _read_blinks(session_dir)
+    prev = -math.inf
+    for ts, t_d, g_d, p_d in rows:
+        # Có blinks.csv: chớp mắt tính theo sự kiện (onset) thay vì nhãn của các dòng log
+        blinks = None if onsets is None else bisect.bisect_right(onsets, ts) - bisect.bisect_right(onsets, prev)
+        analytics.add(t_d, g_d, p_d, ts=ts, blinks=blinks)
+        prev = ts
+    analytics.close()
+    return True
+
+
+def _read_blinks(session_dir):
+    path = os.path.join(session_dir, "blinks.csv")
+    if not os.path.exists(path): return None
+    with open(path, newline="", encoding="utf-8") as f:
+        return sorted(_f(r.get("Onset")) for r in csv.DictReader(f) if _f(r.get("Onset")) == _f(r.get("Onset")))
+
+
+def _read_log(session_dir):
+    base = os.path.join(session_dir, "log_pro")
+    if os.path.exists(base + ".rec"):
+        from session_logger import load_records
+        rec = load_records(base + ".rec")
+        cols = [rec[c] for c in ("Timestamp", "Tilt_Label", "L_Eye_x", "L_Eye_y", "R_Eye_x", "R_Eye_y",
+                                 "Gaze_Label", "Posture_Label")]
+        return [_row(ts, tl.decode("utf-8", "replace"), (lx, ly), (rx, ry), gl.decode("utf-8", "replace"),
+                     pl.decode("utf-8", "replace"))
+                for ts, tl, lx, ly, rx, ry, gl, pl in zip(*(c.tolist() for c in cols))]
+    if not os.path.exists(base + ".csv"): return None
+    # CSV cũ chỉ có giờ trong ngày: lấy ngày từ tên thư mục session_YYYYmmdd_HHMMSS
+    try:
+        day = datetime.datetime.strptime(os.path.basename(session_dir)[8:16], "%Y%m%d")
+    except ValueError:
+        day = datetime.datetime.fromtimestamp(os.path.getmtime(base + ".csv")).replace(hour=0, minute=0, second=0,
+                                                                                        microsecond=0)
+    rows, last = [], None
+    with open(base + ".csv", newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            try:
+                t = datetime.datetime.strptime(r["Timestamp"], "%H:%M:%S.%f").time()
+            except (KeyError, ValueError):
+                continue
+            ts = datetime.datetime.combine(day, t).timestamp()
+            if last is not None and ts < last - 3600: day += datetime.timedelta(days=1); ts += 86400  # qua nửa đêm
+            last = ts
+            rows.append(_row(ts, r.get("Tilt_Label"), (_f(r.get("L_Eye_x")), _f(r.get("L_Eye_y"))),
+                             (_f(r.get("R_Eye_x")), _f(r.get("R_Eye_y"))), r.get("Gaze_Label"), r.get("Posture_Label")))
+    return rows
+
+
+def _f(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _row(ts, tilt, l_eye, r_eye, gaze, posture):
+    kps = None
+    if not any(v != v for v in (*l_eye, *r_eye)): kps = [None, l_eye, r_eye]
+    return ts, {"label": tilt or None, "keypoints": kps}, {"label": gaze or None}, {"label": posture or None}
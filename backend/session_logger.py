@@ -0,0 +1,271 @@
+import csv
+import datetime
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from native_threads import threading, queue
+from metrics import REGISTRY
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+KP_NAMES = ["Nose", "L_Eye", "R_Eye", "L_Ear", "R_Ear", "L_Sho", "R_Sho"]
+
+LOG_HEADER = ["Timestamp", "Frame", "Tilt_Label", "Tilt_Conf"]
+for _name in KP_NAMES: LOG_HEADER.extend([f"{_name}_x", f"{_name}_y"])
+LOG_HEADER.extend(["Gaze_Label", "Pupil_L_x", "Pupil_L_y", "Pupil_R_x", "Pupil_R_y"])
+LOG_HEADER.extend(["Posture_Label", "Box_x", "Box_y", "Box_w", "Box_h"])
+
+_LABEL_COLS = {"Tilt_Label", "Gaze_Label", "Posture_Label"}
+_LABEL_POS = [i for i, c in enumerate(LOG_HEADER[2:]) if c in _LABEL_COLS]
+
+# Định dạng cột cho file record nhị phân (Timestamp là epoch giây, số thiếu = NaN).
+# Nhãn lưu bytes UTF-8 tối đa LABEL_BYTES byte (cắt đúng ranh giới ký tự); độ rộng ghi trong .rec.json
+LABEL_BYTES = 64
+RECORD_DTYPE = np.dtype([("Timestamp", "f8"), ("Frame", "i8")] + [
+    (c, f"S{LABEL_BYTES}" if c in _LABEL_COLS else "f4") for c in LOG_HEADER[2:]
+])
+
+
+def encode_label(label, width: int = LABEL_BYTES) -> bytes:
+    data = str(label or "").encode("utf-8", "replace")
+    if len(data) <= width: return data
+    return data[:width].decode("utf-8", "ignore").encode("utf-8")
+
+
+def decode_labels(col):
+    """Cột nhãn (bytes) của .rec -> mảng str"""
+    return np.char.decode(col, "utf-8", "replace")
+
+
+def _num(v):
+    return float(v) if v is not None else math.nan
+
+
+def sample_values(t_d, g_d, p_d):
+    """Giá trị mọi cột sau Timestamp/Frame, đúng thứ tự LOG_HEADER"""
+    t_d, g_d, p_d = t_d or {}, g_d or {}, p_d or {}
+    row = [t_d.get('label') or "", _num(t_d.get('confidence'))]
+    kpts = list(t_d.get('keypoints') or [])[:len(KP_NAMES)]
+    kpts += [(None, None)] * (len(KP_NAMES) - len(kpts))
+    for x, y in kpts: row.extend([_num(x), _num(y)])
+
+    row.append(g_d.get('label') or "")
+    eyes = list(g_d.get('eyes') or [])[:2]
+    eyes += [{"rel": (None, None)}] * (2 - len(eyes))
+    for eye in eyes: row.extend([_num(eye['rel'][0]), _num(eye['rel'][1])])
+
+    row.append(p_d.get('label') or "")
+    bbox = p_d.get('bbox') or (None,) * 4
+    row.extend(_num(v) for v in bbox)
+    return tuple(row)
+
+
+def _same(a, b):
+    # NaN != NaN nên phải so sánh từng phần tử
+    return a is not None and all(x == y or (x != x and y != y) for x, y in zip(a, b))
+
+
+class SessionLogger:
+    """Ghi log phiên trên thread riêng (không chặn engine).
+
+    `log` chỉ đưa mẫu vào hàng đợi có giới hạn (đầy thì bỏ và đếm `dropped`),
+    mẫu không đổi so với mẫu trước bị bỏ qua khi `dedup=True`. Thread ghi gom
+    mẫu thành từng khối rồi ghi CSV đủ mọi cột của header, kèm file cột nhị phân:
+    `.rec` (numpy record, đọc bằng `load_records`) hoặc `.parquet` (nếu có pyarrow).
+    Sự kiện chớp mắt (`log_blink`) đi cùng hàng đợi, ghi ra `blinks.csv`.
+    """
+
+    def __init__(self, session_dir: str, name: str = "log_pro", formats=("csv", "rec"),
+                 batch_size: int = 256, flush_interval: float = 1.0, queue_size: int = 10000,
+                 dedup: bool = True):
+        os.makedirs(session_dir, exist_ok=True)
+        self.session_dir = session_dir
+        self.base = os.path.join(session_dir, name)
+        self.formats = set(formats)
+        if "parquet" in self.formats and pq is None:
+            print("WARNING: 'pyarrow' not installed. Parquet log disabled.")
+            self.formats.discard("parquet")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup = dedup
+
+        self.q = queue.Queue(maxsize=queue_size)
+        self._last = None
+        self.logged = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.truncated = 0
+
+        self._csv_file = None
+        self._csv_writer = None
+        self._rec_file = None
+        self._pq_writer = None
+        self._blink_file = None
+        self._blink_writer = None
+        self._open()
+
+        self.thread = threading.Thread(target=self._writer, name="session-logger", daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        if "csv" in self.formats:
+            self._csv_file = open(self.base + ".csv", "w", newline="", encoding="utf-8")
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(LOG_HEADER)
+        if "rec" in self.formats:
+            self._rec_file = open(self.base + ".rec", "wb")
+            with open(self.base + ".rec.json", "w", encoding="utf-8") as f:
+                json.dump({"dtype": RECORD_DTYPE.descr, "columns": LOG_HEADER, "label_encoding": "utf-8",
+                           "label_bytes": LABEL_BYTES}, f)
+
+    def log(self, frame_idx: int, t_d, g_d, p_d, ts: float = None) -> bool:
+        values = sample_values(t_d, g_d, p_d)
+        if self.dedup and _same(self._last, values):
+            self.skipped += 1
+            return False
+        self._last = values
+        try:
+            self.q.put_nowait((ts or time.time(), frame_idx, values))
+        except queue.Full:
+            self.dropped += 1
+            REGISTRY.inc("log_dropped_total")
+            return False
+        return True
+
+    def log_blink(self, frame_idx: int, event) -> bool:
+        """event = {"onset": thời điểm chụp frame bắt đầu nhắm, "duration": giây}"""
+        try:
+            self.q.put_nowait((event["onset"], frame_idx, event))
+        except queue.Full:
+            self.dropped += 1
+            REGISTRY.inc("log_dropped_total")
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.q.put(None, timeout=5.0)
+        except queue.Full:
+            pass
+        self.thread.join(timeout=5.0)
+
+    def _writer(self):
+        batch = []
+        last_flush = time.time()
+        while True:
+            try:
+                item = self.q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item and isinstance(item[2], dict):
+                self._write_blink(*item)
+                item = False
+            if item: batch.append(item)
+            if batch and (item is None or len(batch) >= self.batch_size
+                          or time.time() - last_flush >= self.flush_interval):
+                self._write_block(batch)
+                batch = []
+                last_flush = time.time()
+            if item is None: break
+        self._finish()
+
+    def _write_block(self, batch):
+        t0 = time.perf_counter()
+        # CSV và file nhị phân ghi độc lập: lỗi ở một định dạng không làm mất khối ở định dạng kia
+        if self._csv_writer:
+            try:
+                self._csv_writer.writerows(
+                    [datetime.datetime.fromtimestamp(ts).strftime("%H:%M:%S.%f")[:-3], idx,
+                     *("" if v != v else v for v in values)]
+                    for ts, idx, values in batch)
+                self._csv_file.flush()
+            except Exception as e:
+                print(f"Session log write error (csv): {e}")
+        if self._rec_file or "parquet" in self.formats:
+            try:
+                rec = self._records(batch)
+                if self._rec_file:
+                    rec.tofile(self._rec_file)
+                    self._rec_file.flush()
+                if "parquet" in self.formats: self._write_parquet(rec)
+            except Exception as e:
+                print(f"Session log write error (rec): {e}")
+        self.logged += len(batch)
+        REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage="log_write", target="session")
+
+    def _row(self, ts, idx, values):
+        values = list(values)
+        for i in _LABEL_POS:
+            label = encode_label(values[i])
+            if len(label) < len(str(values[i] or "").encode("utf-8", "replace")):
+                if not self.truncated: print(f"WARNING: nhãn dài hơn {LABEL_BYTES} byte bị cắt trong .rec (CSV giữ nguyên)")
+                self.truncated += 1
+            values[i] = label
+        return (ts, idx, *values)
+
+    def _records(self, batch):
+        """Khối mẫu -> record; khối lỗi thì đổi từng dòng, chỉ bỏ (và báo) đúng dòng hỏng"""
+        try:
+            return np.array([self._row(*item) for item in batch], dtype=RECORD_DTYPE)
+        except Exception:
+            pass
+        rows = []
+        for ts, idx, values in batch:
+            try:
+                rows.append(np.array([self._row(ts, idx, values)], dtype=RECORD_DTYPE))
+            except Exception as e:
+                print(f"Session log: bỏ Frame {idx} khỏi .rec ({e})")
+                REGISTRY.inc("log_dropped_total")
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def _write_blink(self, ts, idx, event):
+        try:
+            if self._blink_writer is None:
+                self._blink_file = open(os.path.join(self.session_dir, "blinks.csv"), "w", newline="",
+                                        encoding="utf-8")
+                self._blink_writer = csv.writer(self._blink_file)
+                self._blink_writer.writerow(["Timestamp", "Onset", "Duration_ms", "Frame"])
+            self._blink_writer.writerow([datetime.datetime.fromtimestamp(ts).strftime("%H:%M:%S.%f")[:-3], ts,
+                                         round(event["duration"] * 1000), idx])
+            self._blink_file.flush()
+        except Exception as e:
+            print(f"Session log write error: {e}")
+
+    def _write_parquet(self, rec):
+        table = pa.table({name: (decode_labels(rec[name]) if rec.dtype[name].kind == "S" else rec[name])
+                          for name in rec.dtype.names})
+        if self._pq_writer is None:
+            self._pq_writer = pq.ParquetWriter(self.base + ".parquet", table.schema)
+        self._pq_writer.write_table(table)
+
+    def _finish(self):
+        if self._csv_file: self._csv_file.close()
+        if self._rec_file: self._rec_file.close()
+        if self._pq_writer: self._pq_writer.close()
+        if self._blink_file: self._blink_file.close()
+        self._csv_file = self._csv_writer = self._rec_file = self._pq_writer = None
+        self._blink_file = self._blink_writer = None
+
+
+def record_dtype(path: str) -> np.dtype:
+    """dtype ghi trong <path>.json (phiên cũ có thể dùng độ rộng nhãn khác), mặc định RECORD_DTYPE"""
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            return np.dtype([tuple(field) for field in json.load(f)["dtype"]])
+    except (OSError, ValueError, KeyError, TypeError):
+        return RECORD_DTYPE
+
+
+def load_records(path: str) -> np.ndarray:
+    """Đọc file .rec thành numpy structured array (memmap, không copy); nhãn giải mã bằng decode_labels"""
+    dtype = record_dtype(path)
+    if os.path.getsize(path) == 0: return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
@@ -0,0 +1,176 @@
+"""Ghi frame thô của hai camera trong phiên để xem lại (playback) đồng bộ với log.
+
+Mỗi camera ghi thành các segment `<cam>_<n>.mjpg` (các ảnh JPEG nối liền nhau,
+mỗi segment SEGMENT_SECONDS giây) cùng hai file chỉ mục cạnh log_pro.csv:
+- `<cam>.idx`: mảng numpy record cố định (INDEX_DTYPE) - thời điểm chụp, Frame
+  (trùng cột Frame của log), segment, offset, kích thước; đọc bằng memmap.
+- `<cam>.sec`: int64, phần tử k = vị trí bản ghi đầu tiên từ giây thứ k của
+  phiên, nên tìm tới một thời điểm bất kỳ là O(1) (+ quét tối đa 1 giây frame).
+Encode JPEG và ghi file chạy trên OS thread riêng; engine chỉ đưa frame vào hàng đợi.
+"""
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from native_threads import threading, queue
+from metrics import REGISTRY
+from frame_cache import resize_to
+
+INDEX_DTYPE = np.dtype([("ts", "f8"), ("frame", "i8"), ("segment", "i4"), ("offset", "i8"), ("size", "i4")])
+META_FILE = "recording.json"
+
+
+def _segment_path(session_dir, cam, segment):
+    return os.path.join(session_dir, f"{cam}_{segment:05d}.mjpg")
+
+
+class SessionRecorder:
+    def __init__(self, session_dir: str, cams=("cam1", "cam2"), segment_seconds: float = 60.0,
+                 quality: int = 80, width: int = 0, max_fps: float = 15.0, queue_size: int = 64):
+        os.makedirs(session_dir, exist_ok=True)
+        self.session_dir = session_dir
+        self.segment_seconds = segment_seconds
+        self.quality = int(quality)
+        self.width = int(width)
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.start = time.time()
+        self.q = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.recorded = 0
+        self._last = {cam: 0.0 for cam in cams}
+        self._files = {}  # cam -> trạng thái segment/file chỉ mục đang ghi
+
+        with open(os.path.join(session_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"start": self.start, "cams": list(cams), "segment_seconds": segment_seconds,
+                       "quality": self.quality, "width": self.width, "max_fps": max_fps,
+                       "index_dtype": INDEX_DTYPE.descr}, f)
+
+        self.thread = threading.Thread(target=self._writer, name="session-recorder", daemon=True)
+        self.thread.start()
+
+    def record(self, cam: str, frame, frame_idx: int, ts: float = None) -> bool:
+        """Không chặn: bỏ frame khi quá max_fps hoặc hàng đợi đầy. frame: ndarray hoặc PreparedFrame"""
+        ts = ts or time.time()
+        if ts - self._last.get(cam, 0.0) < self.min_interval: return False
+        try:
+            self.q.put_nowait((cam, frame, frame_idx, ts))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self._last[cam] = ts
+        return True
+
+    def close(self):
+        try:
+            self.q.put(None, timeout=5.0)
+        except queue.Full:
+            pass
+        self.thread.join(timeout=10.0)
+
+    def _writer(self):
+        while True:
+            item = self.q.get()
+            if item is None: break
+            cam, frame, frame_idx, ts = item
+            t0 = time.perf_counter()
+            try:
+                self._write(cam, frame, frame_idx, ts)
+            except Exception as e:
+                print(f"Session recorder error ({cam}): {e}")
+            REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage="record", target=cam)
+        for st in self._files.values():
+            for key in ("data", "idx", "sec"):
+                if st[key]: st[key].close()
+        self._files.clear()
+
+    def _state(self, cam):
+        st = self._files.get(cam)
+        if st is None:
+            st = self._files[cam] = {
+                "segment": -1, "data": None, "offset": 0, "count": 0, "marked": 0,
+                "idx": open(os.path.join(self.session_dir, f"{cam}.idx"), "wb"),
+                "sec": open(os.path.join(self.session_dir, f"{cam}.sec"), "wb"),
+            }
+        return st
+
+    def _write(self, cam, frame, frame_idx, ts):
+        frame = resize_to(frame, self.width)
+        ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok: return
+        data = buf.tobytes()
+
+        st = self._state(cam)
+        segment = max(0, int((ts - self.start) // self.segment_seconds)) if self.segment_seconds > 0 else 0
+        if segment != st["segment"]:
+            if st["data"]: st["data"].close()
+            st["data"] = open(_segment_path(self.session_dir, cam, segment), "wb")
+            st["segment"], st["offset"] = segment, 0
+        st["data"].write(data)
+        st["data"].flush()
+
+        # Đánh dấu bản ghi đầu tiên của mỗi giây mới (kể cả các giây không có frame)
+        second = int(max(0.0, ts - self.start))
+        if second >= st["marked"]:
+            np.full(second - st["marked"] + 1, st["count"], dtype=np.int64).tofile(st["sec"])
+            st["sec"].flush()
+            st["marked"] = second + 1
+        np.array([(ts, frame_idx, segment, st["offset"], len(data))], dtype=INDEX_DTYPE).tofile(st["idx"])
+        st["idx"].flush()
+        st["offset"] += len(data)
+        st["count"] += 1
+        self.recorded += 1
+
+
+class RecordingReader:
+    """Đọc bản ghi của một phiên (kể cả phiên đang ghi: chỉ đọc các bản ghi đã đủ byte)"""
+
+    def __init__(self, session_dir: str):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.start = self.meta["start"]
+        self.cams = self.meta["cams"]
+
+    def index(self, cam: str) -> np.ndarray:
+        path = os.path.join(self.session_dir, f"{cam}.idx")
+        n = os.path.getsize(path) // INDEX_DTYPE.itemsize if os.path.exists(path) else 0
+        if n == 0: return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(path, dtype=INDEX_DTYPE, mode="r", shape=(n,))
+
+    def seconds(self, cam: str) -> np.ndarray:
+        path = os.path.join(self.session_dir, f"{cam}.sec")
+        n = os.path.getsize(path) // 8 if os.path.exists(path) else 0
+        if n == 0: return np.zeros(0, dtype=np.int64)
+        return np.memmap(path, dtype=np.int64, mode="r", shape=(n,))
+
+    def duration(self, cam: str) -> float:
+        idx = self.index(cam)
+        return float(idx["ts"][-1] - self.start) if len(idx) else 0.0
+
+    def seek(self, cam: str, t: float) -> int:
+        """Vị trí bản ghi đầu tiên có thời điểm >= start + t (giây); O(1) nhờ bảng .sec"""
+        idx, sec = self.index(cam), self.seconds(cam)
+        if not len(idx): return 0
+        second = int(max(0.0, t))
+        if second >= len(sec): return len(idx) - 1
+        pos = int(sec[second])
+        target = self.start + t
+        while pos < len(idx) - 1 and idx["ts"][pos] < target: pos += 1
+        return min(pos, len(idx) - 1)
+
+    def seek_frame(self, cam: str, frame_idx: int) -> int:
+        """Vị trí bản ghi của Frame (cột Frame trong log) gần nhất, không vượt quá"""
+        idx = self.index(cam)
+        if not len(idx): return 0
+        return max(0, int(np.searchsorted(idx["frame"], frame_idx, side="right")) - 1)
+
+    def read(self, cam: str, pos: int):
+        """(jpeg bytes, ts, frame) của bản ghi thứ `pos`"""
+        rec = self.index(cam)[pos]
+        with open(_segment_path(self.session_dir, cam, int(rec["segment"])), "rb") as f:
+            f.seek(int(rec["offset"]))
+            data = f.read(int(rec["size"]))
+        return data, float(rec["ts"]), int(rec["frame"])
@@ -0,0 +1,121 @@
+"""Ring buffer trên multiprocessing.shared_memory cho frame / kết quả giữa các process.
+
+Bố cục một khối shared memory:
+- 8 byte đầu: seq mới nhất đã ghi xong (int64, -1 = chưa có)
+- `slots` header (seq, ts, size) theo HEADER_DTYPE
+- `slots` ô dữ liệu cố định `slot_shape` x `dtype` (frame BGR, hoặc bytes cho kết quả JSON)
+
+Một process ghi, nhiều process đọc, không khóa: người ghi đặt seq của ô = -1,
+chép dữ liệu rồi mới ghi seq thật (seqlock); người đọc chép ô rồi kiểm tra lại
+seq, ô bị ghi đè giữa chừng thì bỏ frame đó. Process tạo ring (server) sở hữu và
+`unlink` nó; process con mở lại bằng `ShmRing(*ring.spec())`.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_DTYPE = np.dtype([("seq", "i8"), ("ts", "f8"), ("size", "i8")])
+_ALIGN = 64
+
+
+def _layout(slots, slot_shape, dtype):
+    head = 8 + slots * HEADER_DTYPE.itemsize
+    data_off = (head + _ALIGN - 1) // _ALIGN * _ALIGN
+    slot_bytes = int(np.prod(slot_shape)) * np.dtype(dtype).itemsize
+    return data_off, slot_bytes, data_off + slots * slot_bytes
+
+
+class ShmRing:
+    def __init__(self, slots: int, slot_shape, dtype=np.uint8, name: str = None, create: bool = False):
+        self.slots = int(slots)
+        self.slot_shape = tuple(int(v) for v in slot_shape)
+        self.dtype = np.dtype(dtype)
+        data_off, slot_bytes, total = _layout(self.slots, self.slot_shape, self.dtype)
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=total if create else 0)
+        buf = self.shm.buf
+        self._latest = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=0)
+        self._header = np.ndarray((self.slots,), dtype=HEADER_DTYPE, buffer=buf, offset=8)
+        self._data = np.ndarray((self.slots,) + self.slot_shape, dtype=self.dtype, buffer=buf, offset=data_off)
+        self._bytes = np.ndarray((self.slots, slot_bytes), dtype=np.uint8, buffer=buf, offset=data_off)
+        self.slot_bytes = slot_bytes
+        if create:
+            self._latest[0] = -1
+            self._header["seq"] = -1
+
+    @classmethod
+    def create(cls, slots, slot_shape, dtype=np.uint8):
+        return cls(slots, slot_shape, dtype, create=True)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def spec(self):
+        """Tham số để process khác `ShmRing(*spec)` attach vào cùng ring"""
+        return self.slots, self.slot_shape, self.dtype.str, self.shm.name
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self._latest[0])
+
+    def write(self, data, ts: float, seq: int = None) -> int:
+        """Ghi một frame (đúng slot_shape) vào ô kế tiếp; trả về seq.
+        `seq` (tăng dần, được phép nhảy cóc) giữ số thứ tự của nguồn thay vì đếm theo ring"""
+        return self._commit(ts, lambda slot: np.copyto(self._data[slot], data), self.slot_bytes, seq)
+
+    def write_bytes(self, payload: bytes, ts: float) -> int:
+        """Ghi bytes (<= slot_bytes) vào ô kế tiếp; payload quá dài bị từ chối (-1)"""
+        n = len(payload)
+        if n > self.slot_bytes: return -1
+
+        def fill(slot):
+            self._bytes[slot, :n] = np.frombuffer(payload, np.uint8)
+        return self._commit(ts, fill, n)
+
+    def _commit(self, ts, fill, size, seq=None):
+        seq = self.latest_seq + 1 if seq is None else max(int(seq), self.latest_seq + 1)
+        slot = seq % self.slots
+        hdr = self._header
+        hdr["seq"][slot] = -1
+        fill(slot)
+        hdr["ts"][slot], hdr["size"][slot] = ts, size
+        hdr["seq"][slot] = seq
+        self._latest[0] = seq
+        return seq
+
+    def read_latest(self, after_seq: int = -1, out=None):
+        """(seq, ts, bản copy) của ô mới nhất nếu seq > after_seq, ngược lại None"""
+        seq = self.latest_seq
+        if seq <= after_seq: return None
+        slot = seq % self.slots
+        seqs = self._header["seq"]
+        if seqs[slot] != seq: return None
+        ts = float(self._header["ts"][slot])
+        if out is None: out = self._data[slot].copy()
+        else: np.copyto(out, self._data[slot])
+        # Bị ghi đè trong lúc chép (người đọc chậm hơn cả vòng ring): bỏ
+        if seqs[slot] != seq: return None
+        return seq, ts, out
+
+    def read_bytes(self, after_seq: int = -1):
+        """(seq, ts, bytes) của bản ghi bytes mới nhất nếu seq > after_seq"""
+        seq = self.latest_seq
+        if seq <= after_seq: return None
+        slot = seq % self.slots
+        seqs = self._header["seq"]
+        if seqs[slot] != seq: return None
+        ts, size = float(self._header["ts"][slot]), int(self._header["size"][slot])
+        payload = self._bytes[slot, :size].tobytes()
+        if seqs[slot] != seq: return None
+        return seq, ts, payload
+
+    def close(self):
+        # Bỏ các view numpy trước khi đóng mmap
+        self._latest = self._header = self._data = self._bytes = None
+        self.shm.close()
+
+    def unlink(self):
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
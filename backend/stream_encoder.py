@@ -0,0 +1,75 @@
+import threading
+import cv2
+from eventlet import tpool
+
+from metrics import REGISTRY
+from frame_cache import resize_to
+
+
+def stream_key(cam_id, width: int, quality: int, overlay: bool = True):
+    """Khóa stream trong FrameBroadcaster: cùng camera (số 1/2 hoặc tên pipeline) nhưng khác độ phân giải/chất lượng,
+    có vẽ overlay hay frame gốc (client tự vẽ từ telemetry)"""
+    return (cam_id if isinstance(cam_id, str) else int(cam_id), int(width), int(quality), bool(overlay))
+
+
+def encode_jpeg(frame, width: int, quality: int):
+    """Thu nhỏ (giữ tỉ lệ) rồi encode JPEG; width = 0 giữ nguyên độ phân giải.
+    frame là PreparedFrame thì dùng preview đã có (cùng độ rộng với detector/profile khác)"""
+    frame = resize_to(frame, width)
+    r, b = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return b.tobytes() if r else None
+
+
+class StreamEncoder(threading.Thread):
+    """Encode frame hiển thị cho các stream đang có người xem, ngoài vòng lặp engine.
+
+    Engine chỉ gửi frame mới nhất của mỗi camera qua `submit` (không copy, không
+    khóa). Thread này chỉ encode những profile (width, quality) đang có client
+    đăng ký trong broadcaster; việc resize/encode chạy trong tpool (OS thread,
+    cv2 nhả GIL) còn `publish` vẫn diễn ra trên hub.
+    """
+
+    def __init__(self, broadcaster):
+        super().__init__(daemon=True)
+        self.broadcaster = broadcaster
+        self.pending = {}
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+
+    def wants(self, cam_id, overlay: bool = None) -> bool:
+        """Có client nào đang xem camera này không (overlay=True/False: chỉ tính profile có/không vẽ overlay)"""
+        return bool(self.profiles(cam_id, overlay))
+
+    def profiles(self, cam_id, overlay: bool = None):
+        return [k for k in self.broadcaster.active_streams()
+                if isinstance(k, tuple) and k[0] == cam_id and (overlay is None or k[3] == overlay)]
+
+    def submit(self, cam_id, frame, seq: int = 0, overlay: bool = True, jpeg: bytes = None):
+        """frame: ndarray hoặc frame_cache.PreparedFrame.
+        `seq` (số thứ tự frame của camera) đi kèm từng ảnh JPEG để client ghép với telemetry.
+        `jpeg`: bytes gốc của camera MJPEG, dùng thẳng (không encode lại) cho profile full-size"""
+        self.pending[(cam_id, overlay)] = (frame, seq, jpeg)
+        self.wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake.wait(1.0)
+            self.wake.clear()
+            for cam_id, overlay in list(self.pending):
+                item = self.pending.pop((cam_id, overlay), None)
+                if item is None: continue
+                frame, seq, native = item
+                target = cam_id if isinstance(cam_id, str) else f"cam{cam_id}"
+                for key in self.profiles(cam_id, overlay):
+                    _, width, quality, _ = key
+                    if native and (width == 0 or width >= frame.shape[1]):
+                        REGISTRY.inc("jpeg_passthrough_total", cam=target)
+                        self.broadcaster.publish(key, native, seq, frame.shape[1])
+                        continue
+                    with REGISTRY.time("stage_seconds", stage="encode", target=target):
+                        jpeg = tpool.execute(encode_jpeg, frame, width, quality)
+                    if jpeg: self.broadcaster.publish(key, jpeg, seq, frame.shape[1])
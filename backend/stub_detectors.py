@@ -0,0 +1,44 @@
+"""Detector giả có chi phí cố định, cùng định dạng kết quả với detector thật.
+
+Dùng cho benchmark: đo pipeline (capture, worker, encode, phát) mà không cần
+model. `spin=True` bận CPU (giữ GIL như model chạy Python), mặc định chỉ sleep.
+Module nhẹ, không import torch/mediapipe để process worker nạp nhanh.
+"""
+import time
+
+
+def _wait(cost_s: float, spin: bool):
+    if not spin:
+        time.sleep(cost_s)
+        return
+    end = time.perf_counter() + cost_s
+    while time.perf_counter() < end: pass
+
+
+class StubDetector:
+    def __init__(self, kind: str, cost_ms: float = 20.0, spin: bool = False):
+        self.kind = kind
+        self.cost = cost_ms / 1000.0
+        self.spin = spin
+
+    def infer(self, frame, *args, **kwargs):
+        _wait(self.cost, self.spin)
+        return self._result(frame)
+
+    def _result(self, frame):
+        h, w = frame.shape[:2]
+        cx, cy = w / 2.0, h / 2.0
+        if self.kind == 'tilt':
+            kpts = [(cx + dx, cy + dy) for dx, dy in
+                    [(0, 0), (-20, -15), (20, -15), (-45, -5), (45, -5), (-90, 90), (90, 90)]]
+            return {"label": "straight", "confidence": 0.9, "keypoints": kpts}
+        if self.kind == 'gaze':
+            return {"status": "ok", "label": "center", "blink": False, "annotated": None,
+                    "eyes_data": [{"rel": (int(cx - 20), int(cy - 15))}, {"rel": (int(cx + 20), int(cy - 15))}],
+                    "face_box": (int(cx - 60), int(cy - 80), int(cx + 60), int(cy + 80))}
+        return {"label": "good", "confidence": 0.8, "bbox": (cx, cy, w / 3.0, h / 1.5)}
+
+    def infer_batch(self, frames):
+        # Batch rẻ hơn gọi lẻ: một lần chi phí cố định + 25% mỗi frame thêm
+        _wait(self.cost * (1 + 0.25 * max(0, len(frames) - 1)), self.spin)
+        return [self._result(f) for f in frames]
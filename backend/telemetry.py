@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ALL_CHANNELS = "*"
+STATUS_CHANNEL = "status"
+
+
+def is_status(channel: str) -> bool:
+    """Channel trạng thái (scheduler, ROI, tuổi frame...): đổi mỗi vòng lặp nên phát chậm hơn"""
+    return channel == STATUS_CHANNEL or channel.endswith(":" + STATUS_CHANNEL)
+
+
+def check_rate(rate_hz) -> float:
+    rate = float(rate_hz)
+    if not math.isfinite(rate) or rate <= 0: raise ValueError(f"rate must be > 0, got {rate_hz!r}")
+    return rate
+
+
+def _room(channels, binary: bool) -> str:
+    return "tm:" + ",".join(sorted(channels)) + (":bin" if binary else "")
+
+
+def _msgpack_default(o):
+    if hasattr(o, 'tolist'): return o.tolist()
+    return str(o)
+
+
+def pack_binary(delta: dict) -> bytes:
+    """msgpack; keypoints/pupils được đóng gói thành mảng float32 (bytes) cho gọn"""
+    out = dict(delta)
+    tilt = out.get('tilt')
+    if tilt and tilt.get('keypoints'):
+        out['tilt'] = {**tilt, 'keypoints': np.asarray(tilt['keypoints'], dtype=np.float32).tobytes()}
+    gaze = out.get('gaze')
+    if gaze and gaze.get('eyes'):
+        eyes = [e['rel'] for e in gaze['eyes']]
+        out['gaze'] = {**gaze, 'eyes': np.asarray(eyes, dtype=np.float32).tobytes()}
+    return msgpack.packb(out, use_bin_type=True, default=_msgpack_default)
+
+
+class TelemetryPublisher:
+    """Gom dữ liệu engine và phát qua Socket.IO với tần suất cố định.
+
+    `publish` chỉ lưu payload mới nhất (gọi mỗi vòng lặp engine cũng được). Thread
+    phát chạy `rate_hz` lần/giây và chỉ gửi các channel (tilt, gaze, posture...)
+    đã thay đổi kể từ lần gửi trước; channel trạng thái (`status`, `pipe:<tên>:status`)
+    chỉ gửi tối đa `status_hz` lần/giây. Client có thể `subscribe` một tập channel và
+    chọn định dạng nhị phân (msgpack, event 'data_update_bin'); client chưa
+    subscribe nhận mọi channel dạng JSON như trước.
+    """
+
+    def __init__(self, socketio, rate_hz: float = 15.0, status_hz: float = 1.0):
+        self.socketio = socketio
+        self.rate_hz = check_rate(rate_hz)
+        self.status_hz = check_rate(status_hz)
+        self._status_at = 0.0
+        self.latest = {}
+        self.sent = {}
+        self.rooms = {}  # room -> (channels | None, binary, số client)
+        self.lock = threading.Lock()
+        self._running = False
+        self.emits = 0
+
+    def start(self):
+        if self._running: return
+        self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def set_rate(self, rate_hz):
+        """Đổi tần suất gửi; ValueError/TypeError nếu không phải số dương"""
+        self.rate_hz = check_rate(rate_hz)
+
+    def publish(self, payload: dict):
+        self.latest.update(payload)
+
+    def snapshot(self, channels=None) -> dict:
+        return {k: v for k, v in self.latest.items() if channels is None or k in channels}
+
+    def subscribe(self, channels=None, binary: bool = False) -> str:
+        """Trả về tên room mà client cần join; channels=None nghĩa là tất cả"""
+        if binary and msgpack is None:
+            print("WARNING: 'msgpack' not installed. Falling back to JSON telemetry.")
+            binary = False
+        chans = frozenset(channels) if channels else None
+        room = _room(chans or [ALL_CHANNELS], binary)
+        with self.lock:
+            _, _, n = self.rooms.get(room, (chans, binary, 0))
+            self.rooms[room] = (chans, binary, n + 1)
+        return room
+
+    def unsubscribe(self, room: str):
+        with self.lock:
+            if room not in self.rooms: return
+            chans, binary, n = self.rooms[room]
+            if n <= 1:
+                del self.rooms[room]
+            else:
+                self.rooms[room] = (chans, binary, n - 1)
+
+    def encode(self, data: dict, binary: bool):
+        return ('data_update_bin', pack_binary(data)) if binary else ('data_update', data)
+
+    def _delta(self, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        slow = now - self._status_at >= 1.0 / self.status_hz
+        if slow: self._status_at = now
+        delta = {k: v for k, v in self.latest.items() if (slow or not is_status(k)) and self.sent.get(k) != v}
+        self.sent.update(delta)
+        return delta
+
+    def _run(self):
+        while self._running:
+            started = time.time()
+            delta = self._delta(started)
+            if delta:
+                t0 = time.perf_counter()
+                with self.lock:
+                    rooms = list(self.rooms.items())
+                for room, (chans, binary, _) in rooms:
+                    part = delta if chans is None else {k: v for k, v in delta.items() if k in chans}
+                    if not part: continue
+                    event, data = self.encode(part, binary)
+                    self.socketio.emit(event, data, to=room)
+                    self.emits += 1
+                REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage="emit", target="telemetry")
+            self.socketio.sleep(max(0.0, 1.0 / self.rate_hz - (time.time() - started)))
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module backend là module phẳng (import scheduler, shm_ring...): chạy pytest từ thư mục gốc hay backend đều được
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+import csv
+
+import numpy as np
+import pytest
+
+from biopac import SignalRing, BiopacIngest, decimate_minmax, decimate_lttb
+
+
+def test_ring_read_since_and_wraparound():
+    ring = SignalRing(5)
+    ring.write(np.arange(3.0), np.arange(3, dtype=np.float32))
+    start, ts, values = ring.read()
+    assert start == 0 and ts.tolist() == [0, 1, 2]
+    ring.write(np.arange(3.0, 7.0), np.arange(3, 7, dtype=np.float32))
+    start, ts, values = ring.read()
+    # 7 mẫu, ring 5 ô: mẫu 0-1 đã bị ghi đè
+    assert start == 2 and ts.tolist() == [2, 3, 4, 5, 6] and values.tolist() == [2, 3, 4, 5, 6]
+    start, ts, _ = ring.read(since=5)
+    assert start == 5 and ts.tolist() == [5, 6]
+
+
+def test_ring_oversized_chunk_keeps_tail_and_counts_all():
+    ring = SignalRing(4)
+    ring.write(np.array([0.0]), np.array([0], np.float32))
+    ring.write(np.arange(1.0, 11.0), np.arange(1, 11, dtype=np.float32))
+    assert ring.head == 11  # chỉ số mẫu khớp biopac.rec dù chỉ giữ phần đuôi
+    start, ts, values = ring.read()
+    assert start == 7 and ts.tolist() == [7, 8, 9, 10] and values.tolist() == [7, 8, 9, 10]
+
+
+def test_ring_read_window():
+    ring = SignalRing(100)
+    assert len(ring.read_window(1.0)[1]) == 0
+    ts = np.arange(50) * 0.125
+    ring.write(ts, ts.astype(np.float32))
+    start, wts, _ = ring.read_window(1.0)
+    # Cửa sổ tính cả mẫu đúng tại last - seconds
+    assert start == 41 and wts[0] == 5.125 and wts[-1] == 6.125
+
+
+def test_minmax_keeps_peaks_in_order():
+    ts = np.arange(1000.0)
+    values = np.zeros(1000, np.float32)
+    values[123], values[777] = 9.0, -9.0
+    dts, dvs = decimate_minmax(ts, values, 50)
+    assert len(dvs) <= 50
+    assert 9.0 in dvs and -9.0 in dvs
+    assert (np.diff(dts) > 0).all()
+
+
+def test_lttb_keeps_endpoints_and_spike():
+    ts = np.arange(2000.0)
+    values = np.sin(ts / 100.0).astype(np.float32)
+    values[1000] = 50.0
+    dts, dvs = decimate_lttb(ts, values, 100)
+    assert len(dts) == 100
+    assert dts[0] == 0 and dts[-1] == 1999
+    assert 50.0 in dvs
+    assert (np.diff(dts) > 0).all()
+
+
+@pytest.mark.parametrize("decimate", [decimate_minmax, decimate_lttb])
+def test_short_signal_is_unchanged(decimate):
+    ts, values = np.arange(10.0), np.arange(10, dtype=np.float32)
+    dts, dvs = decimate(ts, values, 20)
+    assert dts is ts and dvs is values
+
+
+class ListReader:
+    channels = ["ECG", "EDA"]
+    rate = 1000.0
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self):
+        return self.chunks.pop(0) if self.chunks else None
+
+    def close(self):
+        pass
+
+
+def test_ingest_aligns_frames_to_nearest_sample(tmp_path):
+    ts = np.arange(100) / 1000.0
+    values = np.stack([np.arange(100), -np.arange(100)], axis=1).astype(np.float32)
+    ingest = BiopacIngest(ListReader([(ts[:50], values[:50]), (ts[50:], values[50:])]), buffer_seconds=1.0)
+    ingest.attach(str(tmp_path))
+    ingest.mark_frame(1, 0.0104)
+    ingest.mark_frame(2, 0.0726)
+    ingest.mark_frame(3, 5.0)  # chưa có mẫu sau thời điểm này: không được ghi
+    ingest.start()
+    ingest.thread.join(timeout=2.0)
+    ingest.stop()
+    with open(tmp_path / "biopac_frames.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["Frame", "Timestamp", "Sample", "ECG", "EDA"]
+    assert [r[0] for r in rows[1:]] == ["1", "2"]
+    assert rows[1][2:] == ["10", "10", "-10"]
+    assert rows[2][2:] == ["73", "73", "-73"]
+    rec = np.fromfile(tmp_path / "biopac.rec", dtype=ingest._dtype())
+    assert rec["Sample"].tolist() == list(range(100))
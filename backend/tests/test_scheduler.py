@@ -0,0 +1,85 @@
+import pytest
+
+from scheduler import AdaptiveScheduler
+
+
+def make(capacity=1.0, budget=0.1):
+    return AdaptiveScheduler({"tilt": {"hz": 15, "min_hz": 3, "priority": 2},
+                              "posture": {"hz": 10, "min_hz": 2, "priority": 1}},
+                             latency_budget=budget, capacity=capacity, alpha=1.0)
+
+
+def test_unmeasured_tasks_run_at_target():
+    s = make()
+    s.rebalance(100.0)
+    assert s.tasks["tilt"].allowed_hz == 15
+    assert s.tasks["posture"].allowed_hz == 10
+
+
+def test_worker_speed_caps_allowed_hz():
+    s = make(capacity=10.0)
+    s.record("tilt", 0.1)  # tối đa 10 Hz
+    s.rebalance(100.0)
+    assert s.tasks["tilt"].allowed_hz == pytest.approx(10.0)
+
+
+def test_overload_lowers_low_priority_to_min_first():
+    s = make(capacity=0.6, budget=1.0)
+    s.record("tilt", 0.03)
+    s.record("posture", 0.05)
+    s.rebalance(100.0)
+    # min: 3*0.03 + 2*0.05 = 0.19; tilt lên đủ 15 Hz (thêm 0.36), posture chỉ còn phần dư
+    assert s.tasks["tilt"].allowed_hz == pytest.approx(15.0)
+    assert s.tasks["posture"].allowed_hz == pytest.approx(2 + (10 - 2) * 0.05 / 0.4)
+    assert s.tasks["posture"].allowed_hz < 10
+
+
+def test_capacity_aimd():
+    s = make(capacity=1.0, budget=0.05)
+    s.record("tilt", 0.08)  # priority cao nhất vượt budget -> giảm nhân
+    s.rebalance(100.0)
+    assert s.capacity == pytest.approx(0.8)
+    s.rebalance(100.5)  # chưa tới rebalance_every: không đổi
+    assert s.capacity == pytest.approx(0.8)
+    s.record("tilt", 0.01)  # trong budget -> tăng cộng, không vượt capacity ban đầu
+    for i in range(1, 5): s.rebalance(100.0 + i)
+    assert s.capacity == pytest.approx(1.0)
+
+
+def test_capacity_floor():
+    s = make(capacity=0.3, budget=0.01)
+    s.record("tilt", 0.5)
+    for i in range(20): s.rebalance(100.0 + i)
+    assert s.capacity == pytest.approx(0.25)
+
+
+def test_due_times_do_not_drift():
+    s = make()
+    s.tasks["tilt"].allowed_hz = 10.0
+    s.tasks["tilt"].next_due = 100.0
+    assert s.should_run("tilt", 100.02)
+    s.started("tilt", 100.02)
+    assert s.tasks["tilt"].next_due == pytest.approx(100.1)  # từ hạn cũ, không từ lúc chạy
+    assert not s.should_run("tilt", 100.05)
+    s.skipped("tilt", 100.1)
+    assert s.tasks["tilt"].next_due == pytest.approx(100.2)
+    s.started("tilt", 101.0)  # trễ quá một chu kỳ: đặt lại từ bây giờ
+    assert s.tasks["tilt"].next_due == pytest.approx(101.1)
+
+
+def test_report_counts_runs_in_window():
+    s = make()
+    for i in range(6): s.started("tilt", 100.0 + i * 0.5)
+    s.record("tilt", 0.02)
+    s.rebalance(102.6)
+    det = s.report()["detectors"]["tilt"]
+    assert det["hz"] == pytest.approx(4 / 2.0)  # 101.0 .. 102.5 trong cửa sổ 2 giây
+    assert det["cost_ms"] == 20.0
+    assert s.report()["detectors"]["posture"]["cost_ms"] is None
+
+
+def test_unknown_task_is_ignored():
+    s = make()
+    assert not s.should_run("gaze", 100.0)
+    s.started("gaze", 100.0)
+    s.record("gaze", 0.1)
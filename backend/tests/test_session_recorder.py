@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+
+from session_recorder import SessionRecorder, RecordingReader, INDEX_DTYPE
+
+OFFSETS = [0.0, 0.5, 1.2, 3.7, 4.1]  # giây 2 không có frame nào
+
+
+@pytest.fixture
+def session(tmp_path):
+    rec = SessionRecorder(str(tmp_path), cams=("cam1",), segment_seconds=2.0, max_fps=0)
+    for i, dt in enumerate(OFFSETS):
+        assert rec.record("cam1", np.full((48, 64, 3), 40 * i, np.uint8), 10 + i, rec.start + dt)
+    rec.close()
+    return tmp_path, rec.start
+
+
+def test_seek_by_time(session):
+    path, start = session
+    reader = RecordingReader(str(path))
+    assert reader.start == start and reader.cams == ["cam1"]
+    assert len(reader.index("cam1")) == len(OFFSETS)
+    assert reader.seconds("cam1").tolist() == [0, 2, 3, 3, 4]
+    assert reader.seek("cam1", 0.0) == 0
+    assert reader.seek("cam1", -5.0) == 0
+    assert reader.seek("cam1", 0.6) == 2
+    assert reader.seek("cam1", 1.0) == 2
+    assert reader.seek("cam1", 2.5) == 3  # giây trống: nhảy tới frame kế tiếp
+    assert reader.seek("cam1", 4.0) == 4
+    assert reader.seek("cam1", 100.0) == 4
+    assert reader.duration("cam1") == pytest.approx(4.1)
+
+
+def test_seek_frame(session):
+    reader = RecordingReader(str(session[0]))
+    assert reader.seek_frame("cam1", 12) == 2
+    assert reader.seek_frame("cam1", 5) == 0
+    assert reader.seek_frame("cam1", 100) == 4
+
+
+def test_read_across_segments(session):
+    path, start = session
+    reader = RecordingReader(str(path))
+    assert reader.index("cam1")["segment"].tolist() == [0, 0, 0, 1, 2]
+    data, ts, frame_idx = reader.read("cam1", 3)
+    assert ts == pytest.approx(start + 3.7) and frame_idx == 13
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert img.shape == (48, 64, 3) and abs(int(img.mean()) - 120) <= 2
+
+
+def test_partial_index_record_is_ignored(session):
+    path, _ = session
+    with open(path / "cam1.idx", "ab") as f:
+        f.write(b"\0" * (INDEX_DTYPE.itemsize - 1))  # bản ghi đang ghi dở
+    reader = RecordingReader(str(path))
+    assert len(reader.index("cam1")) == len(OFFSETS)
+    assert reader.index("cam2").size == 0 and reader.seek("cam2", 1.0) == 0
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from shm_ring import ShmRing
+
+
+@pytest.fixture
+def ring():
+    r = ShmRing.create(3, (2, 4, 3))
+    yield r
+    r.close()
+    r.unlink()
+
+
+def frame(v):
+    return np.full((2, 4, 3), v, np.uint8)
+
+
+def test_empty_ring_has_nothing(ring):
+    assert ring.latest_seq == -1
+    assert ring.read_latest() is None
+    assert ring.read_bytes() is None
+
+
+def test_read_latest_returns_copy_once(ring):
+    assert ring.write(frame(1), 10.0) == 0
+    assert ring.write(frame(2), 11.0) == 1
+    seq, ts, data = ring.read_latest()
+    assert (seq, ts) == (1, 11.0)
+    assert (data == 2).all()
+    ring.write(frame(3), 12.0)
+    assert (data == 2).all()  # bản copy, không phải view của ô
+    assert ring.read_latest(2) is None
+    assert ring.read_latest(1)[0] == 2
+
+
+def test_wraparound_keeps_latest(ring):
+    for i in range(7): ring.write(frame(i), float(i))
+    seq, ts, data = ring.read_latest()
+    assert seq == 6 and ts == 6.0 and (data == 6).all()
+    assert ring._header["seq"].tolist() == [6, 4, 5]
+
+
+def test_explicit_seq_jumps_but_never_goes_back(ring):
+    assert ring.write(frame(1), 1.0, seq=10) == 10
+    assert ring.read_latest()[0] == 10
+    # seq cũ / trùng bị đẩy lên sau seq mới nhất: người đọc không bỏ sót frame
+    assert ring.write(frame(2), 2.0, seq=5) == 11
+    assert ring.write(frame(3), 3.0) == 12
+
+
+def test_slot_being_written_is_skipped(ring):
+    ring.write(frame(1), 1.0)
+    seq = ring.latest_seq
+    ring._header["seq"][seq % ring.slots] = -1  # người ghi đang chép vào ô này
+    assert ring.read_latest() is None
+
+
+def test_out_buffer(ring):
+    ring.write(frame(9), 1.0)
+    out = np.zeros((2, 4, 3), np.uint8)
+    seq, _, data = ring.read_latest(out=out)
+    assert data is out and (out == 9).all()
+
+
+def test_bytes_roundtrip_and_oversize():
+    r = ShmRing.create(2, (16,))
+    try:
+        assert r.write_bytes(b"hello", 1.0) == 0
+        assert r.read_bytes() == (0, 1.0, b"hello")
+        assert r.write_bytes(b"x" * 17, 2.0) == -1
+        assert r.latest_seq == 0
+        r.write_bytes(b"", 3.0)
+        assert r.read_bytes(0) == (1, 3.0, b"")
+    finally:
+        r.close()
+        r.unlink()
+
+
+def test_attach_by_spec_sees_writes(ring):
+    other = ShmRing(*ring.spec())
+    try:
+        ring.write(frame(5), 4.0, seq=3)
+        seq, ts, data = other.read_latest()
+        assert (seq, ts) == (3, 4.0) and (data == 5).all()
+        assert other.slot_shape == ring.slot_shape
+    finally:
+        other.close()
+
+
+def test_unlink_twice_is_safe():
+    r = ShmRing.create(1, (4,))
+    r.close()
+    r.unlink()
+    r.unlink()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import telemetry
+from telemetry import TelemetryPublisher, check_rate, is_status
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+        self.publisher = None
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def sleep(self, seconds):
+        self.publisher.stop()  # một vòng _run
+
+    def start_background_task(self, fn):
+        pass
+
+
+@pytest.fixture
+def pub():
+    sio = FakeSocketIO()
+    sio.publisher = TelemetryPublisher(sio, rate_hz=15.0, status_hz=1.0)
+    return sio.publisher
+
+
+def test_delta_sends_only_changed_channels(pub):
+    pub.publish({"tilt": {"label": "a"}, "gaze": {"label": "c"}})
+    assert pub._delta(100.0) == {"tilt": {"label": "a"}, "gaze": {"label": "c"}}
+    assert pub._delta(100.1) == {}
+    pub.publish({"tilt": {"label": "b"}, "gaze": {"label": "c"}})
+    assert pub._delta(100.2) == {"tilt": {"label": "b"}}
+
+
+def test_status_channels_are_rate_limited(pub):
+    pub.publish({"tilt": 1, "status": {"sched": 1}, "pipe:a:status": {"fps": 30}})
+    assert set(pub._delta(100.0)) == {"tilt", "status", "pipe:a:status"}
+    pub.publish({"tilt": 2, "status": {"sched": 2}, "pipe:a:status": {"fps": 29}})
+    assert pub._delta(100.5) == {"tilt": 2}
+    assert pub._delta(101.0) == {"status": {"sched": 2}, "pipe:a:status": {"fps": 29}}
+    assert pub._delta(102.5) == {}
+
+
+def test_is_status():
+    assert is_status("status") and is_status("pipe:desk1:status")
+    assert not is_status("tilt") and not is_status("pipe:status_cam")
+
+
+@pytest.mark.parametrize("bad", [0, -1, "x", None, float("inf"), float("nan")])
+def test_check_rate_rejects_non_positive(bad, pub):
+    with pytest.raises((TypeError, ValueError)):
+        pub.set_rate(bad)
+    assert pub.rate_hz == 15.0
+
+
+def test_check_rate_accepts_numbers():
+    assert check_rate("30") == 30.0 and check_rate(0.5) == 0.5
+
+
+def test_rooms_filter_channels(pub):
+    room_all = pub.subscribe()
+    room_tilt = pub.subscribe(["tilt"])
+    assert pub.subscribe(["tilt"]) == room_tilt and pub.rooms[room_tilt][2] == 2
+    pub.publish({"tilt": 1, "gaze": 2})
+    pub._running = True
+    pub._run()
+    sent = {to: data for _, data, to in pub.socketio.emitted}
+    assert sent == {room_all: {"tilt": 1, "gaze": 2}, room_tilt: {"tilt": 1}}
+    pub.unsubscribe(room_tilt)
+    pub.unsubscribe(room_tilt)
+    assert room_tilt not in pub.rooms
+
+
+@pytest.mark.skipif(telemetry.msgpack is None, reason="msgpack not installed")
+def test_binary_packs_points_as_float32():
+    data = telemetry.msgpack.unpackb(telemetry.pack_binary(
+        {"tilt": {"label": "a", "keypoints": [(1.0, 2.0), (3.0, 4.0)]},
+         "gaze": {"label": "c", "eyes": [{"rel": (5, 6)}]}}), raw=False)
+    assert np.frombuffer(data["tilt"]["keypoints"], np.float32).tolist() == [1, 2, 3, 4]
+    assert np.frombuffer(data["gaze"]["eyes"], np.float32).tolist() == [5, 6]
+    assert data["tilt"]["label"] == "a"
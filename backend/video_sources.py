@@ -1,4 +1,10 @@
+import time
+import urllib.request
 import cv2
+import numpy as np
+
+from native_threads import threading
+from metrics import REGISTRY
 
 class BaseVideoSource:
     def read(self): raise NotImplementedError
@@ -38,4 +44,256 @@ class IPCameraSource(BaseVideoSource):
     def release(self):
         if self.cap:
             self.cap.release()
-            self.cap = None
\ No newline at end of file
+            self.cap = None
+
+class VideoFileSource(BaseVideoSource):
+    """Phát lại file video đã ghi như một camera (benchmark / tái hiện phiên).
+
+    `realtime=True` giữ đúng fps của file; `loop=True` quay lại đầu khi hết file.
+    """
+
+    def __init__(self, path: str, loop: bool = True, realtime: bool = True):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(str(path))
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.interval = 1.0 / fps if realtime and fps > 0 else 0.0
+        self._next = time.time()
+
+    def read(self):
+        if not self.cap: return False, None
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if self.interval:
+            self._next = max(self._next + self.interval, time.time() - self.interval)
+            wait = self._next - time.time()
+            if wait > 0: time.sleep(wait)
+        return ret, frame
+
+    def is_opened(self) -> bool:
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+
+class SyntheticSource(BaseVideoSource):
+    """Camera giả: nền gradient cố định + một khối chuyển động, đúng `fps` frame/giây"""
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 30.0):
+        self.width, self.height = int(width), int(height)
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        ramp = np.linspace(0, 255, self.width, dtype=np.uint8)
+        self.background = np.dstack([np.tile(ramp, (self.height, 1))] * 3)
+        self.count = 0
+        self._next = time.time()
+        self._open = True
+
+    def read(self):
+        if not self._open: return False, None
+        if self.interval:
+            self._next = max(self._next + self.interval, time.time() - self.interval)
+            wait = self._next - time.time()
+            if wait > 0: time.sleep(wait)
+        frame = self.background.copy()
+        size = self.height // 4
+        x = (self.count * 8) % max(1, self.width - size)
+        y = (self.height - size) // 2
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (40, 200, 255), -1)
+        cv2.putText(frame, str(self.count), (10, self.height - 20), cv2.FONT_HERSHEY_SIMPLEX, 1.0,
+                    (255, 255, 255), 2)
+        self.count += 1
+        return True, frame
+
+    def is_opened(self) -> bool:
+        return self._open
+
+    def release(self):
+        self._open = False
+
+class MjpegHttpSource(BaseVideoSource):
+    """Camera IP phát MJPEG qua HTTP (multipart/x-mixed-replace).
+
+    Tự tách ảnh theo marker SOI/EOI và decode cho detector, đồng thời giữ bytes JPEG
+    gốc (`last_jpeg`) để stream không overlay chuyển thẳng cho client, không encode lại.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.buf = b""
+        self.last_jpeg = None
+        try:
+            self.resp = urllib.request.urlopen(str(url), timeout=timeout)
+        except (OSError, ValueError) as e:
+            print(f"MJPEG source error ({url}): {e}")
+            self.resp = None
+
+    def read(self):
+        if not self.resp: return False, None
+        while True:
+            start = self.buf.find(b"\xff\xd8")
+            end = self.buf.find(b"\xff\xd9", start + 2) if start >= 0 else -1
+            if end >= 0: break
+            # Bỏ header multipart / rác trước SOI để buffer không phình
+            self.buf = self.buf[start:] if start >= 0 else self.buf[-1:]
+            try:
+                chunk = self.resp.read1(65536)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                self.release()
+                return False, None
+            self.buf += chunk
+        jpeg, self.buf = self.buf[start:end + 2], self.buf[end + 2:]
+        frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None: return False, None
+        self.last_jpeg = jpeg
+        return True, frame
+
+    def is_opened(self) -> bool:
+        return self.resp is not None
+
+    def release(self):
+        if self.resp:
+            self.resp.close()
+            self.resp = None
+
+def source_factory(c_type: str, c_val, width: int = 1280, height: int = 720):
+    """Hàm tạo source theo loại camera trong config UI: Webcam / Video / Synthetic / MJPEG / IP"""
+    if c_type == "Webcam":
+        try:
+            idx = int(c_val)
+        except (TypeError, ValueError):
+            idx = 0
+        return lambda: WebcamSource(idx, width, height)
+    if c_type == "Video":
+        return lambda: VideoFileSource(c_val)
+    if c_type == "Synthetic":
+        w, _, h = str(c_val or "").partition("x")
+        size = (int(w), int(h)) if w.isdigit() and h.isdigit() else (width, height)
+        return lambda: SyntheticSource(*size)
+    if c_type == "MJPEG":
+        return lambda: MjpegHttpSource(c_val)
+    return lambda: IPCameraSource(c_val)
+
+
+# Nguồn cục bộ: mất là mất hẳn, không tự kết nối lại
+LOCAL_SOURCES = ("Webcam", "Video", "Synthetic")
+
+
+class ThreadedSource(BaseVideoSource):
+    """Đọc camera trên thread riêng, chỉ giữ frame mới nhất (single-slot buffer).
+
+    `factory` tạo ra source thật (WebcamSource/IPCameraSource); khi stream chết
+    và `reconnect=True`, source được tạo lại với backoff tăng dần.
+    """
+
+    def __init__(self, factory, name: str = "cam", reconnect: bool = False,
+                 backoff_min: float = 0.5, backoff_max: float = 10.0, max_failures: int = 30):
+        self.factory = factory
+        self.name = name
+        self.reconnect = reconnect
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.max_failures = max_failures
+
+        self.src = factory()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        # Slot duy nhất: frame mới nhất + số thứ tự + thời điểm chụp
+        self._frame = None
+        self._jpeg = None  # bytes JPEG gốc của frame mới nhất (chỉ có với MjpegHttpSource)
+        self._seq = 0
+        self._ts = 0.0
+        self._consumed_seq = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+        self.thread = threading.Thread(target=self._reader, name=f"capture-{name}", daemon=True)
+        self.thread.start()
+
+    def _reader(self):
+        try:
+            self._read_loop()
+        finally:
+            # Chỉ thread đọc được giải phóng src: release() có thể trả về khi thread còn kẹt trong read()
+            if self.src: self.src.release()
+            self.src = None
+
+    def _read_loop(self):
+        failures = 0
+        backoff = self.backoff_min
+        while not self.stop_event.is_set():
+            if self.src is None or not self.src.is_opened():
+                if not self.reconnect:
+                    break
+                self._reopen(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+
+            t0 = time.perf_counter()
+            ret, frame = self.src.read()
+            if not ret or frame is None:
+                failures += 1
+                if failures >= self.max_failures:
+                    print(f"[{self.name}] Stream lost after {failures} failed reads")
+                    self.src.release()
+                    failures = 0
+                else:
+                    time.sleep(0.01)
+                continue
+
+            failures = 0
+            backoff = self.backoff_min
+            REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage="capture", target=self.name)
+            with self.lock:
+                # Frame cũ chưa ai lấy -> bỏ (stale)
+                if self._seq > self._consumed_seq:
+                    self.dropped += 1
+                    REGISTRY.inc("frames_dropped_total", cam=self.name)
+                self._frame = frame
+                self._jpeg = getattr(self.src, "last_jpeg", None)
+                self._seq += 1
+                self._ts = time.time()
+
+    def _reopen(self, delay):
+        if self.src: self.src.release()
+        self.src = None
+        print(f"[{self.name}] Reconnecting in {delay:.1f}s...")
+        if self.stop_event.wait(delay): return
+        try:
+            self.src = self.factory()
+            self.reconnects += 1
+        except Exception as e:
+            print(f"[{self.name}] Reconnect failed: {e}")
+
+    def read_latest(self, after_seq: int = -1):
+        """Trả về (frame, seq, timestamp); frame là None nếu chưa có frame mới hơn `after_seq`"""
+        with self.lock:
+            if self._frame is None or self._seq <= after_seq:
+                return None, self._seq, self._ts
+            self._consumed_seq = self._seq
+            return self._frame, self._seq, self._ts
+
+    def jpeg_for(self, seq: int):
+        """JPEG gốc của frame `seq` nếu camera gửi sẵn JPEG và frame đó vẫn là frame mới nhất"""
+        with self.lock:
+            return self._jpeg if self._seq == seq else None
+
+    def read(self):
+        frame, _, _ = self.read_latest()
+        return frame is not None, frame
+
+    def is_opened(self) -> bool:
+        if self.stop_event.is_set(): return False
+        if self.reconnect: return True
+        return self.thread.is_alive() or self._frame is not None
+
+    def release(self):
+        self.stop_event.set()
+        if self.thread.is_alive(): self.thread.join(timeout=2.0)
+        if self.thread.is_alive():
+            print(f"[{self.name}] Capture thread still blocked in read(); source will be released when it exits")
@@ -6,9 +6,10 @@ import { Activity, History } from 'lucide-react';
 interface BiopacChartProps {
   data: BiopacDataPoint[];
   mode?: AppMode;
+  info?: string;  // kênh + tần số lấy mẫu khi có nguồn BIOPAC thật
 }
 
-export const BiopacChart: React.FC<BiopacChartProps> = ({ data, mode = AppMode.LIVE }) => {
+export const BiopacChart: React.FC<BiopacChartProps> = ({ data, mode = AppMode.LIVE, info }) => {
   const isLive = mode === AppMode.LIVE;
 
   return (
@@ -21,7 +22,7 @@ export const BiopacChart: React.FC<BiopacChartProps> = ({ data, mode = AppMode.L
             </h3>
         </div>
         <span className="text-xs text-slate-500 font-mono">
-            {isLive ? 'Live Stream: 100Hz' : 'Playback View'}
+            {isLive ? `Live Stream${info ? `: ${info}` : ''}` : 'Playback View'}
         </span>
       </div>
       
@@ -36,7 +37,7 @@ export const BiopacChart: React.FC<BiopacChartProps> = ({ data, mode = AppMode.L
                 type="number"
             />
             <YAxis 
-                domain={[-10, 10]} 
+                domain={info ? ['auto', 'auto'] : [-10, 10]} 
                 hide={false} 
                 stroke="#64748b"
                 tick={{fontSize: 10}}
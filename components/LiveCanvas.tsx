@@ -0,0 +1,158 @@
+import React, { useEffect, useRef } from 'react';
+import { OverlayFrame } from '../types';
+
+interface LiveCanvasProps {
+  url: string; // MJPEG không overlay (?overlay=0), mỗi part có Content-Length, X-Frame-Seq, X-Source-Width
+  cam: 1 | 2;
+  history: React.MutableRefObject<OverlayFrame[]>;
+  className?: string;
+}
+
+const HEADER_END = [13, 10, 13, 10]; // \r\n\r\n
+
+const indexOf = (buf: Uint8Array, pattern: number[], from = 0) => {
+  for (let i = from; i <= buf.length - pattern.length; i++) {
+    let ok = true;
+    for (let j = 0; j < pattern.length; j++) {
+      if (buf[i + j] !== pattern[j]) { ok = false; break; }
+    }
+    if (ok) return i;
+  }
+  return -1;
+};
+
+// Kết quả mới nhất được sinh từ frame <= seq đang hiển thị (kết quả của frame sau chưa được vẽ lên frame trước)
+const matchOverlay = (history: OverlayFrame[], cam: 1 | 2, seq: number): OverlayFrame | undefined => {
+  for (let i = history.length - 1; i >= 0; i--) {
+    const s = history[i].seq;
+    const resultSeq = cam === 1 ? Math.max(s.tilt ?? -1, s.gaze ?? -1) : (s.posture ?? -1);
+    if (resultSeq <= seq) return history[i];
+  }
+  return history[0];
+};
+
+// Giống draw_tilt_gaze / draw_posture của backend; toạ độ kết quả theo frame gốc nên scale về ảnh đã thu nhỏ
+const drawOverlay = (ctx: CanvasRenderingContext2D, cam: 1 | 2, o: OverlayFrame | undefined, scale: number) => {
+  if (!o) return;
+  ctx.save();
+  ctx.scale(scale, scale);
+  ctx.lineWidth = 2;
+  ctx.font = 'bold 22px sans-serif';
+  if (cam === 1) {
+    const t = o.tilt || {};
+    if (t.label) {
+      ctx.fillStyle = '#00ff00';
+      ctx.fillText(`T: ${t.label}`, 10, 30);
+      ctx.fillStyle = '#ffff00';
+      for (const [x, y] of (t.keypoints || [])) {
+        ctx.beginPath(); ctx.arc(x, y, 4, 0, 2 * Math.PI); ctx.fill();
+      }
+    }
+    const g = o.gaze || {};
+    if (g.label) {
+      ctx.fillStyle = String(g.label).includes('CENTER') ? '#00ff00' : '#ff0000';
+      ctx.fillText(`G: ${g.label}`, 10, 60);
+      ctx.strokeStyle = '#00ff00';
+      ctx.lineWidth = 1;
+      for (const eye of (g.eyes || [])) {
+        ctx.beginPath(); ctx.arc(eye.rel[0], eye.rel[1], 3, 0, 2 * Math.PI); ctx.stroke();
+      }
+    }
+  } else {
+    const p = o.posture || {};
+    if (p.label && p.bbox) {
+      const [x, y, w, h] = p.bbox;
+      const lbl = String(p.label).toLowerCase();
+      const c = lbl.includes('bad') || lbl.includes('wrong') ? '#ff3232' : '#32ff32';
+      ctx.strokeStyle = c;
+      ctx.fillStyle = c;
+      ctx.strokeRect(x - w / 2, y - h / 2, w, h);
+      ctx.fillText(`P: ${p.label}`, x - w / 2, y - h / 2 - 10);
+    }
+  }
+  ctx.restore();
+};
+
+export const LiveCanvas: React.FC<LiveCanvasProps> = ({ url, cam, history, className }) => {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+
+  useEffect(() => {
+    let stopped = false;
+    let controller: AbortController | null = null;
+    let retry: ReturnType<typeof setTimeout> | null = null;
+    let decoding = false;
+    let pending: { jpeg: Uint8Array; seq: number; width: number } | null = null;
+
+    // Chỉ decode frame mới nhất; frame đến trong lúc đang decode thì thay nhau, không xếp hàng
+    const show = async () => {
+      if (decoding || !pending) return;
+      decoding = true;
+      const { jpeg, seq, width } = pending;
+      pending = null;
+      try {
+        const bitmap = await createImageBitmap(new Blob([jpeg], { type: 'image/jpeg' }));
+        const canvas = canvasRef.current;
+        const ctx = canvas?.getContext('2d');
+        if (canvas && ctx && !stopped) {
+          if (canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+            canvas.width = bitmap.width;
+            canvas.height = bitmap.height;
+          }
+          ctx.drawImage(bitmap, 0, 0);
+          drawOverlay(ctx, cam, matchOverlay(history.current, cam, seq), width ? bitmap.width / width : 1);
+        }
+        bitmap.close();
+      } catch (e) {
+        // Ảnh hỏng: bỏ qua frame này
+      }
+      decoding = false;
+      show();
+    };
+
+    const connect = async () => {
+      controller = new AbortController();
+      let buf = new Uint8Array(0);
+      try {
+        const res = await fetch(url, { signal: controller.signal });
+        const reader = res.body!.getReader();
+        while (!stopped) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          const merged = new Uint8Array(buf.length + value.length);
+          merged.set(buf);
+          merged.set(value, buf.length);
+          buf = merged;
+          // Tách từng part: header (có Content-Length, X-Frame-Seq) rồi đúng Content-Length byte ảnh
+          while (true) {
+            const end = indexOf(buf, HEADER_END);
+            if (end < 0) break;
+            const header = new TextDecoder().decode(buf.subarray(0, end));
+            const len = Number(/Content-Length:\s*(\d+)/i.exec(header)?.[1] ?? -1);
+            if (len < 0) { buf = buf.slice(end + 4); continue; }
+            if (buf.length < end + 4 + len) break;
+            pending = {
+              jpeg: buf.slice(end + 4, end + 4 + len),
+              seq: Number(/X-Frame-Seq:\s*(\d+)/i.exec(header)?.[1] ?? 0),
+              width: Number(/X-Source-Width:\s*(\d+)/i.exec(header)?.[1] ?? 0),
+            };
+            buf = buf.slice(end + 4 + len);
+            show();
+          }
+        }
+      } catch (e) {
+        // Mất kết nối / abort
+      }
+      // Tránh reload liên tục khi server tắt
+      if (!stopped) retry = setTimeout(connect, 2000);
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      if (retry) clearTimeout(retry);
+      controller?.abort();
+    };
+  }, [url, cam, history]);
+
+  return <canvas ref={canvasRef} className={className} />;
+};
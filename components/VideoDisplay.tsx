@@ -1,5 +1,6 @@
 import React, { useEffect, useRef, useState } from 'react';
-import { AppMode } from '../types';
+import { AppMode, OverlayFrame } from '../types';
+import { LiveCanvas } from './LiveCanvas';
 
 interface VideoDisplayProps {
   mode: AppMode;
@@ -10,6 +11,8 @@ interface VideoDisplayProps {
   playbackTime?: number;
   isPlaying?: boolean;
   onTimeUpdate?: (time: number) => void;
+  clientOverlay?: boolean; // stream frame gốc, vẽ overlay phía client từ telemetry
+  overlayHistory?: React.MutableRefObject<OverlayFrame[]>;
 }
 
 export const VideoDisplay: React.FC<VideoDisplayProps> = ({ 
@@ -20,13 +23,16 @@ export const VideoDisplay: React.FC<VideoDisplayProps> = ({
   playbackSrc, 
   playbackTime, 
   isPlaying, 
-  onTimeUpdate 
+  onTimeUpdate,
+  clientOverlay = false,
+  overlayHistory
 }) => {
   const playbackVideoRef = useRef<HTMLVideoElement>(null);
   
   // Use dynamic URL passed from parent
   const feed1 = `${serverUrl}/video_feed_1`;
   const feed2 = `${serverUrl}/video_feed_2`;
+  const useCanvas = clientOverlay && !!overlayHistory;
 
   // Playback Video Logic
   useEffect(() => {
@@ -66,6 +72,10 @@ export const VideoDisplay: React.FC<VideoDisplayProps> = ({
         
         {mode === AppMode.LIVE ? (
            isProcessing ? (
+             useCanvas ? (
+               <LiveCanvas url={`${feed1}?overlay=0`} cam={1} history={overlayHistory!}
+                           className="w-full h-full object-contain bg-slate-900" />
+             ) : (
              <img 
                src={feed1} 
                alt="Live Stream 1" 
@@ -83,6 +93,7 @@ export const VideoDisplay: React.FC<VideoDisplayProps> = ({
                  }
                }}
              />
+             )
            ) : (
              <div className="w-full h-full flex items-center justify-center text-slate-500 flex-col gap-2">
                  {isConnected ? (
@@ -125,6 +136,10 @@ export const VideoDisplay: React.FC<VideoDisplayProps> = ({
          <div className="w-full h-full flex items-center justify-center bg-slate-900 relative">
              {mode === AppMode.LIVE ? (
                  isProcessing ? (
+                    useCanvas ? (
+                      <LiveCanvas url={`${feed2}?overlay=0`} cam={2} history={overlayHistory!}
+                                  className="w-full h-full object-contain bg-slate-900" />
+                    ) : (
                     <img 
                        src={feed2} 
                        alt="Live Stream 2" 
@@ -140,6 +155,7 @@ export const VideoDisplay: React.FC<VideoDisplayProps> = ({
                          }
                        }}
                     />
+                    )
                  ) : (
                     <div className="text-slate-600 text-sm">
                         {isConnected ? 'Chờ tín hiệu...' : 'Không có kết nối'}
@@ -27,6 +27,14 @@ export interface GazeData {
   rightEye: EyeCoord;
 }
 
+// Kết quả detector kèm seq frame đã sinh ra nó, để vẽ overlay phía client lên đúng frame (stream ?overlay=0)
+export interface OverlayFrame {
+  seq: { tilt?: number; gaze?: number; posture?: number };
+  tilt?: any;
+  gaze?: any;
+  posture?: any;
+}
+
 export interface BiopacDataPoint {
   timestamp: number;
   value: number;